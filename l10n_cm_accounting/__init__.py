@@ -23,3 +23,6 @@ def _l10n_cm_post_init_hook(cr, registry):
                 pass
             if vals:
                 company.write(vals)
+
+    # Soldes mensuels des écritures déjà comptabilisées
+    env['account.balance.monthly']._rebuild()
@@ -1,6 +1,6 @@
 {
     'name': 'Cameroon - Accounting (SYSCOHADA)',
-    'version': '17.0.1.0.0',
+    'version': '17.0.1.1.0',
     'category': 'Accounting/Localizations/Account Charts',
     'summary': 'Cameroon Accounting Localization for SYSCOHADA standard',
     'description': '''
@@ -38,7 +38,7 @@ Features:
         'mail',
     ],
     'external_dependencies': {
-        'python': ['pandas', 'xlrd', 'xlsxwriter'],
+        'python': ['pandas', 'xlrd', 'xlsxwriter', 'openpyxl'],
     },
     'data': [
         # Security
@@ -57,6 +57,8 @@ Features:
         'views/account_move_import_views.xml',
         'views/account_asset_views.xml',
         'views/account_budget_views.xml',
+        'views/account_balance_monthly_views.xml',
+        'views/fiscal_declaration_views.xml',
         'views/account_journal_views.xml',
         'views/res_partner_views.xml',
         'views/tax_reminder_views.xml',
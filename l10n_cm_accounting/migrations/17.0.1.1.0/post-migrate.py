@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Remplir les soldes mensuels sur une base existante.
+
+    Le post_init_hook ne s'exécute qu'à l'installation: sans cette reprise, la
+    table resterait vide après mise à jour et les déclarations liraient des
+    soldes nuls.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['account.balance.monthly']._rebuild()
@@ -1,10 +1,25 @@
 # -*- coding: utf-8 -*-
+from . import account_account
+from . import account_move
+from . import account_move_import_error
+from . import account_move_import_mixin
 from . import account_move_import
+from . import account_move_import_job
+from . import account_move_import_historical
 from . import account_asset
 from . import account_budget
 from . import account_journal
 from . import res_partner
 from . import tax_reminder
 from . import cm_fiscal_year
+from . import account_balance_monthly
+from . import account_trial_balance
+from . import fiscal_declaration_cache
+from . import fiscal_declaration_mixin
+from . import fiscal_withholding_register
+from . import fiscal_declaration_annex
+from . import fiscal_declaration_vat
+from . import fiscal_declaration
+from . import fiscal_declaration_run
 
 
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""Chart of accounts extensions for Cameroon."""
+
+from odoo import models, api, tools
+
+# Champs du compte dont dépendent les montants des déclarations
+DECLARATION_ACCOUNT_FIELDS = {'code', 'company_id'}
+
+# Rôles des comptes dans les déclarations et états: rôle -> (préfixes SYSCOHADA, comptes exacts)
+ACCOUNT_ROLES = {
+    'sales': (('7',), False),
+    'expenses': (('6',), False),
+    'income_statement': (('6', '7', '8'), False),
+    'vat_collected': (('443',), False),
+    'vat_deductible': (('445',), False),
+    'vat_collected_main': (('443000',), True),
+    'vat_deductible_main': (('445000',), True),
+    'withholding': (('421',), False),
+    'result': (('13',), False),
+    'customers': (('411',), False),
+    'suppliers': (('401',), False),
+}
+
+
+class AccountAccount(models.Model):
+    _inherit = 'account.account'
+    """Per-company account sets by SYSCOHADA prefix and role, cached in the registry."""
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_account_codes(self, company_id):
+        """Codes ``{account_id: code}`` des comptes de la société"""
+        self.flush_model(['code', 'company_id'])
+        self.env.cr.execute("SELECT id, code FROM account_account WHERE company_id = %s", [company_id])
+        return tools.frozendict(self.env.cr.fetchall())
+
+    @api.model
+    @tools.ormcache('company_id', 'prefix', 'exact')
+    def _get_prefix_account_ids(self, company_id, prefix, exact=False):
+        """Comptes de la société dont le code commence par ``prefix`` (ou l'égale)"""
+        return frozenset(
+            account_id for account_id, code in self._get_account_codes(company_id).items()
+            if (code == prefix if exact else code.startswith(prefix))
+        )
+
+    @api.model
+    @tools.ormcache('company_id', 'role')
+    def _get_role_account_ids(self, company_id, role):
+        """Comptes de la société tenant le rôle ``role`` de ``ACCOUNT_ROLES``.
+
+        L'ensemble est calculé une fois par société puis conservé dans le
+        cache du registre jusqu'à la prochaine modification d'un compte: les
+        tests d'appartenance des déclarations, budgets et états sont en O(1).
+        """
+        prefixes, exact = ACCOUNT_ROLES[role]
+        return frozenset().union(*(
+            self._get_prefix_account_ids(company_id, prefix, exact) for prefix in prefixes
+        ))
+
+    def _clear_role_cache(self, company_ids):
+        # Odoo 17 n'invalide plus une méthode isolée (``ormcache.clear`` vide
+        # tous les caches): le groupe 'default', qui porte ces trois caches,
+        # est le plus étroit et son invalidation est signalée aux autres workers
+        self.env.registry.clear_cache('default')
+        self.env['fiscal.declaration.cache']._invalidate_companies(company_ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        accounts = super().create(vals_list)
+        self._clear_role_cache(accounts.company_id.ids)
+        return accounts
+
+    def write(self, vals):
+        if not DECLARATION_ACCOUNT_FIELDS.intersection(vals):
+            return super().write(vals)
+        companies = self.company_id
+        res = super().write(vals)
+        self._clear_role_cache((companies | self.company_id).ids)
+        return res
+
+    def unlink(self):
+        companies = self.company_id
+        res = super().unlink()
+        self._clear_role_cache(companies.ids)
+        return res
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""Monthly account balances maintained incrementally from posted entries."""
+
+from odoo import models, fields, api, _
+from odoo.tools.sql import create_unique_index
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Champs des lignes lus par LINE_SOURCE, enregistrés avant chaque mise à jour
+LINE_SOURCE_FIELDS = [
+    'move_id', 'company_id', 'account_id', 'partner_id', 'analytic_distribution',
+    'date', 'debit', 'credit', 'balance', 'display_type',
+]
+
+# Lignes d'écritures agrégées: une ligne de total (analytique vide) par ligne
+# comptable, plus une ligne par compte analytique de sa répartition, pour la
+# part correspondante. ``{where}`` filtre les lignes de ``account_move_line``.
+LINE_SOURCE = """
+    SELECT line.company_id, line.account_id, line.partner_id, NULL::integer AS analytic_account_id,
+           date_trunc('month', line.date)::date AS month,
+           line.debit, line.credit, line.balance
+      FROM account_move_line line
+     WHERE {where}
+       AND line.account_id IS NOT NULL
+       AND COALESCE(line.display_type, 'product') NOT IN ('line_section', 'line_note')
+    UNION ALL
+    SELECT line.company_id, line.account_id, line.partner_id, analytic.id::integer,
+           date_trunc('month', line.date)::date,
+           line.debit * distribution.value::numeric / 100,
+           line.credit * distribution.value::numeric / 100,
+           line.balance * distribution.value::numeric / 100
+      FROM account_move_line line
+CROSS JOIN LATERAL jsonb_each_text(line.analytic_distribution) AS distribution(key, value)
+CROSS JOIN LATERAL unnest(string_to_array(distribution.key, ',')) AS analytic(id)
+     WHERE {where}
+       AND line.account_id IS NOT NULL
+       AND line.analytic_distribution IS NOT NULL
+       AND COALESCE(line.display_type, 'product') NOT IN ('line_section', 'line_note')
+"""
+
+
+class AccountBalanceMonthly(models.Model):
+    _name = 'account.balance.monthly'
+    """Posted debit/credit per company, account, partner, analytic account and month."""
+    _description = "Soldes mensuels des comptes"
+    _order = 'month desc, account_id'
+    _rec_name = 'account_id'
+
+    company_id = fields.Many2one('res.company', string="Société", required=True, readonly=True, index=True)
+    account_id = fields.Many2one('account.account', string="Compte", required=True, readonly=True, index=True)
+    partner_id = fields.Many2one('res.partner', string="Partenaire", readonly=True)
+    analytic_account_id = fields.Many2one('account.analytic.account', string="Compte analytique", readonly=True,
+                                          help="Vide: total du compte; renseigné: part affectée à ce compte analytique")
+    month = fields.Date(string="Mois", required=True, readonly=True, index=True)
+    debit = fields.Monetary(string="Débit", readonly=True, currency_field='currency_id')
+    credit = fields.Monetary(string="Crédit", readonly=True, currency_field='currency_id')
+    balance = fields.Monetary(string="Solde", readonly=True, currency_field='currency_id')
+    currency_id = fields.Many2one('res.currency', related='company_id.currency_id')
+
+    def init(self):
+        super().init()
+        create_unique_index(
+            self.env.cr,
+            'account_balance_monthly_key_uniq',
+            self._table,
+            ['company_id', 'account_id', 'COALESCE(partner_id, 0)', 'COALESCE(analytic_account_id, 0)', 'month'],
+        )
+
+    @api.model
+    def _apply_moves(self, move_ids, sign):
+        """Ajouter (``sign=1``) ou retirer (``sign=-1``) la contribution d'écritures.
+
+        Lit l'état courant des lignes en base, après avoir enregistré les
+        seuls champs des lignes lus par ``LINE_SOURCE``.
+        """
+        if not move_ids:
+            return
+        self._apply_source('line.move_id IN %(ids)s', move_ids, sign)
+        self.env.cr.execute("""
+            UPDATE account_move SET balance_summary_applied = %s WHERE id IN %s
+        """, [sign > 0, tuple(move_ids)])
+        self.env['account.move'].browse(move_ids).invalidate_recordset(['balance_summary_applied'])
+        self.env['fiscal.declaration.cache']._invalidate_moves(move_ids)
+
+    @api.model
+    def _apply_lines(self, lines, sign):
+        """Ajouter ou retirer la contribution de lignes d'écritures déjà comptées"""
+        if not lines:
+            return
+        self._apply_source('line.id IN %(ids)s', lines.ids, sign)
+        self.env['fiscal.declaration.cache']._invalidate_moves(lines.move_id.ids)
+
+    @api.model
+    def _apply_source(self, where, ids, sign):
+        self.env['account.move.line'].flush_model(LINE_SOURCE_FIELDS)
+        self.env['account.move'].flush_model(['company_id', 'date'])
+        self.env.cr.execute(f"""
+            INSERT INTO account_balance_monthly AS summary (
+                company_id, account_id, partner_id, analytic_account_id, month, debit, credit, balance,
+                create_uid, write_uid, create_date, write_date
+            )
+            SELECT company_id, account_id, partner_id, analytic_account_id, month,
+                   %(sign)s * SUM(debit), %(sign)s * SUM(credit), %(sign)s * SUM(balance),
+                   %(uid)s, %(uid)s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM ({LINE_SOURCE.format(where=where)}) AS source
+          GROUP BY company_id, account_id, partner_id, analytic_account_id, month
+                ON CONFLICT (company_id, account_id, COALESCE(partner_id, 0), COALESCE(analytic_account_id, 0), month)
+                DO UPDATE SET debit = summary.debit + EXCLUDED.debit,
+                              credit = summary.credit + EXCLUDED.credit,
+                              balance = summary.balance + EXCLUDED.balance,
+                              write_date = EXCLUDED.write_date
+        """, {'ids': tuple(ids), 'sign': sign, 'uid': self.env.uid})
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild(self, companies=None):
+        """Reconstruire entièrement la table à partir des écritures comptabilisées"""
+        companies = companies or self.env['res.company'].search([])
+        self.env.flush_all()
+        params = {'company_ids': tuple(companies.ids), 'uid': self.env.uid}
+        self.env.cr.execute("DELETE FROM account_balance_monthly WHERE company_id IN %(company_ids)s", params)
+        where = "line.parent_state = 'posted' AND line.company_id IN %(company_ids)s"
+        self.env.cr.execute(f"""
+            INSERT INTO account_balance_monthly (
+                company_id, account_id, partner_id, analytic_account_id, month, debit, credit, balance,
+                create_uid, write_uid, create_date, write_date
+            )
+            SELECT company_id, account_id, partner_id, analytic_account_id, month,
+                   SUM(debit), SUM(credit), SUM(balance),
+                   %(uid)s, %(uid)s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM ({LINE_SOURCE.format(where=where)}) AS source
+          GROUP BY company_id, account_id, partner_id, analytic_account_id, month
+        """, params)
+        row_count = self.env.cr.rowcount
+        self.env.cr.execute("""
+            UPDATE account_move
+               SET balance_summary_applied = (state = 'posted')
+             WHERE company_id IN %(company_ids)s
+        """, params)
+        self.env['account.move'].invalidate_model(['balance_summary_applied'])
+        self.invalidate_model()
+        self.env['fiscal.declaration.cache']._invalidate_companies(companies.ids)
+        _logger.info("Soldes mensuels reconstruits: %d lignes pour %d sociétés", row_count, len(companies))
+        return row_count
+
+    def action_rebuild(self):
+        """Reconstruire les soldes mensuels des sociétés de l'utilisateur"""
+        row_count = self._rebuild(self.env.companies)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Soldes mensuels reconstruits: %d lignes") % row_count,
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    @api.model
+    def _get_account_totals(self, company, date_from, date_to, account_ids=None, analytic_account_id=None):
+        """Totaux comptabilisés ``{account_id: (débit, crédit, solde)}`` d'une période.
+
+        Une période en mois entiers est lue dans la table des soldes mensuels;
+        sinon les lignes d'écritures de la période sont agrégées directement.
+        Sans ``analytic_account_id`` les montants sont les totaux des comptes,
+        avec lui la part affectée à ce compte analytique.
+        """
+        params = {
+            'company_id': company.id,
+            'date_from': date_from,
+            'date_to': date_to,
+            'account_ids': tuple(account_ids or [0]),
+            'analytic_account_id': analytic_account_id,
+        }
+        conditions = ["analytic_account_id IS NULL" if not analytic_account_id
+                      else "analytic_account_id = %(analytic_account_id)s"]
+        if account_ids is not None:
+            conditions.append("account_id IN %(account_ids)s")
+
+        if date_from.day == 1 and (date_to + timedelta(days=1)).day == 1:
+            # Table tenue à jour de façon synchrone à chaque écriture des écritures
+            source = """
+                SELECT * FROM account_balance_monthly
+                 WHERE company_id = %(company_id)s AND month BETWEEN %(date_from)s AND %(date_to)s
+            """
+        else:
+            self.env['account.move.line'].flush_model()
+            source = LINE_SOURCE.format(where="""
+                line.parent_state = 'posted' AND line.company_id = %(company_id)s
+                AND line.date BETWEEN %(date_from)s AND %(date_to)s
+            """)
+        self.env.cr.execute(f"""
+            SELECT account_id, SUM(debit), SUM(credit), SUM(balance)
+              FROM ({source}) AS source
+             WHERE {' AND '.join(conditions)}
+          GROUP BY account_id
+        """, params)
+        return {
+            account_id: (float(debit or 0.0), float(credit or 0.0), float(balance or 0.0))
+            for account_id, debit, credit, balance in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _get_account_totals_by_period(self, company, periods):
+        """Totaux ``{indice: {account_id: (débit, crédit, solde)}}`` de plusieurs périodes.
+
+        Une seule requête couvre toutes les périodes ``(date de début, date de
+        fin)``: chaque ligne est rattachée à la ou aux périodes qui la
+        contiennent puis agrégée par période et par compte. Les soldes
+        mensuels sont lus si toutes les périodes sont en mois entiers.
+        """
+        params = {
+            'company_id': company.id,
+            'date_froms': [date_from for date_from, date_to in periods],
+            'date_tos': [date_to for date_from, date_to in periods],
+            'date_min': min(date_from for date_from, date_to in periods),
+            'date_max': max(date_to for date_from, date_to in periods),
+        }
+        if all(date_from.day == 1 and (date_to + timedelta(days=1)).day == 1 for date_from, date_to in periods):
+            source = """
+                SELECT account_id, month AS date, debit, credit, balance
+                  FROM account_balance_monthly
+                 WHERE company_id = %(company_id)s
+                   AND analytic_account_id IS NULL
+                   AND month BETWEEN %(date_min)s AND %(date_max)s
+            """
+        else:
+            self.env['account.move.line'].flush_model()
+            source = """
+                SELECT account_id, date, debit, credit, balance
+                  FROM account_move_line
+                 WHERE company_id = %(company_id)s
+                   AND parent_state = 'posted'
+                   AND date BETWEEN %(date_min)s AND %(date_max)s
+                   AND account_id IS NOT NULL
+                   AND COALESCE(display_type, 'product') NOT IN ('line_section', 'line_note')
+            """
+        self.env.cr.execute(f"""
+            SELECT bucket.index - 1, source.account_id, SUM(source.debit), SUM(source.credit), SUM(source.balance)
+              FROM ({source}) AS source
+              JOIN unnest(%(date_froms)s::date[], %(date_tos)s::date[]) WITH ORDINALITY
+                   AS bucket(date_from, date_to, index)
+                ON source.date BETWEEN bucket.date_from AND bucket.date_to
+          GROUP BY bucket.index, source.account_id
+        """, params)
+        totals = {index: {} for index in range(len(periods))}
+        for index, account_id, debit, credit, balance in self.env.cr.fetchall():
+            totals[index][account_id] = (float(debit or 0.0), float(credit or 0.0), float(balance or 0.0))
+        return totals
@@ -3,6 +3,7 @@
 """Budget models for Cameroon localization."""
 
 from odoo import models, fields, api, _
+from collections import defaultdict
 
 from odoo.exceptions import UserError
 
@@ -69,23 +70,22 @@ class AccountBudgetLine(models.Model):
 
     @api.depends('budget_id.date_from', 'budget_id.date_to', 'account_id', 'analytic_account_id')
     def _compute_realized_amount(self):
+        # Une lecture des soldes mensuels par budget et compte analytique
+        groups = defaultdict(lambda: self.browse())
         for line in self:
             if line.account_id and line.budget_id.date_from and line.budget_id.date_to:
-                domain = [
-                    ('account_id', '=', line.account_id.id),
-                    ('date', '>=', line.budget_id.date_from),
-                    ('date', '<=', line.budget_id.date_to),
-                    ('move_id.state', '=', 'posted')
-                ]
-
-                if line.analytic_account_id:
-                    domain.append(('analytic_account_id', '=', line.analytic_account_id.id))
-
-                moves = self.env['account.move.line'].search(domain)
-                line.realized_amount = sum(moves.mapped('balance'))
+                groups[(line.budget_id, line.analytic_account_id)] |= line
             else:
                 line.realized_amount = 0
 
+        Summary = self.env['account.balance.monthly']
+        for (budget, analytic_account), lines in groups.items():
+            totals = Summary._get_account_totals(
+                budget.company_id or self.env.company, budget.date_from, budget.date_to,
+                account_ids=lines.account_id.ids, analytic_account_id=analytic_account.id)
+            for line in lines:
+                line.realized_amount = totals.get(line.account_id.id, (0.0, 0.0, 0.0))[2]
+
     @api.depends('planned_amount', 'realized_amount')
     def _compute_variance(self):
         for line in self:
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Journal entry extensions for Cameroon."""
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+# Champs de l'écriture dont la modification change sa contribution aux soldes
+# mensuels; les lignes modifiées par ``line_ids`` passent par leurs propres méthodes
+BALANCE_MOVE_FIELDS = {'state', 'date', 'company_id'}
+BALANCE_LINE_FIELDS = {
+    'move_id', 'account_id', 'partner_id', 'analytic_distribution', 'date', 'company_id',
+    'debit', 'credit', 'balance', 'display_type',
+}
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+    """Track imported entries and their contribution to the monthly balances."""
+
+    import_fingerprint = fields.Char(
+        string="Empreinte d'import",
+        index=True,
+        copy=False,
+        readonly=True,
+        help="Empreinte (journal, date, référence et lignes) de l'écriture importée avec une référence, "
+             "utilisée pour ne pas recréer une écriture déjà importée"
+    )
+
+    import_audit_id = fields.Many2one(
+        'account.move.import.audit',
+        string="Chargement historique",
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        help="Chargement historique (hors ORM) ayant créé cette écriture"
+    )
+
+    balance_summary_applied = fields.Boolean(
+        string="Inclus dans les soldes mensuels",
+        copy=False,
+        readonly=True,
+        help="L'écriture est comptée dans la table des soldes mensuels (account.balance.monthly)"
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        moves._cm_sync_balances()
+        return moves
+
+    def write(self, vals):
+        if not BALANCE_MOVE_FIELDS.intersection(vals):
+            return super().write(vals)
+        self._cm_unapply_balances()
+        res = super().write(vals)
+        self._cm_sync_balances()
+        return res
+
+    def unlink(self):
+        self._cm_unapply_balances()
+        return super().unlink()
+
+    def _cm_unapply_balances(self):
+        """Retirer des soldes mensuels les écritures qui y sont comptées"""
+        moves = self.filtered('balance_summary_applied')
+        if moves:
+            self.env['account.balance.monthly']._apply_moves(moves.ids, -1)
+
+    def _cm_sync_balances(self):
+        """Aligner les soldes mensuels sur l'état (comptabilisé ou non) des écritures"""
+        to_add = self.filtered(lambda move: move.state == 'posted' and not move.balance_summary_applied)
+        to_remove = self.filtered(lambda move: move.state != 'posted' and move.balance_summary_applied)
+        Summary = self.env['account.balance.monthly']
+        Summary._apply_moves(to_remove.ids, -1)
+        Summary._apply_moves(to_add.ids, 1)
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+    """Index posted lines and keep the monthly balances in sync with line edits."""
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        # Seules les lignes ajoutées à une écriture déjà comptée changent les soldes
+        self.env['account.balance.monthly']._apply_lines(lines._cm_applied(), 1)
+        return lines
+
+    def write(self, vals):
+        if not BALANCE_LINE_FIELDS.intersection(vals):
+            return super().write(vals)
+        Summary = self.env['account.balance.monthly']
+        Summary._apply_lines(self._cm_applied(), -1)
+        res = super().write(vals)
+        Summary._apply_lines(self._cm_applied(), 1)
+        return res
+
+    def unlink(self):
+        self.env['account.balance.monthly']._apply_lines(self._cm_applied(), -1)
+        return super().unlink()
+
+    def _cm_applied(self):
+        """Lignes dont l'écriture est comptée dans les soldes mensuels"""
+        return self.filtered(lambda line: line.move_id.balance_summary_applied)
+
+    def init(self):
+        super().init()
+        # Agrégats des déclarations: société, période, puis regroupement par compte
+        create_index(
+            self.env.cr,
+            'account_move_line_cm_declaration_idx',
+            self._table,
+            ['company_id', 'date', 'account_id'],
+            where="parent_state = 'posted'",
+        )
@@ -7,7 +7,7 @@ from odoo.exceptions import UserError, ValidationError
 import pandas as pd
 import base64
 import io
-from datetime import datetime, date
+from datetime import datetime
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -15,22 +15,40 @@ _logger = logging.getLogger(__name__)
 
 class AccountMoveImport(models.TransientModel):
     _name = 'account.move.import'
+    _inherit = ['account.move.import.mixin']
     """Import wizard handling Excel files."""
     _description = "Assistant d'importation d'écritures comptables"
 
     name = fields.Char(string="Nom de l'importation", required=True, default=lambda self: "Import du " + datetime.today().strftime('%d/%m/%Y'))
-    import_file = fields.Binary(string="Fichier Excel", required=True, help="Fichier Excel contenant les écritures à importer")
-    filename = fields.Char(string="Nom du fichier")
-    journal_id = fields.Many2one('account.journal', string="Journal par défaut", help="Journal utilisé si non spécifié dans le fichier")
+    import_file = fields.Binary(string="Fichier Excel", required=True, help="Fichier Excel (.xlsx) ou CSV contenant les écritures à importer")
     import_state = fields.Selection([
         ('draft', 'Brouillon'),
         ('imported', 'Importé'),
         ('error', 'Erreur')
     ], string="État", default='draft')
-    error_log = fields.Text(string="Log d'erreurs")
-    success_count = fields.Integer(string="Nombre d'écritures créées", default=0)
-    error_count = fields.Integer(string="Nombre d'erreurs", default=0)
     preview_data = fields.Text(string="Aperçu des données")
+    preview_row_count = fields.Integer(string="Lignes dans le fichier", readonly=True)
+    preview_journals = fields.Char(string="Journaux", readonly=True)
+    preview_account_count = fields.Integer(string="Comptes distincts", readonly=True)
+    preview_date_from = fields.Date(string="Première date", readonly=True)
+    preview_date_to = fields.Date(string="Dernière date", readonly=True)
+    preview_total_debit = fields.Float(string="Total débit", readonly=True)
+    preview_total_credit = fields.Float(string="Total crédit", readonly=True)
+    import_mode = fields.Selection([
+        ('standard', 'Écriture par écriture'),
+        ('batch', 'Par lots'),
+        ('stream', 'Flux (gros fichiers)'),
+        ('historical', 'Chargement historique (périodes clôturées)'),
+    ], string="Mode d'importation", default='standard', required=True,
+        help="En mode par lots, les écritures sont validées en mémoire puis créées par paquets. "
+             "En mode flux, le fichier est lu par paquets de lignes pour garder une mémoire constante; "
+             "les lignes d'une même référence doivent alors être contiguës. "
+             "Le chargement historique insère directement des écritures comptabilisées, "
+             "uniquement pour les périodes clôturées ou la date d'ouverture.")
+
+    partition_count = fields.Integer(string="Workers en parallèle", default=1,
+                                     help="Pour l'import en arrière-plan: nombre de partitions (par journal) "
+                                          "traitées simultanément par des workers distincts")
 
     def action_download_template(self):
         """Télécharge un template Excel pré-formaté"""
@@ -99,24 +117,23 @@ class AccountMoveImport(models.TransientModel):
 
     def action_preview_import(self):
         """Aperçu des données avant importation"""
-        if not self.import_file:
+        if not self.with_context(bin_size=True).import_file:
             raise UserError(_("Veuillez sélectionner un fichier à importer."))
 
         try:
-            # Décoder le fichier
-            file_data = base64.b64decode(self.import_file)
-            df = pd.read_excel(io.BytesIO(file_data))
-
-            # Valider les colonnes requises
-            required_columns = ['Date', 'Journal', 'Compte', 'Libelle', 'Debit', 'Credit']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-
-            if missing_columns:
-                raise UserError(_("Colonnes manquantes dans le fichier: %s") % ', '.join(missing_columns))
-
-            # Aperçu des premières lignes
-            preview = df.head(10).to_html(classes='table table-striped', table_id='preview_table')
-            self.preview_data = preview
+            # Une seule lecture en flux: premières lignes et statistiques du fichier
+            head, stats = self._scan_import_file()
+
+            self.write({
+                'preview_data': head.to_html(classes='table table-striped', table_id='preview_table', index=False),
+                'preview_row_count': stats['rows'],
+                'preview_journals': ', '.join(stats['journals']),
+                'preview_account_count': len(stats['accounts']),
+                'preview_date_from': stats['date_from'],
+                'preview_date_to': stats['date_to'],
+                'preview_total_debit': stats['debit'],
+                'preview_total_credit': stats['credit'],
+            })
 
             return {
                 'type': 'ir.actions.act_window',
@@ -132,41 +149,67 @@ class AccountMoveImport(models.TransientModel):
 
     def action_import_moves(self):
         """Import des écritures depuis le fichier Excel"""
-        if not self.import_file:
+        if not self.with_context(bin_size=True).import_file:
             raise UserError(_("Veuillez sélectionner un fichier à importer."))
 
         self.success_count = 0
-        self.error_count = 0
-        error_messages = []
+        self.skipped_count = 0
+        self._clear_import_errors()
 
         try:
-            # Décoder et lire le fichier
-            file_data = base64.b64decode(self.import_file)
-            df = pd.read_excel(io.BytesIO(file_data))
+            if self.import_mode == 'historical':
+                return self._import_historical()
+
+            if self.import_mode == 'stream':
+                # Première passe: collecter les codes et valider dates et équilibre
+                codes = None
+                validation_errors = []
+                move_dates = set()
+                for chunk in self._iter_import_chunks():
+                    chunk = self._annotate_import_frame(chunk, None)
+                    codes = self._collect_import_codes(chunk, codes)
+                    validation_errors += self._validate_import_frame(chunk)
+                    move_dates |= self._frame_move_dates(chunk)
+                codes = codes or self._collect_import_codes(pd.DataFrame())
+                lookups = self._build_import_lookups(codes)
+                unknown_errors = self._check_unknown_codes(codes, lookups)
+                if unknown_errors:
+                    return self._action_unknown_codes(unknown_errors)
+                if validation_errors:
+                    return self._action_validation_errors(validation_errors)
+
+                # Exercices fiscaux manquants créés en une fois avant toute écriture
+                self._ensure_fiscal_years(move_dates)
+
+                # Seconde passe: création paquet par paquet
+                for chunk in self._iter_import_chunks():
+                    self._import_frame(chunk, lookups)
+            else:
+                df = self._read_import_dataframe()
 
-            # Validation des colonnes
-            required_columns = ['Date', 'Journal', 'Compte', 'Libelle', 'Debit', 'Credit']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+                # Validation des colonnes
+                self._check_required_columns(df.columns)
 
-            if missing_columns:
-                raise UserError(_("Colonnes manquantes: %s") % ', '.join(missing_columns))
+                # Nettoyer les données
+                df = self._clean_import_frame(df)
 
-            # Nettoyer les données
-            df = df.dropna(subset=['Date', 'Compte'])
-            df['Debit'] = pd.to_numeric(df['Debit'], errors='coerce').fillna(0)
-            df['Credit'] = pd.to_numeric(df['Credit'], errors='coerce').fillna(0)
+                # Résoudre une seule fois les comptes, journaux et tiers du fichier
+                codes = self._collect_import_codes(df)
+                lookups = self._build_import_lookups(codes)
+                unknown_errors = self._check_unknown_codes(codes, lookups)
+                if unknown_errors:
+                    return self._action_unknown_codes(unknown_errors)
 
-            # Grouper par référence pour créer les écritures
-            grouped = df.groupby(df['Reference'].fillna(df.index))
+                # Validation vectorisée de tout le fichier avant écriture
+                df = self._annotate_import_frame(df, lookups)
+                validation_errors = self._validate_import_frame(df, lookups)
+                if validation_errors:
+                    return self._action_validation_errors(validation_errors)
 
-            for ref, group in grouped:
-                try:
-                    self._create_move_from_group(group)
-                    self.success_count += 1
-                except Exception as e:
-                    self.error_count += 1
-                    error_messages.append(f"Référence {ref}: {str(e)}")
-                    _logger.error(f"Erreur import écriture {ref}: {e}")
+                # Exercices fiscaux manquants créés en une fois avant toute écriture
+                self._ensure_fiscal_years(self._frame_move_dates(df))
+
+                self._import_frame(df, lookups)
 
             # Mise à jour du statut
             if self.error_count == 0:
@@ -175,8 +218,8 @@ class AccountMoveImport(models.TransientModel):
             else:
                 self.import_state = 'error'
                 message = _("Import partiel: %d réussies, %d erreurs") % (self.success_count, self.error_count)
-
-            self.error_log = '\n'.join(error_messages) if error_messages else ''
+            if self.skipped_count:
+                message += _(" (%d déjà importées, ignorées)") % self.skipped_count
 
             return {
                 'type': 'ir.actions.client',
@@ -193,121 +236,110 @@ class AccountMoveImport(models.TransientModel):
             self.error_log = str(e)
             raise UserError(_("Erreur lors de l'import: %s") % str(e))
 
-    def _create_move_from_group(self, group):
-        """Créer une écriture comptable à partir d'un groupe de lignes"""
-        if group.empty:
-            raise UserError(_("Groupe vide"))
-
-        first_row = group.iloc[0]
-
-        # Validation de base
-        if pd.isna(first_row['Date']):
-            raise UserError(_("Date manquante"))
-
-        # Conversion de la date
-        move_date = self._parse_date(first_row['Date'])
+    def action_import_in_background(self):
+        """Confier l'import à une tâche de fond reprenable"""
+        self.ensure_one()
+        attachment = self._get_import_attachment()
+        if not attachment:
+            raise UserError(_("Veuillez sélectionner un fichier à importer."))
 
-        # Journal
-        journal = self._get_journal(first_row.get('Journal', ''))
-        if not journal:
-            journal = self.journal_id
-        if not journal:
-            raise UserError(_("Journal non spécifié"))
+        job = self.env['account.move.import.job'].create({
+            'name': self.name,
+            'filename': self.filename,
+            'journal_id': self.journal_id.id,
+            'batch_size': self.batch_size,
+            'partition_count': self.partition_count,
+            'partner_fuzzy_match': self.partner_fuzzy_match,
+            'attachment_id': attachment.copy({'res_field': False, 'res_model': False, 'res_id': 0}).id,
+        })
+        job.attachment_id.write({'res_model': job._name, 'res_id': job.id})
+        job._trigger_processing()
 
-        # Exercice fiscal (gestion directe sans dépendance externe)
-        fiscal_year = self._get_or_create_fiscal_year(move_date)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': job._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
 
-        # Validation équilibre débit/crédit
-        total_debit = group['Debit'].sum()
-        total_credit = group['Credit'].sum()
+    def _action_unknown_codes(self, unknown_errors):
+        """Annuler l'import et signaler les codes inconnus"""
+        self.import_state = 'error'
+        self._store_import_errors(unknown_errors)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Import annulé: %d codes inconnus dans le fichier") % len(unknown_errors),
+                'type': 'danger',
+                'sticky': True,
+            }
+        }
 
-        if abs(total_debit - total_credit) > 0.01:
-            raise UserError(_("Écriture déséquilibrée: Débit=%.2f, Crédit=%.2f") % (total_debit, total_credit))
+    def _import_frame(self, df, lookups):
+        """Créer les écritures d'un DataFrame nettoyé et validé (annoté ou non).
 
-        # Créer l'écriture
-        move_vals = {
-            'journal_id': journal.id,
-            'date': move_date,
-            'ref': str(first_row.get('Reference', '')),
-            'line_ids': []
-        }
+        Met à jour les compteurs du wizard et enregistre en masse les échecs
+        de création dans la liste des erreurs.
+        """
+        if '_account_id' not in df.columns:
+            df = self._annotate_import_frame(df, lookups)
+        prepared = self._prepare_moves_from_frame(df)
 
-        # Créer les lignes d'écriture
-        for _, row in group.iterrows():
-            account = self._get_account(row['Compte'])
-            if not account:
-                raise UserError(_("Compte %s introuvable") % row['Compte'])
+        if self.import_mode in ('batch', 'stream'):
+            created_count, skipped_count, failures = self._create_moves_batched(prepared)
+            self.success_count += created_count
+            self.skipped_count += skipped_count
+        else:
+            prepared, skipped_count = self._filter_imported_moves(prepared)
+            self.skipped_count += skipped_count
+            failures = []
+            for ref, move_vals in prepared:
+                try:
+                    with self.env.cr.savepoint():
+                        self.env['account.move'].create(move_vals)
+                    self.success_count += 1
+                except Exception as e:
+                    failures.append((ref, str(e)))
 
-            partner = self._get_partner(row.get('Tiers', '')) if row.get('Tiers') else False
+        if failures:
+            self._store_import_errors(self._creation_errors(failures, self._frame_row_numbers(df)))
 
-            line_vals = {
-                'account_id': account.id,
-                'name': str(row['Libelle']),
-                'debit': float(row['Debit']),
-                'credit': float(row['Credit']),
-                'partner_id': partner.id if partner else False,
+    def _action_validation_errors(self, errors):
+        """Rejeter le fichier avant toute écriture en base"""
+        self.import_state = 'error'
+        self._store_import_errors(errors)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Fichier rejeté: %d erreurs de validation, aucune écriture créée") % len(errors),
+                'type': 'danger',
+                'sticky': True,
             }
-            move_vals['line_ids'].append((0, 0, line_vals))
+        }
 
-        # Créer l'écriture
-        move = self.env['account.move'].create(move_vals)
+    def _create_move_from_group(self, group, lookups=None):
+        """Créer une écriture comptable à partir d'un groupe de lignes"""
+        if lookups is None:
+            lookups = self._build_import_lookups(self._collect_import_codes(group))
+        move = self.env['account.move'].create(self._prepare_move_vals(group, lookups))
         return move
 
-    def _parse_date(self, date_value):
-        """Parser une date depuis différents formats"""
-        if isinstance(date_value, datetime):
-            return date_value.date()
-        elif isinstance(date_value, date):
-            return date_value
-        elif isinstance(date_value, str):
-            for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']:
-                try:
-                    return datetime.strptime(date_value, fmt).date()
-                except ValueError:
-                    continue
-            raise UserError(_("Format de date invalide: %s") % date_value)
-        else:
-            raise UserError(_("Type de date invalide: %s") % type(date_value))
-
-    def _get_journal(self, journal_code):
-        """Récupérer un journal par son code"""
-        if not journal_code:
-            return False
-        return self.env['account.journal'].search([('code', '=', journal_code)], limit=1)
-
-    def _get_account(self, account_code):
-        """Récupérer un compte par son code"""
-        if not account_code:
-            return False
-        return self.env['account.account'].search([('code', '=', str(account_code))], limit=1)
-
-    def _get_partner(self, partner_ref):
-        """Récupérer un partenaire par sa référence"""
-        if not partner_ref:
-            return False
-        return self.env['res.partner'].search([
-            '|', ('ref', '=', partner_ref), ('name', 'ilike', partner_ref)
-        ], limit=1)
-
-    def _get_or_create_fiscal_year(self, move_date):
-        """Retourne ou crée un cm.fiscal.year couvrant la date donnée."""
-        company = self.env.company
-        fiscal_year = self.env['cm.fiscal.year'].search([
-            ('company_id', '=', company.id),
-            ('date_start', '<=', move_date),
-            ('date_end', '>=', move_date),
-        ], limit=1)
-
-        if not fiscal_year:
-            year = move_date.year
-            fiscal_year = self.env['cm.fiscal.year'].create({
-                'name': str(year),
-                'date_start': date(year, 1, 1),
-                'date_end': date(year, 12, 31),
-                'company_id': company.id,
-            })
+    def _prepare_move_vals(self, group, lookups):
+        """Construire les valeurs d'une écriture à partir d'un groupe de lignes"""
+        if group.empty:
+            raise UserError(_("Groupe vide"))
+
+        group = self._annotate_import_frame(group.copy(), lookups)
+        group['_ref'] = group['_ref'].iloc[0]
+        errors = self._validate_import_frame(group, lookups)
+        if errors:
+            raise UserError(errors[0]['message'])
+        self._ensure_fiscal_years(self._frame_move_dates(group))
 
-        return fiscal_year
+        return self._prepare_moves_from_frame(group)[0][1]
 
     @api.model
     def get_import_statistics(self):
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Structured error records attached to move imports."""
+
+from odoo import models, fields, api
+from psycopg2.extras import execute_values
+
+ERROR_CODES = [
+    ('invalid_date', 'Date invalide'),
+    ('invalid_amount', 'Montant invalide'),
+    ('unknown_account', 'Compte inconnu'),
+    ('unknown_journal', 'Journal inconnu'),
+    ('unknown_partner', 'Tiers inconnu'),
+    ('ambiguous_partner', 'Tiers ambigu'),
+    ('unbalanced', 'Écriture déséquilibrée'),
+    ('open_period', 'Période non clôturée'),
+    ('creation_failed', 'Échec de création'),
+]
+
+# Nombre d'erreurs insérées par requête
+ERROR_INSERT_PAGE = 1000
+
+
+class AccountMoveImportError(models.Model):
+    _name = 'account.move.import.error'
+    """One rejected reference or code of an import file."""
+    _description = "Erreur d'importation d'écritures"
+    _order = 'first_row, id'
+    _rec_name = 'reference'
+
+    res_model = fields.Char(string="Modèle de l'import", required=True, index=True)
+    res_id = fields.Many2oneReference(string="Import", model_field='res_model', required=True, index=True)
+    reference = fields.Char(string="Référence")
+    row_numbers = fields.Char(string="Lignes", help="Numéros de ligne du fichier (en-tête = ligne 1)")
+    first_row = fields.Integer(string="Première ligne")
+    error_code = fields.Selection(ERROR_CODES, string="Type d'erreur", required=True, index=True)
+    column_name = fields.Char(string="Colonne", help="Colonne du code inconnu, pour les erreurs sans numéro de ligne")
+    value = fields.Char(string="Valeur")
+    message = fields.Text(string="Message", required=True)
+
+    @api.model
+    def _bulk_create(self, record, errors):
+        """Insérer en masse la table d'erreurs d'un import.
+
+        ``errors`` est une liste de dictionnaires ``{'reference', 'rows',
+        'code', 'message'}`` (et éventuellement ``column``/``value``), au format
+        de ``_validate_import_frame``.
+        """
+        if not errors:
+            return
+        rows = [(
+            record._name,
+            record.id,
+            error.get('reference') or None,
+            ', '.join(map(str, error.get('rows') or [])) or None,
+            min(error['rows']) if error.get('rows') else None,
+            error['code'],
+            error.get('column'),
+            error.get('value'),
+            error['message'],
+            self.env.uid,
+            self.env.uid,
+        ) for error in errors]
+        for start in range(0, len(rows), ERROR_INSERT_PAGE):
+            execute_values(self.env.cr, """
+                INSERT INTO account_move_import_error (
+                    res_model, res_id, reference, row_numbers, first_row, error_code,
+                    column_name, value, message, create_uid, write_uid, create_date, write_date
+                ) VALUES %s
+            """, rows[start:start + ERROR_INSERT_PAGE],
+                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')")
+        self.invalidate_model()
+
+    def _get_rows(self):
+        """Numéros de ligne du fichier concernés par l'erreur"""
+        self.ensure_one()
+        return [int(row) for row in (self.row_numbers or '').split(',') if row.strip()]
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""Bulk historical load of validated ledgers through PostgreSQL COPY."""
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+import pandas as pd
+import csv
+import io
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountMoveImportAudit(models.Model):
+    _name = 'account.move.import.audit'
+    """Audit trail of historical loads written outside the ORM."""
+    _description = "Journal des chargements historiques d'écritures"
+    _order = 'create_date desc'
+
+    name = fields.Char(string="Nom du chargement", required=True)
+    company_id = fields.Many2one('res.company', string="Société", required=True, default=lambda self: self.env.company)
+    user_id = fields.Many2one('res.users', string="Utilisateur", required=True, default=lambda self: self.env.user)
+    filename = fields.Char(string="Nom du fichier")
+    file_checksum = fields.Char(string="Empreinte du fichier", index=True)
+    state = fields.Selection([
+        ('loading', 'En cours'),
+        ('done', 'Chargé'),
+    ], string="État", default='loading', required=True)
+    date_from = fields.Date(string="Première date")
+    date_to = fields.Date(string="Dernière date")
+    journal_codes = fields.Char(string="Journaux")
+    move_count = fields.Integer(string="Nombre d'écritures")
+    line_count = fields.Integer(string="Nombre de lignes")
+    total_debit = fields.Monetary(string="Total débit", currency_field='currency_id')
+    total_credit = fields.Monetary(string="Total crédit", currency_field='currency_id')
+    currency_id = fields.Many2one('res.currency', related='company_id.currency_id')
+    move_ids = fields.One2many('account.move', 'import_audit_id', string="Écritures chargées")
+
+
+class AccountMoveImport(models.TransientModel):
+    _inherit = 'account.move.import'
+
+    def _import_historical(self):
+        """Charger un historique validé directement en SQL.
+
+        Les lignes sont copiées (COPY) dans une table temporaire, contrôlées en
+        SQL (dates, comptes, journaux, tiers, équilibre et périodes clôturées)
+        puis insérées en masse comme écritures comptabilisées. Réservé aux
+        périodes clôturées et à la date d'ouverture de la société.
+        """
+        self.ensure_one()
+        if not self.env.user.has_group('account.group_account_manager'):
+            raise UserError(_("Le chargement historique est réservé aux responsables comptables."))
+
+        cr = self.env.cr
+        company = self.env.company
+        attachment = self._get_import_attachment()
+        # Les écritures chargées hors ORM ne peuvent pas être annulées: un même
+        # fichier n'est chargé qu'une fois par société
+        previous = self.env['account.move.import.audit'].search([
+            ('company_id', '=', company.id),
+            ('file_checksum', '=', attachment.checksum),
+            ('state', '=', 'done'),
+        ], limit=1)
+        if previous:
+            raise UserError(_("Ce fichier a déjà été chargé le %s (%s).") % (
+                fields.Datetime.to_string(previous.create_date), previous.name))
+
+        self._create_historical_staging()
+        self._copy_to_historical_staging()
+
+        errors = self._check_historical_staging(company)
+        if errors:
+            return self._action_validation_errors(errors)
+
+        audit = self.env['account.move.import.audit'].create({
+            'name': self.name,
+            'company_id': company.id,
+            'filename': self.filename,
+            'file_checksum': attachment.checksum,
+        })
+        self._insert_historical_moves(company, audit)
+
+        cr.execute("""
+            SELECT COUNT(DISTINCT ref_key), COUNT(*), MIN(move_date), MAX(move_date),
+                   COALESCE(SUM(debit), 0), COALESCE(SUM(credit), 0),
+                   string_agg(DISTINCT j.code, ',')
+              FROM l10n_cm_import_staging s
+              JOIN account_journal j ON j.id = s.journal_id
+        """)
+        move_count, line_count, date_from, date_to, total_debit, total_credit, journal_codes = cr.fetchone()
+        audit.write({
+            'state': 'done',
+            'move_count': move_count,
+            'line_count': line_count,
+            'date_from': date_from,
+            'date_to': date_to,
+            'total_debit': total_debit,
+            'total_credit': total_credit,
+            'journal_codes': journal_codes,
+        })
+        self.success_count = move_count
+        self.import_state = 'imported'
+        _logger.info("Chargement historique %s: %d écritures, %d lignes", audit.id, move_count, line_count)
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Chargement historique réussi: %d écritures, %d lignes") % (move_count, line_count),
+                'type': 'success',
+                'sticky': True,
+            }
+        }
+
+    def _create_historical_staging(self):
+        cr = self.env.cr
+        cr.execute("DROP TABLE IF EXISTS l10n_cm_import_staging")
+        cr.execute("""
+            CREATE TEMPORARY TABLE l10n_cm_import_staging (
+                row_no integer,
+                ref_key text,
+                reference text,
+                move_date date,
+                journal_code text,
+                account_code text,
+                partner_ref text,
+                partner_id integer,
+                label text,
+                debit numeric,
+                credit numeric,
+                journal_id integer,
+                account_id integer
+            ) ON COMMIT DROP
+        """)
+
+    def _copy_to_historical_staging(self):
+        """Copier le fichier dans la table temporaire, paquet par paquet"""
+        Partner = self.env['res.partner']
+        partner_index = None
+        for chunk in self._iter_import_chunks():
+            chunk = self._annotate_import_frame(chunk, None)
+            codes = self._collect_import_codes(chunk)
+            partners = {}
+            if codes['Tiers']:
+                if partner_index is None:
+                    partner_index = Partner._cm_build_match_index(self.env.company)
+                # Les tiers ambigus restent sans correspondance et sont signalés par le contrôle SQL
+                partners = Partner._cm_match_partners(
+                    codes['Tiers'], partner_index, self.env.company, fuzzy=self.partner_fuzzy_match)[0]
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            tiers = chunk['Tiers'] if 'Tiers' in chunk.columns else [None] * len(chunk)
+            # Les montants illisibles sont copiés vides et signalés par le contrôle SQL
+            invalid = chunk['_invalid_amount'].notna()
+            debits = chunk['Debit'].astype(object).mask(invalid, '')
+            credits = chunk['Credit'].astype(object).mask(invalid, '')
+            for index, ref_key, reference, move_date, journal, account, partner_ref, label, debit, credit in zip(
+                chunk.index, chunk['_ref'], chunk['Reference'], chunk['_date'], chunk['Journal'],
+                chunk['Compte'], tiers, chunk['Libelle'], debits, credits,
+            ):
+                partner_ref = self._normalize_code(partner_ref)
+                writer.writerow([
+                    int(index) + 2,
+                    str(ref_key),
+                    self._normalize_code(reference),
+                    '' if pd.isna(move_date) else move_date.date().isoformat(),
+                    self._normalize_code(journal),
+                    self._normalize_code(account),
+                    partner_ref,
+                    partners.get(partner_ref, ''),
+                    '' if label is None else str(label),
+                    debit if debit == '' else float(debit),
+                    credit if credit == '' else float(credit),
+                ])
+            buffer.seek(0)
+            self.env.cr.copy_expert("""
+                COPY l10n_cm_import_staging (row_no, ref_key, reference, move_date, journal_code,
+                                             account_code, partner_ref, partner_id, label, debit, credit)
+                FROM STDIN WITH (FORMAT csv)
+            """, buffer)
+
+    def _check_historical_staging(self, company):
+        """Résoudre comptes et journaux puis contrôler la table temporaire en SQL.
+
+        Retourne la table des erreurs au format de ``_validate_import_frame``.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE l10n_cm_import_staging s
+               SET account_id = a.id
+              FROM account_account a
+             WHERE a.code = s.account_code AND a.company_id = %s
+        """, [company.id])
+        cr.execute("""
+            UPDATE l10n_cm_import_staging s
+               SET journal_id = j.id
+              FROM account_journal j
+             WHERE j.code = s.journal_code AND j.company_id = %s
+        """, [company.id])
+        if self.journal_id:
+            cr.execute("UPDATE l10n_cm_import_staging SET journal_id = %s WHERE journal_id IS NULL",
+                       [self.journal_id.id])
+
+        checks = [
+            ('invalid_date', "move_date IS NULL", _("Date invalide")),
+            ('invalid_amount', "debit IS NULL OR credit IS NULL", _("Montant invalide")),
+            ('unknown_account', "account_id IS NULL", _("Compte introuvable")),
+            ('unknown_journal', "journal_id IS NULL", _("Journal introuvable ou non spécifié")),
+            ('unknown_partner', "partner_ref <> '' AND partner_id IS NULL", _("Tiers introuvable ou ambigu")),
+            ('open_period', """
+                move_date IS NOT NULL
+                AND NOT (
+                    COALESCE(move_date <= %(lock_date)s, FALSE)
+                    OR COALESCE(move_date = %(opening_date)s, FALSE)
+                    OR EXISTS (
+                        SELECT 1 FROM cm_fiscal_year fy
+                         WHERE fy.company_id = %(company_id)s
+                           AND fy.state = 'closed'
+                           AND s.move_date BETWEEN fy.date_start AND fy.date_end
+                    )
+                )
+            """, _("Date hors période clôturée et différente de la date d'ouverture")),
+        ]
+        params = {
+            'lock_date': company.fiscalyear_lock_date,
+            'opening_date': company.account_opening_date,
+            'company_id': company.id,
+        }
+
+        errors = []
+        for code, condition, message in checks:
+            cr.execute(f"""
+                SELECT ref_key, array_agg(row_no ORDER BY row_no)
+                  FROM l10n_cm_import_staging s
+                 WHERE {condition}
+              GROUP BY ref_key
+              ORDER BY MIN(row_no)
+            """, params)
+            errors += [
+                {'reference': ref_key, 'rows': rows, 'code': code, 'message': message}
+                for ref_key, rows in cr.fetchall()
+            ]
+
+        cr.execute("""
+            SELECT ref_key, array_agg(row_no ORDER BY row_no), SUM(debit), SUM(credit)
+              FROM l10n_cm_import_staging
+          GROUP BY ref_key
+            HAVING ABS(SUM(debit) - SUM(credit)) > 0.01
+          ORDER BY MIN(row_no)
+        """)
+        errors += [{
+            'reference': ref_key,
+            'rows': rows,
+            'code': 'unbalanced',
+            'message': _("Écriture déséquilibrée: Débit=%.2f, Crédit=%.2f") % (debit, credit),
+        } for ref_key, rows, debit, credit in cr.fetchall()]
+        return errors
+
+    def _number_historical_moves(self):
+        """Numéroter les écritures de la table temporaire dans la séquence du journal.
+
+        Le format et le préfixe de chaque journal et mois sont ceux que
+        l'ORM donnerait à la prochaine écriture (``_set_next_sequence``): les
+        écritures saisies ensuite continuent la même numérotation. Un verrou
+        transactionnel par journal et préfixe empêche deux chargements
+        concurrents de lire le même dernier numéro.
+        """
+        cr = self.env.cr
+        Move = self.env['account.move']
+        cr.execute("""
+            SELECT journal_id, date_trunc('month', move_date)::date, MIN(move_date)
+              FROM l10n_cm_import_staging_move
+          GROUP BY journal_id, date_trunc('month', move_date)
+          ORDER BY journal_id, date_trunc('month', move_date)
+        """)
+        next_numbers = {}
+        for journal_id, month, first_date in cr.fetchall():
+            move = Move.new({'journal_id': journal_id, 'date': first_date, 'move_type': 'entry'})
+            move._set_next_sequence()
+            format_values = move._get_sequence_format_param(move.name)[1]
+            key = (journal_id, move.sequence_prefix)
+            if key not in next_numbers:
+                cr.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", list(key))
+                cr.execute("""
+                    SELECT MAX(sequence_number) FROM account_move
+                     WHERE journal_id = %s AND sequence_prefix = %s
+                """, list(key))
+                next_numbers[key] = max(move.sequence_number, (cr.fetchone()[0] or 0) + 1)
+            cr.execute("""
+                WITH numbered AS (
+                    SELECT ref_key, ROW_NUMBER() OVER (ORDER BY move_date, first_row) - 1 AS position
+                      FROM l10n_cm_import_staging_move
+                     WHERE journal_id = %(journal_id)s
+                       AND date_trunc('month', move_date) = %(month)s
+                )
+                UPDATE l10n_cm_import_staging_move m
+                   SET id = nextval('account_move_id_seq'),
+                       sequence_prefix = %(prefix)s,
+                       sequence_number = %(start)s + n.position,
+                       name = %(prefix)s
+                              || LPAD((%(start)s + n.position)::text,
+                                      GREATEST(%(seq_length)s, LENGTH((%(start)s + n.position)::text)), '0')
+                              || %(suffix)s
+                  FROM numbered n
+                 WHERE n.ref_key = m.ref_key
+            """, {
+                'journal_id': journal_id,
+                'month': month,
+                'prefix': move.sequence_prefix,
+                'start': next_numbers[key],
+                'seq_length': format_values['seq_length'],
+                'suffix': format_values['suffix'],
+            })
+            next_numbers[key] += cr.rowcount
+
+    def _insert_historical_moves(self, company, audit):
+        """Insérer en masse les écritures comptabilisées et leurs lignes.
+
+        Les écritures sont numérotées dans la séquence ordinaire de leur
+        journal (voir ``_number_historical_moves``).
+        """
+        cr = self.env.cr
+        cr.execute("DROP TABLE IF EXISTS l10n_cm_import_staging_move")
+        cr.execute("""
+            CREATE TEMPORARY TABLE l10n_cm_import_staging_move ON COMMIT DROP AS
+            SELECT DISTINCT ON (s.ref_key)
+                   s.ref_key, s.reference, s.move_date, s.journal_id, s.row_no AS first_row,
+                   NULL::text AS sequence_prefix, NULL::integer AS id,
+                   NULL::integer AS sequence_number, NULL::text AS name,
+                   totals.amount_total
+              FROM l10n_cm_import_staging s
+              -- Totaux calculés en un seul passage sur la table temporaire
+              JOIN (SELECT ref_key, SUM(debit) AS amount_total
+                      FROM l10n_cm_import_staging
+                  GROUP BY ref_key) AS totals ON totals.ref_key = s.ref_key
+          ORDER BY s.ref_key, s.row_no
+        """)
+        cr.execute("CREATE INDEX ON l10n_cm_import_staging_move (ref_key)")
+        cr.execute("ANALYZE l10n_cm_import_staging_move")
+        self._number_historical_moves()
+
+        params = {
+            'company_id': company.id,
+            'currency_id': company.currency_id.id,
+            'audit_id': audit.id,
+            'uid': self.env.uid,
+        }
+        cr.execute("""
+            INSERT INTO account_move (
+                id, name, ref, date, journal_id, company_id, currency_id,
+                state, move_type, auto_post, posted_before, payment_state,
+                sequence_prefix, sequence_number, import_audit_id,
+                amount_untaxed, amount_tax, amount_total, amount_residual,
+                amount_untaxed_signed, amount_tax_signed, amount_total_signed,
+                amount_total_in_currency_signed, amount_residual_signed,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT m.id, m.name, NULLIF(m.reference, ''), m.move_date, m.journal_id,
+                   %(company_id)s, %(currency_id)s,
+                   'posted', 'entry', 'no', TRUE, 'not_paid',
+                   m.sequence_prefix, m.sequence_number, %(audit_id)s,
+                   0, 0, m.amount_total, 0,
+                   0, 0, m.amount_total,
+                   m.amount_total, 0,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM l10n_cm_import_staging_move m
+        """, params)
+        cr.execute("""
+            INSERT INTO account_move_line (
+                move_id, move_name, date, ref, parent_state, journal_id,
+                company_id, company_currency_id, currency_id,
+                account_id, partner_id, name, display_type, sequence,
+                debit, credit, balance, amount_currency,
+                amount_residual, amount_residual_currency, reconciled,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT m.id, m.name, m.move_date, NULLIF(m.reference, ''), 'posted', m.journal_id,
+                   %(company_id)s, %(currency_id)s, %(currency_id)s,
+                   s.account_id, s.partner_id, s.label, 'product', s.row_no,
+                   s.debit, s.credit, s.debit - s.credit, s.debit - s.credit,
+                   CASE WHEN a.reconcile THEN s.debit - s.credit ELSE 0 END,
+                   CASE WHEN a.reconcile THEN s.debit - s.credit ELSE 0 END,
+                   FALSE,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM l10n_cm_import_staging s
+              JOIN l10n_cm_import_staging_move m ON m.ref_key = s.ref_key
+              JOIN account_account a ON a.id = s.account_id
+        """, params)
+
+        # Les données ont été écrites hors ORM
+        self.env.invalidate_all()
+        cr.execute("SELECT id FROM l10n_cm_import_staging_move")
+        self.env['account.balance.monthly']._apply_moves([move_id for move_id, in cr.fetchall()], 1)
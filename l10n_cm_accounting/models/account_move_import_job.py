@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""Background jobs importing large move files in committed batches."""
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Durée maximale (secondes) d'un passage du CRON avant de rendre la main
+JOB_TIME_LIMIT = 120
+
+# CRON pouvant traiter des partitions en parallèle (un worker chacun)
+IMPORT_WORKER_CRONS = [
+    'l10n_cm_accounting.ir_cron_account_move_import_jobs',
+    'l10n_cm_accounting.ir_cron_account_move_import_jobs_2',
+    'l10n_cm_accounting.ir_cron_account_move_import_jobs_3',
+    'l10n_cm_accounting.ir_cron_account_move_import_jobs_4',
+]
+
+
+class AccountMoveImportJob(models.Model):
+    _name = 'account.move.import.job'
+    _inherit = ['account.move.import.mixin']
+    """Persistent import job processed by a cron worker."""
+    _description = "Tâche d'importation d'écritures en arrière-plan"
+    _order = 'id desc'
+
+    name = fields.Char(string="Nom de l'importation", required=True)
+    company_id = fields.Many2one('res.company', string="Société", required=True, default=lambda self: self.env.company)
+    user_id = fields.Many2one('res.users', string="Utilisateur", required=True, default=lambda self: self.env.user)
+    attachment_id = fields.Many2one('ir.attachment', string="Fichier", required=True, ondelete='restrict')
+
+    state = fields.Selection([
+        ('queued', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('error', 'Erreur'),
+    ], string="État", default='queued', required=True, index=True)
+
+    # Partitionnement par journal pour un traitement parallèle
+    partition_count = fields.Integer(string="Nombre de partitions", default=1,
+                                     help="Nombre de workers traitant le fichier en parallèle. "
+                                          "Chaque journal est affecté à une seule partition.")
+    parent_id = fields.Many2one('account.move.import.job', string="Tâche principale", ondelete='cascade', index=True)
+    child_ids = fields.One2many('account.move.import.job', 'parent_id', string="Partitions")
+    partition_journals = fields.Char(string="Journaux de la partition",
+                                     help="Identifiants des journaux traités par cette partition, séparés par des virgules")
+
+    # Curseur de reprise: nombre de groupes (références) déjà traités, dans l'ordre du fichier
+    groups_done = fields.Integer(string="Écritures traitées", default=0)
+    groups_total = fields.Integer(string="Écritures à traiter", default=0)
+    rows_done = fields.Integer(string="Lignes traitées", default=0)
+    rows_total = fields.Integer(string="Lignes à traiter", default=0)
+    progress = fields.Float(string="Progression (%)", compute='_compute_progress')
+    processing_time = fields.Float(string="Durée de traitement (s)", default=0.0)
+    moves_per_second = fields.Float(string="Écritures / seconde", compute='_compute_progress')
+    date_start = fields.Datetime(string="Début du traitement")
+    date_end = fields.Datetime(string="Fin du traitement")
+    last_checkpoint = fields.Datetime(string="Dernier point de reprise")
+
+    @api.depends('rows_done', 'rows_total', 'success_count', 'processing_time',
+                 'child_ids.rows_done', 'child_ids.success_count', 'child_ids.processing_time')
+    def _compute_progress(self):
+        for job in self:
+            rows_done = job.rows_done
+            success_count = job.success_count
+            processing_time = job.processing_time
+            if job.child_ids and job.state == 'running':
+                # Les partitions tournent en parallèle: durée = la plus longue
+                rows_done = sum(job.child_ids.mapped('rows_done'))
+                success_count = sum(job.child_ids.mapped('success_count'))
+                processing_time = max(job.child_ids.mapped('processing_time'))
+            job.progress = (rows_done / job.rows_total * 100) if job.rows_total else 0.0
+            job.moves_per_second = (success_count / processing_time) if processing_time else 0.0
+
+    def _get_import_attachment(self):
+        return self.attachment_id
+
+    @api.model
+    def _trigger_processing(self):
+        for xmlid in IMPORT_WORKER_CRONS:
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron and cron.active:
+                cron._trigger()
+
+    def _try_lock(self):
+        """Réserver la tâche pour ce worker (verrou de session, survit aux commits)"""
+        self.env.cr.execute("SELECT pg_try_advisory_lock(hashtext(%s), %s)", [self._name, self.id])
+        return self.env.cr.fetchone()[0]
+
+    def _unlock(self):
+        self.env.cr.execute("SELECT pg_advisory_unlock(hashtext(%s), %s)", [self._name, self.id])
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Traiter les tâches en attente par lots validés (appelé par CRON).
+
+        Plusieurs CRON exécutent cette méthode en parallèle; un verrou par tâche
+        garantit qu'une partition n'est traitée que par un seul worker.
+        """
+        deadline = time.monotonic() + JOB_TIME_LIMIT
+        for job in self.search([('state', 'in', ('queued', 'running'))], order='id'):
+            if job.child_ids:
+                job._merge_partitions()
+                continue
+            if not job._try_lock():
+                continue
+            job = job.with_user(job.user_id).with_company(job.company_id)
+            try:
+                finished = job._process(deadline)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("Erreur tâche d'import %s", job.id)
+                job.write({'state': 'error', 'error_log': str(e), 'date_end': fields.Datetime.now()})
+                self.env.cr.commit()
+                finished = True
+            finally:
+                job._unlock()
+            if job.parent_id:
+                job.parent_id._merge_partitions()
+                self.env.cr.commit()
+            if not finished:
+                # Reprendre au dernier point de reprise lors du prochain passage
+                self._trigger_processing()
+                return
+
+    def _validate_file(self):
+        """Lire tout le fichier une fois pour le valider et compter le travail.
+
+        Retourne ``False`` et passe la tâche en erreur si le fichier est rejeté.
+        """
+        self.ensure_one()
+        codes = None
+        validation_errors = []
+        rows_total = 0
+        groups_total = 0
+        journal_stats = {}
+        move_dates = set()
+        for chunk in self._iter_import_chunks():
+            chunk = self._annotate_import_frame(chunk, None)
+            codes = self._collect_import_codes(chunk, codes)
+            move_dates |= self._frame_move_dates(chunk)
+            validation_errors += self._validate_import_frame(chunk)
+            rows_total += len(chunk)
+            groups_total += chunk['_ref'].nunique()
+            group_journals = self._group_journal_codes(chunk)
+            rows_per_group = chunk.groupby('_ref', sort=False).size()
+            for key, journal_code in group_journals.items():
+                stats = journal_stats.setdefault(journal_code, [0, 0])
+                stats[0] += 1
+                stats[1] += int(rows_per_group[key])
+
+        errors = []
+        journals = {}
+        if codes:
+            lookups = self._build_import_lookups(codes)
+            journals = lookups['journals']
+            errors += self._check_unknown_codes(codes, lookups)
+        errors += validation_errors
+        if errors:
+            self._store_import_errors(errors)
+            self.write({'state': 'error', 'date_end': fields.Datetime.now()})
+            return False
+
+        self.write({'rows_total': rows_total, 'groups_total': groups_total})
+        # Exercices fiscaux créés avant que les partitions ne démarrent
+        self._ensure_fiscal_years(move_dates)
+        if self.partition_count > 1:
+            # Codes regroupés par journal résolu: un code vide ou inconnu et le
+            # code du journal par défaut alimentent le même journal
+            partition_stats = {}
+            for journal_code, (groups, rows) in journal_stats.items():
+                stats = partition_stats.setdefault(self._resolve_journal_code(journal_code, journals), [0, 0])
+                stats[0] += groups
+                stats[1] += rows
+            if len(partition_stats) > 1:
+                self._create_partitions(partition_stats)
+        return True
+
+    def _group_journal_codes(self, chunk):
+        """Code journal de chaque groupe (celui de sa première ligne), par clé ``_ref``"""
+        return chunk.groupby('_ref', sort=False)['Journal'].first().map(self._normalize_code).to_dict()
+
+    def _resolve_journal_code(self, journal_code, journals):
+        """Journal d'un code du fichier, le journal par défaut remplaçant les codes vides ou inconnus"""
+        return journals.get(journal_code) or self.journal_id.id
+
+    def _create_partitions(self, journal_stats):
+        """Répartir les journaux entre partitions de tailles équilibrées.
+
+        ``journal_stats`` associe chaque journal (identifiant résolu) à
+        ``[groupes, lignes]``.
+        Un journal n'appartient qu'à une partition: ses écritures sont créées
+        par un seul worker, dans l'ordre du fichier, ce qui préserve la
+        numérotation séquentielle par journal.
+        """
+        self.ensure_one()
+        partitions = [{'journals': [], 'groups': 0, 'rows': 0} for i in range(self.partition_count)]
+        for journal_id, (groups, rows) in sorted(journal_stats.items(), key=lambda item: -item[1][1]):
+            partition = min(partitions, key=lambda p: p['rows'])
+            partition['journals'].append(str(journal_id))
+            partition['groups'] += groups
+            partition['rows'] += rows
+
+        self.env['account.move.import.job'].create([{
+            'name': f"{self.name} ({index + 1}/{self.partition_count})",
+            'parent_id': self.id,
+            'company_id': self.company_id.id,
+            'user_id': self.user_id.id,
+            'attachment_id': self.attachment_id.id,
+            'filename': self.filename,
+            'journal_id': self.journal_id.id,
+            'batch_size': self.batch_size,
+            'partner_fuzzy_match': self.partner_fuzzy_match,
+            'partition_journals': ','.join(partition['journals']),
+            'state': 'running',
+            'date_start': fields.Datetime.now(),
+            'groups_total': partition['groups'],
+            'rows_total': partition['rows'],
+        } for index, partition in enumerate(partitions) if partition['journals']])
+
+    def _filter_partition(self, chunk):
+        """Restreindre un paquet annoté aux groupes des journaux de la partition"""
+        if not self.partition_journals:
+            return chunk
+        journal_ids = {int(journal_id) for journal_id in self.partition_journals.split(',')}
+        group_codes = self._group_journal_codes(chunk)
+        journals = self._build_import_lookups({
+            'Compte': set(), 'Journal': set(group_codes.values()) - {''}, 'Tiers': set(),
+        })['journals']
+        keys = [key for key, code in group_codes.items()
+                if self._resolve_journal_code(code, journals) in journal_ids]
+        return chunk[chunk['_ref'].isin(keys)]
+
+    def _import_error_domain(self):
+        # Les erreurs des partitions sont consultées depuis la tâche principale
+        return [('res_model', '=', self._name), ('res_id', 'in', (self | self.child_ids).ids)]
+
+    def _merge_partitions(self):
+        """Consolider le rapport des partitions une fois toutes terminées"""
+        self.ensure_one()
+        if not self.child_ids or any(child.state in ('queued', 'running') for child in self.child_ids):
+            return
+        self.write({
+            'success_count': sum(self.child_ids.mapped('success_count')),
+            'skipped_count': sum(self.child_ids.mapped('skipped_count')),
+            'error_count': sum(self.child_ids.mapped('error_count')),
+            'error_log': '\n'.join(log for log in self.child_ids.mapped('error_log') if log) or False,
+            'groups_done': sum(self.child_ids.mapped('groups_done')),
+            'rows_done': sum(self.child_ids.mapped('rows_done')),
+            'processing_time': max(self.child_ids.mapped('processing_time')),
+            'state': 'error' if any(child.state == 'error' for child in self.child_ids) else 'done',
+            'date_end': fields.Datetime.now(),
+        })
+
+    def _process(self, deadline):
+        """Traiter la tâche depuis son dernier point de reprise.
+
+        Chaque lot de ``batch_size`` écritures est validé (commit) avec le
+        curseur de reprise, de sorte qu'un redémarrage du worker reprend après
+        le dernier lot enregistré. Retourne ``False`` si le temps imparti est
+        écoulé avant la fin.
+        """
+        self.ensure_one()
+        if self.state == 'queued':
+            if not self._validate_file():
+                self.env.cr.commit()
+                return True
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+            if self.child_ids:
+                # Les partitions sont traitées par les autres workers
+                self._trigger_processing()
+                return True
+
+        to_skip = self.groups_done
+        batch_size = max(self.batch_size or 1, 1)
+        partner_index = None
+
+        for chunk in self._iter_import_chunks():
+            chunk = self._filter_partition(self._annotate_import_frame(chunk, None))
+            keys = chunk['_ref'].unique()
+            if to_skip >= len(keys):
+                to_skip -= len(keys)
+                continue
+            if to_skip:
+                chunk = chunk[chunk['_ref'].isin(keys[to_skip:])]
+                to_skip = 0
+
+            codes = self._collect_import_codes(chunk)
+            if codes['Tiers'] and partner_index is None:
+                partner_index = self.env['res.partner']._cm_build_match_index(self.company_id)
+            lookups = self._build_import_lookups(codes, partner_index)
+            prepared = self._prepare_moves_from_frame(self._annotate_import_frame(chunk, lookups))
+            rows_by_key = self._frame_row_numbers(chunk)
+
+            for start in range(0, len(prepared), batch_size):
+                batch = prepared[start:start + batch_size]
+                started = time.monotonic()
+                created_count, skipped_count, failures = self._create_moves_batched(batch)
+                self._store_import_errors(self._creation_errors(failures, rows_by_key))
+                self.write({
+                    'groups_done': self.groups_done + len(batch),
+                    'rows_done': self.rows_done + sum(len(vals['line_ids']) for ref, vals in batch),
+                    'success_count': self.success_count + created_count,
+                    'skipped_count': self.skipped_count + skipped_count,
+                    'processing_time': self.processing_time + time.monotonic() - started,
+                    'last_checkpoint': fields.Datetime.now(),
+                })
+                self.env.cr.commit()
+                if time.monotonic() > deadline:
+                    return False
+
+        self.write({
+            'state': 'done' if not self.error_count else 'error',
+            'date_end': fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+        _logger.info("Tâche d'import %s terminée: %d écritures, %d erreurs",
+                     self.id, self.success_count, self.error_count)
+        return True
+
+    def action_process_now(self):
+        """Relancer immédiatement le traitement en arrière-plan"""
+        if any(job.state not in ('queued', 'running') for job in self):
+            raise UserError(_("Seules les tâches en attente ou en cours peuvent être relancées."))
+        self._trigger_processing()
@@ -0,0 +1,674 @@
+# -*- coding: utf-8 -*-
+
+"""Shared reading, validation and creation helpers for move imports."""
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import pandas as pd
+import csv
+import hashlib
+import io
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+import numbers
+from datetime import date, datetime
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+REQUIRED_COLUMNS = ['Date', 'Journal', 'Compte', 'Libelle', 'Debit', 'Credit']
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']
+
+# Origine des numéros de série des dates Excel
+EXCEL_EPOCH = '1899-12-30'
+
+# Nombre de lignes lues par paquet en mode flux
+STREAM_CHUNK_ROWS = 5000
+
+# Nombre de lignes affichées dans l'aperçu
+PREVIEW_ROWS = 10
+
+
+class AccountMoveImportMixin(models.AbstractModel):
+    _name = 'account.move.import.mixin'
+    """Common import pipeline used by the wizard and background jobs."""
+    _description = "Outils communs d'importation d'écritures"
+
+    filename = fields.Char(string="Nom du fichier")
+    journal_id = fields.Many2one('account.journal', string="Journal par défaut", help="Journal utilisé si non spécifié dans le fichier")
+    error_log = fields.Text(string="Erreur bloquante",
+                            help="Erreur ayant interrompu l'import; le détail par écriture est dans la liste des erreurs")
+    error_ids = fields.One2many('account.move.import.error', 'res_id', string="Erreurs",
+                                domain=lambda self: [('res_model', '=', self._name)])
+    success_count = fields.Integer(string="Nombre d'écritures créées", default=0)
+    skipped_count = fields.Integer(string="Écritures déjà importées", default=0,
+                                   help="Écritures ignorées car une écriture de même empreinte existe déjà")
+    error_count = fields.Integer(string="Nombre d'erreurs", default=0)
+    batch_size = fields.Integer(string="Écritures par lot", default=500,
+                                help="Nombre d'écritures créées par appel en mode par lots")
+    partner_fuzzy_match = fields.Boolean(string="Rapprochement approximatif des tiers",
+                                         help="Si aucun tiers ne correspond exactement (référence, numéro de "
+                                              "contribuable ou nom), chercher un nom proche par similarité")
+
+    @api.model
+    def _normalize_code(self, value):
+        """Normaliser un code lu dans le fichier (ex: 411000.0 -> '411000')"""
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip()
+
+    def _is_csv_file(self):
+        return (self.filename or '').lower().endswith('.csv')
+
+    def _get_import_attachment(self):
+        """Retourner la pièce jointe contenant le fichier à importer.
+
+        Par défaut, la pièce jointe du champ binaire ``import_file`` de
+        l'enregistrement.
+        """
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'import_file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+
+    @contextmanager
+    def _open_import_file(self):
+        """Ouvrir le fichier importé en binaire.
+
+        Le fichier est lu directement depuis le filestore lorsque c'est possible,
+        sans décoder la chaîne base64 en mémoire.
+        """
+        attachment = self._get_import_attachment()
+        if not attachment:
+            raise UserError(_("Veuillez sélectionner un fichier à importer."))
+        if attachment.store_fname:
+            with open(attachment._full_path(attachment.store_fname), 'rb') as file_obj:
+                yield file_obj
+        else:
+            yield io.BytesIO(attachment.raw)
+
+    def _read_import_dataframe(self):
+        """Lire tout le fichier (Excel ou CSV) dans un DataFrame.
+
+        Les colonnes CSV sont lues comme texte afin de conserver les zéros
+        initiaux des codes (``00123``); montants et dates sont convertis
+        ensuite par ``_clean_import_frame`` et ``_parse_date_column``.
+        """
+        with self._open_import_file() as file_obj:
+            if self._is_csv_file():
+                return pd.read_csv(file_obj, sep=None, engine='python', encoding='utf-8-sig',
+                                   dtype=str, keep_default_na=False, na_values=[''])
+            return pd.read_excel(file_obj)
+
+    def _check_required_columns(self, columns):
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+        if missing_columns:
+            raise UserError(_("Colonnes manquantes: %s") % ', '.join(missing_columns))
+
+    @api.model
+    def _clean_import_frame(self, df):
+        """Supprimer les lignes incomplètes et convertir les montants.
+
+        Les montants illisibles valent 0 et leur valeur d'origine est gardée
+        dans ``_invalid_amount`` pour être signalée par la validation.
+        """
+        df = df.dropna(subset=['Date', 'Compte'])
+        raw = df[['Debit', 'Credit']].astype(object)
+        debit = self._parse_amount_column(raw['Debit'])
+        credit = self._parse_amount_column(raw['Credit'])
+        df['_invalid_amount'] = raw['Debit'].where(debit.isna(), raw['Credit'].where(credit.isna()))
+        df['Debit'] = debit.fillna(0)
+        df['Credit'] = credit.fillna(0)
+        if 'Reference' not in df.columns:
+            df['Reference'] = None
+        return df
+
+    @api.model
+    def _parse_amount_column(self, series):
+        """Convertir une colonne de montants en une passe vectorisée.
+
+        Les textes admettent la virgule décimale et les espaces de milliers
+        (``1 234,50``). Les cellules vides valent 0 et les valeurs illisibles
+        donnent ``NaN``.
+        """
+        series = series.astype(object)
+        is_text = series.map(lambda value: isinstance(value, str))
+        text = series.where(is_text).astype(object).str.replace(r'\s', '', regex=True).str.replace(',', '.', regex=False)
+        amounts = pd.to_numeric(series.where(~is_text), errors='coerce')
+        amounts = amounts.fillna(pd.to_numeric(text.replace('', None), errors='coerce'))
+        blank = series.isna() | (text == '')
+        return amounts.mask(blank, 0.0)
+
+    def _iter_import_rows(self):
+        """Parcourir le fichier ligne par ligne sans le charger entièrement.
+
+        Produit des couples ``(index, valeurs)`` où ``index`` suit la même
+        numérotation que ``pd.read_excel`` (0 pour la première ligne de données).
+        """
+        with self._open_import_file() as file_obj:
+            if self._is_csv_file():
+                text = io.TextIOWrapper(file_obj, encoding='utf-8-sig', newline='')
+                sample = text.readline()
+                delimiter = ';' if sample.count(';') > sample.count(',') else ','
+                text.seek(0)
+                rows = csv.reader(text, delimiter=delimiter)
+            else:
+                if openpyxl is None:
+                    raise UserError(_("La librairie openpyxl est requise pour le mode flux."))
+                workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+                rows = workbook.worksheets[0].iter_rows(values_only=True)
+
+            try:
+                header = next(rows, None)
+                if not header:
+                    return
+                header = [str(col).strip() if col is not None else '' for col in header]
+                self._check_required_columns(header)
+
+                for index, values in enumerate(rows):
+                    if not any(value not in (None, '') for value in values):
+                        continue
+                    yield index, {
+                        col: (value if value != '' else None)
+                        for col, value in zip(header, values) if col
+                    }
+            finally:
+                if not self._is_csv_file():
+                    workbook.close()
+
+    def _iter_import_chunks(self, chunk_rows=STREAM_CHUNK_ROWS):
+        """Lire le fichier par paquets nettoyés d'au plus ``chunk_rows`` lignes.
+
+        Un paquet n'est coupé qu'entre deux références, de sorte que chaque
+        paquet contient des écritures complètes. Les lignes d'une même
+        référence doivent être contiguës dans le fichier.
+        """
+        indexes, records = [], []
+        current_ref = None
+        seen_refs = set()
+
+        for index, values in self._iter_import_rows():
+            ref = values.get('Reference')
+            ref = str(ref).strip() if ref not in (None, '') else None
+            if ref != current_ref or ref is None:
+                if len(records) >= chunk_rows:
+                    yield self._clean_import_frame(pd.DataFrame(records, index=indexes))
+                    indexes, records = [], []
+                if ref is not None:
+                    if ref in seen_refs:
+                        raise UserError(_("Les lignes de la référence %s ne sont pas contiguës dans le fichier.") % ref)
+                    seen_refs.add(ref)
+                current_ref = ref
+            values['Reference'] = ref
+            indexes.append(index)
+            records.append(values)
+
+        if records:
+            yield self._clean_import_frame(pd.DataFrame(records, index=indexes))
+
+    def _scan_import_file(self, preview_rows=PREVIEW_ROWS):
+        """Parcourir le fichier une seule fois pour l'aperçu et ses statistiques.
+
+        Retourne un DataFrame des ``preview_rows`` premières lignes et un
+        dictionnaire ``{'rows', 'journals', 'accounts', 'date_from', 'date_to',
+        'debit', 'credit'}``. Le fichier est lu en flux et chaque paquet de
+        lignes est agrégé de façon vectorisée, sans charger tout le classeur.
+        """
+        head, records = [], []
+        codes = None
+        stats = {'rows': 0, 'date_from': None, 'date_to': None, 'debit': 0.0, 'credit': 0.0}
+
+        def aggregate(records, codes):
+            df = pd.DataFrame(records)
+            stats['rows'] += len(df)
+            dates = self._parse_date_column(df['Date']).dropna()
+            if not dates.empty:
+                date_from, date_to = dates.min().date(), dates.max().date()
+                stats['date_from'] = min(stats['date_from'] or date_from, date_from)
+                stats['date_to'] = max(stats['date_to'] or date_to, date_to)
+            stats['debit'] += float(self._parse_amount_column(df['Debit']).sum())
+            stats['credit'] += float(self._parse_amount_column(df['Credit']).sum())
+            return self._collect_import_codes(df, codes)
+
+        for index, values in self._iter_import_rows():
+            if len(head) < preview_rows:
+                head.append(values)
+            records.append(values)
+            if len(records) >= STREAM_CHUNK_ROWS:
+                codes = aggregate(records, codes)
+                records = []
+        if records:
+            codes = aggregate(records, codes)
+
+        codes = codes or self._collect_import_codes(pd.DataFrame())
+        stats['journals'] = sorted(codes['Journal'])
+        stats['accounts'] = sorted(codes['Compte'])
+        return pd.DataFrame(head), stats
+
+    def _collect_import_codes(self, df, codes=None):
+        """Ajouter à ``codes`` les valeurs distinctes des colonnes Compte, Journal et Tiers"""
+        if codes is None:
+            codes = {'Compte': set(), 'Journal': set(), 'Tiers': set()}
+        for column, values in codes.items():
+            if column in df.columns:
+                values.update(code for code in map(self._normalize_code, df[column].unique()) if code)
+        return codes
+
+    def _build_import_lookups(self, codes, partner_index=None):
+        """Résoudre en une passe les codes distincts du fichier en identifiants.
+
+        Retourne un dictionnaire ``{'accounts': {code: id}, 'journals': {code: id},
+        'partners': {tiers: id}, 'ambiguous_partners': {tiers: [ids]}}`` limité à
+        la société courante, afin que le traitement ligne à ligne se limite à
+        des accès dictionnaire. ``partner_index`` permet de réutiliser l'index
+        des partenaires entre plusieurs paquets d'un même import.
+        """
+        company = self.env.company
+        account_codes = codes['Compte']
+        journal_codes = codes['Journal']
+        partner_refs = codes['Tiers']
+
+        accounts = {}
+        if account_codes:
+            for account in self.env['account.account'].search_read([
+                ('code', 'in', list(account_codes)),
+                ('company_id', '=', company.id),
+            ], ['code']):
+                accounts.setdefault(account['code'], account['id'])
+
+        journals = {}
+        if journal_codes:
+            for journal in self.env['account.journal'].search_read([
+                ('code', 'in', list(journal_codes)),
+                ('company_id', '=', company.id),
+            ], ['code']):
+                journals.setdefault(journal['code'], journal['id'])
+
+        partners, ambiguous_partners = {}, {}
+        if partner_refs:
+            Partner = self.env['res.partner']
+            if partner_index is None:
+                partner_index = Partner._cm_build_match_index(company)
+            partners, ambiguous_partners = Partner._cm_match_partners(
+                partner_refs, partner_index, company, fuzzy=self.partner_fuzzy_match)
+
+        return {
+            'accounts': accounts,
+            'journals': journals,
+            'partners': partners,
+            'ambiguous_partners': ambiguous_partners,
+        }
+
+    def _check_unknown_codes(self, codes, lookups):
+        """Lister en une passe les codes du fichier absents de la société.
+
+        Retourne des erreurs au format de ``_validate_import_frame``, sans
+        numéros de ligne mais avec la colonne et la valeur du code inconnu.
+        """
+        errors = []
+        checks = [
+            ('Compte', 'accounts', 'unknown_account', _("Compte %s introuvable")),
+            ('Journal', 'journals', 'unknown_journal', _("Journal %s introuvable")),
+            ('Tiers', 'partners', 'unknown_partner', _("Tiers %s introuvable")),
+        ]
+        ambiguous = lookups.get('ambiguous_partners', {})
+        for column, key, code, message in checks:
+            if column == 'Journal' and self.journal_id:
+                # Le journal par défaut remplace les codes inconnus
+                continue
+            for value in sorted(codes[column] - set(lookups[key]) - set(ambiguous)):
+                errors.append({
+                    'reference': None,
+                    'rows': [],
+                    'code': code,
+                    'column': column,
+                    'value': value,
+                    'message': message % value,
+                })
+        for value, partner_ids in sorted(ambiguous.items()):
+            errors.append({
+                'reference': None,
+                'rows': [],
+                'code': 'ambiguous_partner',
+                'column': 'Tiers',
+                'value': value,
+                'message': _("Tiers %s ambigu: %d partenaires correspondent (ids %s)") % (
+                    value, len(partner_ids), ', '.join(map(str, partner_ids))),
+            })
+        return errors
+
+    @api.model
+    def _parse_date_column(self, series):
+        """Convertir une colonne de dates en une passe vectorisée.
+
+        Les cellules déjà typées date sont converties directement, les nombres
+        sont lus comme des numéros de série Excel et les textes sont essayés
+        successivement dans les formats de ``DATE_FORMATS``. Les valeurs
+        invalides donnent ``NaT``.
+        """
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        series = series.astype(object)
+        is_date = series.map(lambda value: isinstance(value, (datetime, date)))
+        is_number = series.map(lambda value: isinstance(value, numbers.Real) and not isinstance(value, bool))
+        is_text = series.map(lambda value: isinstance(value, str))
+        parsed = pd.to_datetime(series.where(is_date), errors='coerce')
+        serials = pd.to_numeric(series.where(is_number), errors='coerce')
+        parsed = parsed.fillna(pd.to_datetime(serials, origin=EXCEL_EPOCH, unit='D', errors='coerce'))
+        text = series.where(is_text).astype(object).str.strip()
+        for fmt in DATE_FORMATS:
+            parsed = parsed.fillna(pd.to_datetime(text, format=fmt, errors='coerce'))
+        return parsed
+
+    def _annotate_import_frame(self, df, lookups):
+        """Ajouter au DataFrame les colonnes résolues utilisées à l'import.
+
+        ``_ref`` est la clé de regroupement (la référence, ou le numéro de ligne
+        si elle est vide), ``_date`` la date convertie et ``_account_id``,
+        ``_journal_id``, ``_partner_id`` les identifiants issus de ``lookups``.
+        Sans ``lookups`` seules la clé et la date sont calculées.
+        """
+        references = df['Reference'].map(self._normalize_code)
+        df['_ref'] = references.where(references != '', pd.Series(df.index, index=df.index))
+        df['_date'] = self._parse_date_column(df['Date'])
+        if lookups is None:
+            return df
+
+        df['_account_id'] = df['Compte'].map(self._normalize_code).map(lookups['accounts'])
+        journal_ids = df['Journal'].map(self._normalize_code).map(lookups['journals'])
+        if self.journal_id:
+            journal_ids = journal_ids.fillna(self.journal_id.id)
+        df['_journal_id'] = journal_ids
+        if 'Tiers' in df.columns:
+            df['_partner_id'] = df['Tiers'].map(self._normalize_code).map(lookups['partners'])
+        else:
+            df['_partner_id'] = None
+        return df
+
+    def _validate_import_frame(self, df, lookups=None):
+        """Valider tout le DataFrame annoté en une seule passe vectorisée.
+
+        Retourne la table des erreurs sous forme de liste de dictionnaires
+        ``{'reference', 'rows', 'code', 'message'}``, où ``rows`` sont les
+        numéros de ligne du fichier (en-tête = ligne 1). Les contrôles de
+        comptes et journaux ne sont faits que si ``lookups`` est fourni.
+        """
+        errors = []
+
+        def add_row_errors(mask, code, message_fn):
+            for index, ref, value in zip(df.index[mask], df['_ref'][mask], message_fn(df[mask])):
+                errors.append({
+                    'reference': str(ref),
+                    'rows': [int(index) + 2],
+                    'code': code,
+                    'message': value,
+                })
+
+        add_row_errors(df['_date'].isna().values, 'invalid_date',
+                       lambda rows: [_("Format de date invalide: %s") % value for value in rows['Date']])
+        if '_invalid_amount' in df.columns:
+            add_row_errors(df['_invalid_amount'].notna().values, 'invalid_amount',
+                           lambda rows: [_("Montant invalide: %s") % value for value in rows['_invalid_amount']])
+        if lookups is not None:
+            add_row_errors(df['_account_id'].isna().values, 'unknown_account',
+                           lambda rows: [_("Compte %s introuvable") % value for value in rows['Compte']])
+            missing_journal = df['_journal_id'].isna().values
+        else:
+            # Sans correspondances, seuls les journaux absents sont détectables
+            missing_journal = (df['Journal'].map(self._normalize_code) == '').values & (not self.journal_id)
+        add_row_errors(missing_journal, 'unknown_journal',
+                       lambda rows: [_("Journal non spécifié")] * len(rows))
+
+        totals = df.groupby('_ref', sort=False)[['Debit', 'Credit']].sum()
+        unbalanced = totals[(totals['Debit'] - totals['Credit']).abs() > 0.01]
+        if not unbalanced.empty:
+            rows_by_ref = self._frame_row_numbers(df)
+            for ref, total in unbalanced.iterrows():
+                errors.append({
+                    'reference': str(ref),
+                    'rows': [int(row) for row in rows_by_ref[ref]],
+                    'code': 'unbalanced',
+                    'message': _("Écriture déséquilibrée: Débit=%.2f, Crédit=%.2f") % (total['Debit'], total['Credit']),
+                })
+
+        return errors
+
+    def _prepare_moves_from_frame(self, df):
+        """Construire les valeurs des écritures d'un DataFrame annoté et validé.
+
+        Parcourt les colonnes une seule fois et retourne une liste de couples
+        ``(référence, vals)`` dans l'ordre du fichier. Chaque écriture prend la
+        date et le journal de sa première ligne. Les exercices fiscaux doivent
+        avoir été créés au préalable avec ``_ensure_fiscal_years``.
+        """
+        moves = {}
+        references = df['Reference'].map(self._normalize_code)
+        columns = zip(
+            df['_ref'], references, df['_date'], df['_journal_id'], df['_account_id'],
+            df['_partner_id'], df['Libelle'], df['Debit'], df['Credit'],
+        )
+        for key, reference, move_date, journal_id, account_id, partner_id, label, debit, credit in columns:
+            move_vals = moves.get(key)
+            if move_vals is None:
+                move_date = move_date.date()
+                move_vals = moves[key] = {
+                    'journal_id': int(journal_id),
+                    'date': move_date,
+                    'ref': reference,
+                    'line_ids': [],
+                }
+            move_vals['line_ids'].append((0, 0, {
+                'account_id': int(account_id),
+                'name': str(label),
+                'debit': float(debit),
+                'credit': float(credit),
+                'partner_id': int(partner_id) if not pd.isna(partner_id) else False,
+            }))
+
+        for move_vals in moves.values():
+            # Sans référence, deux écritures identiques du fichier sont légitimes
+            if move_vals['ref']:
+                move_vals['import_fingerprint'] = self._compute_move_fingerprint(move_vals)
+        return list(moves.items())
+
+    @api.model
+    def _frame_row_numbers(self, df):
+        """Numéros de ligne du fichier de chaque groupe, par clé ``_ref``"""
+        return pd.Series(df.index + 2, index=df.index).groupby(df['_ref'], sort=False).agg(list).to_dict()
+
+    @api.model
+    def _creation_errors(self, failures, rows_by_key):
+        """Convertir les échecs ``(référence, message)`` de création en table d'erreurs"""
+        return [{
+            'reference': str(key),
+            'rows': [int(row) for row in rows_by_key.get(key, [])],
+            'code': 'creation_failed',
+            'message': message,
+        } for key, message in failures]
+
+    @api.model
+    def _compute_move_fingerprint(self, move_vals):
+        """Empreinte SHA-256 du journal, de la date, de la référence et des lignes.
+
+        Les lignes sont normalisées (montants arrondis au centime) et triées, de
+        sorte que leur ordre dans le fichier ne change pas l'empreinte.
+        """
+        lines = sorted(
+            '%s|%s|%.2f|%.2f|%s' % (
+                line['account_id'], line['partner_id'] or 0,
+                line['debit'], line['credit'], ' '.join(line['name'].split()))
+            for command, dummy, line in move_vals['line_ids']
+        )
+        payload = '\n'.join([
+            str(move_vals['journal_id']),
+            move_vals['date'].isoformat(),
+            move_vals['ref'],
+        ] + lines)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _filter_imported_moves(self, prepared):
+        """Écarter les écritures dont l'empreinte existe déjà.
+
+        Une seule requête par lot de ``batch_size``; les doublons à l'intérieur
+        du lot sont aussi écartés. Les écritures sans référence n'ont pas
+        d'empreinte et sont toujours créées. Retourne ``(à créer, nombre ignoré)``.
+        """
+        batch_size = max(self.batch_size or 1, 1)
+        to_create = []
+        seen = set()
+        for start in range(0, len(prepared), batch_size):
+            chunk = prepared[start:start + batch_size]
+            fingerprints = [vals['import_fingerprint'] for ref, vals in chunk if vals.get('import_fingerprint')]
+            seen.update(move['import_fingerprint'] for move in self.env['account.move'].search_read([
+                ('import_fingerprint', 'in', fingerprints),
+                ('company_id', '=', self.env.company.id),
+            ], ['import_fingerprint']))
+            for ref, vals in chunk:
+                if not vals.get('import_fingerprint'):
+                    to_create.append((ref, vals))
+                elif vals['import_fingerprint'] not in seen:
+                    seen.add(vals['import_fingerprint'])
+                    to_create.append((ref, vals))
+        return to_create, len(prepared) - len(to_create)
+
+    def _create_moves_batched(self, prepared):
+        """Créer les écritures par lots de ``batch_size``.
+
+        ``prepared`` est une liste de couples ``(référence, vals)``. Les
+        écritures déjà importées (même empreinte) sont ignorées. Chaque lot
+        est créé dans son propre savepoint; un lot en échec est rejoué écriture
+        par écriture afin de conserver une erreur précise par référence.
+        Retourne le nombre d'écritures créées, le nombre d'écritures ignorées
+        et la liste des erreurs.
+        """
+        AccountMove = self.env['account.move']
+        batch_size = max(self.batch_size or 1, 1)
+        created_count = 0
+        errors = []
+        prepared, skipped_count = self._filter_imported_moves(prepared)
+
+        for start in range(0, len(prepared), batch_size):
+            chunk = prepared[start:start + batch_size]
+            try:
+                with self.env.cr.savepoint():
+                    AccountMove.create([vals for ref, vals in chunk])
+                created_count += len(chunk)
+                continue
+            except Exception as e:
+                _logger.info(f"Lot d'import en échec ({e}), reprise écriture par écriture")
+
+            for ref, vals in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        AccountMove.create(vals)
+                    created_count += 1
+                except Exception as e:
+                    errors.append((ref, str(e)))
+
+        return created_count, skipped_count, errors
+
+    def _import_error_domain(self):
+        return [('res_model', '=', self._name), ('res_id', 'in', self.ids)]
+
+    def _store_import_errors(self, errors):
+        """Enregistrer en masse des erreurs et mettre à jour le compteur"""
+        self.ensure_one()
+        if errors:
+            self.env['account.move.import.error']._bulk_create(self, errors)
+            self.error_count += len(errors)
+
+    def _clear_import_errors(self):
+        self.env['account.move.import.error'].search(self._import_error_domain()).unlink()
+        self.write({'error_count': 0, 'error_log': False})
+
+    def unlink(self):
+        self.env['account.move.import.error'].search(self._import_error_domain()).unlink()
+        return super().unlink()
+
+    def action_view_import_errors(self):
+        """Ouvrir la liste paginée et filtrable des erreurs"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Erreurs d'importation"),
+            'res_model': 'account.move.import.error',
+            'view_mode': 'tree,form',
+            'domain': self._import_error_domain(),
+            'context': {'search_default_group_error_code': 1},
+        }
+
+    def action_export_import_errors(self):
+        """Exporter les seules lignes en erreur, annotées, dans un fichier XLSX.
+
+        Le fichier garde les colonnes d'origine et ajoute le numéro de ligne et
+        les messages d'erreur: une fois corrigé, il peut être réimporté tel quel.
+        """
+        self.ensure_one()
+        if openpyxl is None:
+            raise UserError(_("La librairie openpyxl est requise pour exporter les erreurs."))
+        errors = self.env['account.move.import.error'].search(self._import_error_domain())
+        if not errors:
+            raise UserError(_("Aucune erreur à exporter."))
+
+        messages_by_row = defaultdict(list)
+        messages_by_value = defaultdict(list)
+        for error in errors:
+            rows = error._get_rows()
+            for row in rows:
+                messages_by_row[row].append(error.message)
+            if not rows and error.column_name:
+                messages_by_value[(error.column_name, error.value)].append(error.message)
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(_("Lignes en erreur"))
+        header = None
+        for index, values in self._iter_import_rows():
+            if header is None:
+                header = list(values)
+                sheet.append(header + [_("Ligne du fichier"), _("Erreurs")])
+            row = index + 2
+            messages = list(messages_by_row.get(row, []))
+            for column, value in ((column, self._normalize_code(values.get(column))) for column in ('Compte', 'Journal', 'Tiers')):
+                messages += messages_by_value.get((column, value), [])
+            if messages:
+                sheet.append([values.get(column) for column in header] + [row, '\n'.join(messages)])
+
+        output = io.BytesIO()
+        workbook.save(output)
+        filename = '%s_erreurs.xlsx' % (self.filename or 'import').rsplit('.', 1)[0]
+        attachment = self.env['ir.attachment'].create({
+            'name': filename,
+            'type': 'binary',
+            'raw': output.getvalue(),
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    def _get_or_create_fiscal_year(self, move_date):
+        """Retourne ou crée un cm.fiscal.year couvrant la date donnée."""
+        year_ids = self._ensure_fiscal_years({move_date})
+        return self.env['cm.fiscal.year'].browse(year_ids[move_date])
+
+    def _ensure_fiscal_years(self, dates):
+        """Créer en une fois les exercices manquants pour les dates données"""
+        return self.env['cm.fiscal.year']._ensure_covering_years(self.env.company, dates)
+
+    @api.model
+    def _frame_move_dates(self, df):
+        """Dates distinctes d'un DataFrame annoté"""
+        return set(df['_date'].dropna().dt.date.unique())
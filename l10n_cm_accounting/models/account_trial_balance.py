@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""SYSCOHADA trial balance rolled up through the prefix tree of account codes."""
+
+from odoo import models, api, tools
+from odoo.tools.misc import file_path
+from lxml import etree
+from datetime import date, timedelta
+
+CHART_TEMPLATE = 'l10n_cm_accounting/data/account.account.template.xml'
+
+# Comptes principaux (2 chiffres) du plan SYSCOHADA révisé, par classe
+SYSCOHADA_CHAPTERS = frozenset(
+    [f'1{digit}' for digit in range(10)]
+    + [f'2{digit}' for digit in range(10)]
+    + [f'3{digit}' for digit in range(1, 10)]
+    + [f'4{digit}' for digit in range(10)]
+    + [f'5{digit}' for digit in range(10)]
+    + [f'6{digit}' for digit in range(10)]
+    + ['70', '71', '72', '73', '75', '77', '78', '79']
+    + [f'8{digit}' for digit in range(1, 10)]
+    + [f'9{digit}' for digit in range(10)]
+)
+
+# Niveaux de regroupement: classe, compte principal, divisionnaire, sous-compte
+ROLLUP_LEVELS = (1, 2, 3, 4)
+
+BALANCE_COLUMNS = (
+    'opening_debit', 'opening_credit', 'debit', 'credit', 'closing_debit', 'closing_credit',
+)
+
+
+class AccountTrialBalance(models.AbstractModel):
+    _name = 'account.trial.balance'
+    """Balance générale: one aggregate query, then a linear rollup over code prefixes."""
+    _description = "Balance générale SYSCOHADA"
+
+    @api.model
+    @tools.ormcache()
+    def _get_plan_names(self):
+        """Intitulés ``{code: nom}`` des comptes du plan livré avec le module"""
+        tree = etree.parse(file_path(CHART_TEMPLATE))
+        return {
+            record.findtext("field[@name='code']"): record.findtext("field[@name='name']")
+            for record in tree.iterfind(".//record[@model='account.account.template']")
+        }
+
+    @api.model
+    def _check_plan_code(self, code):
+        """Motif pour lequel un code est hors plan SYSCOHADA, ou ``False``"""
+        if not code or not code.isdigit():
+            return 'format'
+        if code[0] == '0':
+            return 'class'
+        if code[:2] not in SYSCOHADA_CHAPTERS and code[:2] not in self._get_plan_names():
+            return 'chapter'
+        return False
+
+    @api.model
+    def _find_accounts_outside_plan(self, company):
+        """Comptes de la société hors plan SYSCOHADA: ``{compte: motif}``"""
+        accounts = self.env['account.account'].search([('company_id', '=', company.id)])
+        return {
+            account: reason for account in accounts
+            if (reason := self._check_plan_code(account.code))
+        }
+
+    @api.model
+    def _aggregate_leaves(self, company, date_from, date_to):
+        """Une requête groupée: ``{account_id: (ouv. débit, ouv. crédit, débit, crédit)}``.
+
+        Les périodes en mois entiers sont lues dans les soldes mensuels. Le
+        solde d'ouverture des classes 6 à 8 ne porte que sur l'exercice en
+        cours (à partir du 1er janvier de ``date_from``).
+        """
+        if date_from.day == 1 and (date_to + timedelta(days=1)).day == 1:
+            source = """
+                SELECT account_id, month AS date, debit, credit
+                  FROM account_balance_monthly
+                 WHERE company_id = %(company_id)s
+                   AND analytic_account_id IS NULL
+                   AND month <= %(date_to)s
+            """
+        else:
+            self.env['account.move.line'].flush_model()
+            source = """
+                SELECT account_id, date, debit, credit
+                  FROM account_move_line
+                 WHERE company_id = %(company_id)s
+                   AND parent_state = 'posted'
+                   AND date <= %(date_to)s
+                   AND account_id IS NOT NULL
+                   AND COALESCE(display_type, 'product') NOT IN ('line_section', 'line_note')
+            """
+        self.env.cr.execute(f"""
+            SELECT source.account_id,
+                   SUM(CASE WHEN flags.opening THEN source.debit ELSE 0 END),
+                   SUM(CASE WHEN flags.opening THEN source.credit ELSE 0 END),
+                   SUM(CASE WHEN source.date >= %(date_from)s THEN source.debit ELSE 0 END),
+                   SUM(CASE WHEN source.date >= %(date_from)s THEN source.credit ELSE 0 END)
+              FROM ({source}) AS source,
+           LATERAL (SELECT source.date < %(date_from)s
+                           AND (source.account_id <> ALL(%(income_statement)s)
+                                OR source.date >= %(year_start)s) AS opening) AS flags
+          GROUP BY source.account_id
+        """, {
+            'company_id': company.id,
+            'date_from': date_from,
+            'date_to': date_to,
+            'year_start': date(date_from.year, 1, 1),
+            'income_statement': list(self.env['account.account']._get_role_account_ids(
+                company.id, 'income_statement')),
+        })
+        return {
+            account_id: tuple(float(amount or 0.0) for amount in amounts)
+            for account_id, *amounts in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _compute_trial_balance(self, company, date_from, date_to):
+        """Balance générale de la période, du niveau classe au compte de détail.
+
+        Les soldes des comptes de détail sont agrégés une seule fois, puis
+        ajoutés à chacun de leurs préfixes (``1`` → ``10`` → ``101`` → ``1010``):
+        le regroupement est linéaire en nombre de comptes. Retourne des lignes
+        triées par code (un préfixe précède ses descendants) avec les colonnes
+        ``BALANCE_COLUMNS``, le niveau (longueur du préfixe), l'intitulé,
+        ``leaf`` pour les comptes de détail et leur motif hors plan.
+        """
+        leaves = self._aggregate_leaves(company, date_from, date_to)
+        accounts = {
+            account['id']: account
+            for account in self.env['account.account'].search_read([('id', 'in', list(leaves))], ['code', 'name'])
+        }
+        plan_names = self._get_plan_names()
+        nodes = {}
+
+        for account_id, (opening_debit, opening_credit, debit, credit) in leaves.items():
+            code = accounts[account_id]['code']
+            opening = opening_debit - opening_credit
+            closing = opening + debit - credit
+            values = (
+                max(opening, 0.0), max(-opening, 0.0), debit, credit, max(closing, 0.0), max(-closing, 0.0),
+            )
+            prefixes = [code[:level] for level in ROLLUP_LEVELS if level < len(code)] + [code]
+            for prefix in prefixes:
+                node = nodes.get(prefix)
+                if node is None:
+                    node = nodes[prefix] = {
+                        'code': prefix,
+                        'name': plan_names.get(prefix, ''),
+                        'level': len(prefix),
+                        'leaf': False,
+                        'out_of_plan': False,
+                        **dict.fromkeys(BALANCE_COLUMNS, 0.0),
+                    }
+                for column, amount in zip(BALANCE_COLUMNS, values):
+                    node[column] += amount
+            leaf = nodes[code]
+            leaf.update(name=accounts[account_id]['name'], leaf=True, out_of_plan=self._check_plan_code(code))
+
+        return [nodes[code] for code in sorted(nodes)]
@@ -1,5 +1,7 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from bisect import bisect_right
+from datetime import date, timedelta
 
 
 class CmFiscalYear(models.Model):
@@ -34,3 +36,80 @@ class CmFiscalYear(models.Model):
                 raise ValidationError(_("L'exercice est d\u00e9j\u00e0 cl\u00f4tur\u00e9."))
             record.state = 'closed'
 
+    @api.model
+    def _ensure_covering_years(self, company, dates):
+        """Retourner ``{date: id d'exercice}`` en créant d'un coup les exercices manquants.
+
+        Les exercices existants de la société sont chargés une fois dans un
+        index d'intervalles trié (recherche par bissection), ce qui respecte
+        les exercices décalés déjà définis. Chaque date non couverte reçoit un
+        exercice civil, réduit si nécessaire pour ne pas chevaucher les
+        exercices voisins. Un verrou transactionnel par société, pris
+        seulement s'il manque des exercices, évite que deux imports
+        concurrents créent le même exercice.
+        """
+        dates = set(dates)
+        if not dates:
+            return {}
+
+        index = self._get_interval_index(company)
+        result, missing = self._split_covered_dates(index, dates)
+        if missing:
+            # Relire les exercices une fois le verrou obtenu: un import
+            # concurrent a pu créer les exercices manquants entre-temps
+            self.env.cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s), %s)", [self._name, company.id])
+            index = self._get_interval_index(company)
+            covered, missing = self._split_covered_dates(index, missing)
+            result.update(covered)
+
+        if missing:
+            starts = [start for start, end, year_id in index]
+            candidates = {}
+            for day in missing:
+                position = bisect_right(starts, day)
+                date_start = date(day.year, 1, 1)
+                date_end = date(day.year, 12, 31)
+                if position > 0:
+                    date_start = max(date_start, index[position - 1][1] + timedelta(days=1))
+                if position < len(index):
+                    date_end = min(date_end, index[position][0] - timedelta(days=1))
+                candidates[(date_start, date_end)] = str(day.year)
+
+            self.sudo().create([{
+                'name': name,
+                'date_start': date_start,
+                'date_end': date_end,
+                'company_id': company.id,
+            } for (date_start, date_end), name in sorted(candidates.items())])
+
+            index = self._get_interval_index(company)
+            for day in missing:
+                result[day] = self._find_in_index(index, day)
+
+        return result
+
+    @api.model
+    def _get_interval_index(self, company):
+        """Liste triée ``(date_start, date_end, id)`` des exercices de la société"""
+        years = self.sudo().search_read(
+            [('company_id', '=', company.id)], ['date_start', 'date_end'], order='date_start')
+        return [(year['date_start'], year['date_end'], year['id']) for year in years]
+
+    @api.model
+    def _split_covered_dates(self, index, dates):
+        """Séparer ``dates`` en ``{date: id d'exercice}`` couvertes et dates sans exercice"""
+        covered, missing = {}, set()
+        for day in dates:
+            year_id = self._find_in_index(index, day)
+            if year_id:
+                covered[day] = year_id
+            else:
+                missing.add(day)
+        return covered, missing
+
+    @api.model
+    def _find_in_index(self, index, day):
+        position = bisect_right([start for start, end, year_id in index], day) - 1
+        if position >= 0 and index[position][1] >= day:
+            return index[position][2]
+        return False
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""Stored fiscal declarations, one per company, type and period."""
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from datetime import date, timedelta
+import logging
+import time
+
+from .fiscal_declaration_mixin import DECLARATION_PERIODS, RESULT_FIELDS
+
+_logger = logging.getLogger(__name__)
+
+# Durée maximale (secondes) d'un passage du CRON de rendu avant de rendre la main
+PDF_TIME_LIMIT = 120
+
+# Nombre de déclarations rendues par transaction
+PDF_BATCH_SIZE = 50
+
+QUARTERS = [(1, 3), (4, 6), (7, 9), (10, 12)]
+
+
+def _month_end(year, month):
+    return (date(year, 12, 31) if month == 12
+            else date(year, month + 1, 1) - timedelta(days=1))
+
+
+def declaration_periods(period_type, year):
+    """Périodes ``(libellé, date de début, date de fin)`` d'une périodicité sur l'année"""
+    if period_type == 'annual':
+        return [(str(year), date(year, 1, 1), date(year, 12, 31))]
+    if period_type == 'quarterly':
+        return [(f"{year}-T{index + 1}", date(year, start, 1), _month_end(year, end))
+                for index, (start, end) in enumerate(QUARTERS)]
+    return [(f"{year}-{month:02d}", date(year, month, 1), _month_end(year, month))
+            for month in range(1, 13)]
+
+
+class FiscalDeclaration(models.Model):
+    _name = 'fiscal.declaration'
+    _inherit = ['fiscal.declaration.mixin']
+    """Computed declaration kept in the database, usually produced by a batch run."""
+    _description = "Déclaration fiscale"
+    _order = 'fiscal_year desc, company_id, declaration_type, date_from'
+
+    period_label = fields.Char(string="Période", required=True)
+    run_id = fields.Many2one('fiscal.declaration.run', string="Dernier lot de calcul",
+                             ondelete='set null', index=True, readonly=True)
+    state = fields.Selection([
+        ('draft', 'Brouillon'),
+        ('queued', 'En attente'),
+        ('computed', 'Calculé'),
+        ('error', 'Erreur'),
+        ('submitted', 'Soumis'),
+    ], string="État", default='draft', required=True, index=True)
+    error_log = fields.Text(string="Erreur", readonly=True)
+    vat_line_ids = fields.One2many('fiscal.declaration.vat.line', 'declaration_id', string="TVA par taxe",
+                                   readonly=True)
+    withholding_line_ids = fields.One2many('fiscal.declaration.withholding.line', 'declaration_id',
+                                           string="Registre des retenues", readonly=True)
+
+    # Rendu PDF en arrière-plan
+    pdf_state = fields.Selection([
+        ('none', 'Non demandé'),
+        ('queued', 'En file d\'attente'),
+        ('done', 'Prêt'),
+        ('error', 'Erreur'),
+    ], string="PDF", default='none', required=True, index=True, copy=False)
+    pdf_attachment_id = fields.Many2one('ir.attachment', string="Fichier PDF", readonly=True, copy=False,
+                                        ondelete='set null')
+    pdf_requested_by = fields.Many2one('res.users', string="PDF demandé par", readonly=True, copy=False)
+    pdf_error = fields.Text(string="Erreur de rendu", readonly=True, copy=False)
+
+    _sql_constraints = [
+        ('period_uniq', 'unique(company_id, declaration_type, date_from, date_to)',
+         "Une seule déclaration par société, type et période."),
+    ]
+
+    @api.model
+    def _prepare_batch(self, companies, declaration_types, year, period_end=None):
+        """Déclarations de l'année pour ces sociétés et types, créées si besoin.
+
+        ``period_end`` limite le lot aux périodes se terminant à cette date
+        (le mois écoulé, et le trimestre ou l'année qu'il clôt). Retourne
+        toutes les déclarations concernées, y compris celles déjà soumises
+        que l'appelant ne doit pas recalculer.
+        """
+        type_labels = dict(self._fields['declaration_type'].selection)
+        domain = [
+            ('company_id', 'in', companies.ids),
+            ('declaration_type', 'in', declaration_types),
+            ('fiscal_year', '=', year),
+        ]
+        if period_end:
+            domain.append(('date_to', '=', period_end))
+        existing = {
+            (declaration.company_id.id, declaration.declaration_type, declaration.date_from): declaration
+            for declaration in self.search(domain)
+        }
+        to_create = []
+        for company in companies:
+            for declaration_type in declaration_types:
+                period_type = DECLARATION_PERIODS[declaration_type]
+                for label, date_from, date_to in declaration_periods(period_type, year):
+                    if period_end and date_to != period_end:
+                        continue
+                    if (company.id, declaration_type, date_from) in existing:
+                        continue
+                    to_create.append({
+                        'name': f"{type_labels[declaration_type]} {label} - {company.name}",
+                        'company_id': company.id,
+                        'declaration_type': declaration_type,
+                        'period_type': period_type,
+                        'period_label': label,
+                        'fiscal_year': year,
+                        'date_from': date_from,
+                        'date_to': date_to,
+                    })
+        return self.browse([declaration.id for declaration in existing.values()]) | self.create(to_create)
+
+    @api.model
+    def _store_from_wizard(self, wizard):
+        """Déclaration enregistrée correspondant à un assistant calculé, mise à jour de ses résultats"""
+        declaration = self.search([
+            ('company_id', '=', wizard.company_id.id),
+            ('declaration_type', '=', wizard.declaration_type),
+            ('date_from', '=', wizard.date_from),
+            ('date_to', '=', wizard.date_to),
+        ], limit=1)
+        values = {field: wizard[field] for field in RESULT_FIELDS}
+        values['vat_line_ids'] = [(5, 0, 0)] + [(0, 0, line) for line in wizard.vat_line_ids._get_line_values()]
+        values['withholding_line_ids'] = [(5, 0, 0)] + [
+            (0, 0, line) for line in wizard.withholding_line_ids._get_line_values()]
+        if declaration:
+            if declaration.state == 'submitted':
+                raise UserError(_("La déclaration %s a déjà été soumise.") % declaration.name)
+            declaration.write(dict(values, state='computed', error_log=False))
+            return declaration
+        label = next((label for label, date_from, date_to
+                      in declaration_periods(wizard.period_type, wizard.date_from.year)
+                      if (date_from, date_to) == (wizard.date_from, wizard.date_to)),
+                     f"{wizard.date_from} - {wizard.date_to}")
+        return self.create(dict(
+            values,
+            name=wizard.name,
+            company_id=wizard.company_id.id,
+            declaration_type=wizard.declaration_type,
+            period_type=wizard.period_type,
+            period_label=label,
+            fiscal_year=wizard.fiscal_year,
+            date_from=wizard.date_from,
+            date_to=wizard.date_to,
+            state='computed',
+        ))
+
+    def _get_pdf_filename(self):
+        self.ensure_one()
+        return f"{self.declaration_type}_{self.period_label}_{self.company_id.id}.pdf"
+
+    def action_generate_pdf(self):
+        """Placer les déclarations dans la file de rendu PDF"""
+        if any(declaration.state not in ('computed', 'submitted') for declaration in self):
+            raise UserError(_("Veuillez d'abord calculer la déclaration."))
+        self.write({'pdf_state': 'queued', 'pdf_error': False, 'pdf_requested_by': self.env.uid})
+        cron = self.env.ref('l10n_cm_accounting.ir_cron_fiscal_declaration_pdf', raise_if_not_found=False)
+        if cron and cron.active:
+            cron._trigger()
+        return True
+
+    @api.model
+    def _cron_render_pdfs(self):
+        """Rendre les PDF en attente par lots validés (appelé par CRON)"""
+        deadline = time.monotonic() + PDF_TIME_LIMIT
+        while time.monotonic() < deadline:
+            self.env.cr.execute("""
+                SELECT id FROM fiscal_declaration
+                 WHERE pdf_state = 'queued'
+              ORDER BY declaration_type, id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, [PDF_BATCH_SIZE])
+            ids = [declaration_id for declaration_id, in self.env.cr.fetchall()]
+            if not ids:
+                return
+            try:
+                self.browse(ids)._render_pdfs()
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("Erreur de rendu des déclarations %s", ids)
+                self.browse(ids).write({'pdf_state': 'error', 'pdf_error': str(e)})
+            self.env.cr.commit()
+        # Reprendre lors du prochain passage
+        self.env.ref('l10n_cm_accounting.ir_cron_fiscal_declaration_pdf')._trigger()
+
+    def _render_pdfs(self):
+        """Rendre les PDF et les enregistrer en pièces jointes.
+
+        Les déclarations d'un même type sont rendues ensemble: le moteur PDF
+        n'est lancé qu'une fois par rapport, puis le document est découpé par
+        déclaration.
+        """
+        Report = self.env['ir.actions.report']
+        Attachment = self.env['ir.attachment']
+        for declaration_type in set(self.mapped('declaration_type')):
+            declarations = self.filtered(lambda declaration: declaration.declaration_type == declaration_type)
+            streams = Report._render_qweb_pdf_prepare_streams(
+                f'l10n_cm_accounting.action_report_{declaration_type}', {'report_type': 'pdf'}, declarations.ids)
+            for declaration in declarations:
+                stream = streams.get(declaration.id, {}).get('stream')
+                if not stream:
+                    declaration.write({'pdf_state': 'error', 'pdf_error': _("Document absent du rendu groupé.")})
+                    continue
+                attachment = Attachment.create({
+                    'name': declaration._get_pdf_filename(),
+                    'raw': stream.getvalue(),
+                    'mimetype': 'application/pdf',
+                    'res_model': self._name,
+                    'res_id': declaration.id,
+                })
+                stream.close()
+                previous = declaration.pdf_attachment_id
+                declaration.write({'pdf_attachment_id': attachment.id, 'pdf_state': 'done', 'pdf_error': False})
+                previous.unlink()
+        self._notify_pdf_ready()
+
+    def _notify_pdf_ready(self):
+        """Prévenir les demandeurs que leurs PDF sont prêts"""
+        for user in self.filtered(lambda declaration: declaration.pdf_state == 'done').pdf_requested_by:
+            count = len(self.filtered(lambda declaration: declaration.pdf_requested_by == user))
+            self.env['bus.bus']._sendone(user.partner_id, 'simple_notification', {
+                'type': 'success',
+                'message': _("%d PDF de déclaration prêts.") % count,
+                'sticky': False,
+            })
+
+    def action_download_pdf(self):
+        """Télécharger le PDF rendu"""
+        self.ensure_one()
+        if self.pdf_state != 'done':
+            raise UserError(_("Le PDF de la déclaration n'est pas encore prêt."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.pdf_attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def action_submit_declaration(self):
+        """Marquer les déclarations comme soumises"""
+        if any(declaration.state != 'computed' for declaration in self):
+            raise UserError(_("Seules les déclarations calculées peuvent être soumises."))
+        self.write({'state': 'submitted'})
+
+    def action_reset_draft(self):
+        """Remettre les déclarations en brouillon pour un nouveau calcul"""
+        self.filtered(lambda declaration: declaration.state != 'queued').write({'state': 'draft', 'error_log': False})
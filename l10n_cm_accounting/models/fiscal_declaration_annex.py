@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+"""Detailed declaration annexes streamed from the database to XML, CSV or XLSX."""
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+from odoo.tools.misc import file_path
+from lxml import etree
+import csv
+import hashlib
+import os
+import shutil
+import tempfile
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from .fiscal_withholding_register import WITHHOLDING_REGISTER
+
+ANNEX_SCHEMA = 'l10n_cm_accounting/data/xsd/declaration_annexes.xsd'
+
+# Lignes lues par FETCH sur le curseur serveur
+ANNEX_FETCH_SIZE = 5000
+
+# Lignes de données par feuille XLSX (limite du format: 1 048 576 lignes)
+XLSX_MAX_ROWS = 1048575
+
+# Longueur maximale des colonnes de type Texte du schéma (xs:maxLength)
+ANNEX_TEXT_LENGTH = 256
+
+# Taille des blocs lus pour l'empreinte du fichier exporté
+ANNEX_CHUNK_SIZE = 1024 * 1024
+
+# Lignes comptabilisées de la période
+PERIOD_LINES = """
+    SELECT line.move_id, line.partner_id, line.account_id, line.debit, line.credit
+      FROM account_move_line line
+     WHERE line.company_id = %(company_id)s
+       AND line.parent_state = 'posted'
+       AND line.date BETWEEN %(date_from)s AND %(date_to)s
+"""
+
+PARTNER_TOTALS = f"""
+    SELECT COALESCE(partner.taxpayer_identifier, ''), LEFT(COALESCE(partner.name, ''), 256),
+           COUNT(DISTINCT line.move_id), SUM(line.debit), SUM(line.credit)
+      FROM ({PERIOD_LINES}) line
+ LEFT JOIN res_partner partner ON partner.id = line.partner_id
+     WHERE line.account_id = ANY(%(account_ids)s)
+  GROUP BY partner.id
+  ORDER BY partner.name, partner.id
+"""
+
+# Annexe -> élément racine XML, colonnes (balise XML, en-tête, type), requête et
+# comptes passés en paramètres (paramètre -> rôle dans ACCOUNT_ROLES).
+# Les colonnes suivent l'ordre des valeurs retournées par la requête.
+ANNEXES = {
+    'withholding': {
+        'root': 'AnnexeRetenues',
+        'columns': [
+            ('NIU', "NIU", 'text'),
+            ('RaisonSociale', "Raison sociale", 'text'),
+            ('RegimeFiscal', "Régime fiscal", 'text'),
+            ('NombreEcritures', "Nombre d'écritures", 'integer'),
+            ('MontantRetenu', "Montant retenu", 'amount'),
+        ],
+        'query': f"""
+            SELECT COALESCE(register.taxpayer_identifier, ''), LEFT(COALESCE(register.name, ''), 256),
+                   COALESCE(register.tax_regime, ''), register.move_count, register.withheld_amount
+              FROM ({WITHHOLDING_REGISTER}) AS register
+          ORDER BY register.name, register.partner_id
+        """,
+        'roles': {'account_ids': 'withholding'},
+    },
+    'withholding_lines': {
+        'root': 'AnnexeRetenuesDetail',
+        'columns': [
+            ('Date', "Date", 'date'),
+            ('Numero', "Numéro", 'text'),
+            ('Libelle', "Libellé", 'text'),
+            ('NIU', "NIU", 'text'),
+            ('RaisonSociale', "Raison sociale", 'text'),
+            ('MontantRetenu', "Montant retenu", 'amount'),
+        ],
+        # Lignes lues par pages successives (pagination par clé)
+        'rows': '_iter_withholding_line_rows',
+    },
+    'vat_invoices': {
+        'root': 'AnnexeTVAFactures',
+        'columns': [
+            ('Numero', "Numéro", 'text'),
+            ('Date', "Date", 'date'),
+            ('Reference', "Référence", 'text'),
+            ('NIU', "NIU", 'text'),
+            ('RaisonSociale', "Raison sociale", 'text'),
+            ('BaseHT', "Base HT", 'amount'),
+            ('TVACollectee', "TVA collectée", 'amount'),
+            ('TVADeductible', "TVA déductible", 'amount'),
+        ],
+        'query': f"""
+            WITH invoice AS (
+                SELECT move.id, LEFT(move.name, 256) AS name, move.date, LEFT(COALESCE(move.ref, ''), 256) AS ref,
+                       COALESCE(move.partner_id, MIN(line.partner_id)) AS partner_id,
+                       SUM(CASE WHEN line.account_id = ANY(%(sales)s) THEN line.credit - line.debit
+                                WHEN line.account_id = ANY(%(expenses)s) THEN line.debit - line.credit
+                                ELSE 0 END) AS base,
+                       SUM(CASE WHEN line.account_id = ANY(%(vat_collected)s) THEN line.credit - line.debit
+                                ELSE 0 END) AS vat_collected,
+                       SUM(CASE WHEN line.account_id = ANY(%(vat_deductible)s) THEN line.debit - line.credit
+                                ELSE 0 END) AS vat_deductible
+                  FROM ({PERIOD_LINES}) line
+                  JOIN account_move move ON move.id = line.move_id
+              GROUP BY move.id
+                HAVING bool_or(line.account_id = ANY(%(vat_collected)s) OR line.account_id = ANY(%(vat_deductible)s))
+            )
+            SELECT invoice.name, invoice.date, invoice.ref,
+                   COALESCE(partner.taxpayer_identifier, ''), LEFT(COALESCE(partner.name, ''), 256),
+                   invoice.base, invoice.vat_collected, invoice.vat_deductible
+              FROM invoice
+         LEFT JOIN res_partner partner ON partner.id = invoice.partner_id
+          ORDER BY invoice.date, invoice.id
+        """,
+        'roles': {role: role for role in ('sales', 'expenses', 'vat_collected', 'vat_deductible')},
+    },
+    'trial_balance': {
+        'root': 'BalanceGenerale',
+        'columns': [
+            ('Compte', "Compte", 'text'),
+            ('Intitule', "Intitulé", 'text'),
+            ('Niveau', "Niveau", 'integer'),
+            ('SoldeOuvertureDebit', "Solde d'ouverture débiteur", 'amount'),
+            ('SoldeOuvertureCredit', "Solde d'ouverture créditeur", 'amount'),
+            ('MouvementDebit', "Mouvements débit", 'amount'),
+            ('MouvementCredit', "Mouvements crédit", 'amount'),
+            ('SoldeClotureDebit', "Solde de clôture débiteur", 'amount'),
+            ('SoldeClotureCredit', "Solde de clôture créditeur", 'amount'),
+            ('HorsPlan', "Hors plan SYSCOHADA", 'text'),
+        ],
+        # Lignes calculées en Python (regroupement par préfixe) et non par une requête
+        'rows': '_iter_trial_balance_rows',
+    },
+    'customers': {
+        'root': 'ListeClients',
+        'columns': [
+            ('NIU', "NIU", 'text'),
+            ('RaisonSociale', "Raison sociale", 'text'),
+            ('NombreEcritures', "Nombre d'écritures", 'integer'),
+            ('Debit', "Débit", 'amount'),
+            ('Credit', "Crédit", 'amount'),
+        ],
+        'query': PARTNER_TOTALS,
+        'roles': {'account_ids': 'customers'},
+    },
+    'suppliers': {
+        'root': 'ListeFournisseurs',
+        'columns': [
+            ('NIU', "NIU", 'text'),
+            ('RaisonSociale', "Raison sociale", 'text'),
+            ('NombreEcritures', "Nombre d'écritures", 'integer'),
+            ('Debit', "Débit", 'amount'),
+            ('Credit', "Crédit", 'amount'),
+        ],
+        'query': PARTNER_TOTALS,
+        'roles': {'account_ids': 'suppliers'},
+    },
+}
+
+
+class FiscalDeclarationMixin(models.AbstractModel):
+    _inherit = 'fiscal.declaration.mixin'
+    """Export of the detailed annexes of a declaration period."""
+
+    annex_type = fields.Selection([
+        ('withholding', 'Retenues à la source par fournisseur'),
+        ('withholding_lines', 'Retenues à la source, détail des écritures'),
+        ('vat_invoices', 'TVA par facture'),
+        ('trial_balance', 'Balance générale'),
+        ('customers', 'Liste des clients'),
+        ('suppliers', 'Liste des fournisseurs'),
+    ], string="Annexe", default='vat_invoices')
+    annex_format = fields.Selection([
+        ('xml', 'XML (télédéclaration)'),
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ], string="Format de l'annexe", default='xml')
+
+    def _iter_annex_rows(self, annex):
+        """Lignes de l'annexe lues par paquets sur un curseur côté serveur.
+
+        Le résultat n'est jamais chargé en entier: PostgreSQL le conserve et
+        en renvoie ``ANNEX_FETCH_SIZE`` lignes à chaque ``FETCH``.
+        """
+        self.ensure_one()
+        self.env.flush_all()
+        cr = self.env.cr
+        Account = self.env['account.account']
+        cursor_name = f"l10n_cm_annex_{self.id}"
+        cr.execute(f"DECLARE {cursor_name} NO SCROLL CURSOR FOR {annex['query']}", {
+            'company_id': self.company_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            **{param: list(Account._get_role_account_ids(self.company_id.id, role))
+               for param, role in annex.get('roles', {}).items()},
+        })
+        try:
+            while True:
+                cr.execute(f"FETCH {ANNEX_FETCH_SIZE} FROM {cursor_name}")
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cr.execute(f"CLOSE {cursor_name}")
+
+    def _iter_trial_balance_rows(self):
+        self.ensure_one()
+        for node in self._get_trial_balance():
+            yield (
+                node['code'][:ANNEX_TEXT_LENGTH], (node['name'] or '')[:ANNEX_TEXT_LENGTH], node['level'],
+                node['opening_debit'], node['opening_credit'], node['debit'], node['credit'],
+                node['closing_debit'], node['closing_credit'], (node['out_of_plan'] or '')[:ANNEX_TEXT_LENGTH],
+            )
+
+    @staticmethod
+    def _format_annex_value(value, value_type):
+        """Valeur textuelle d'une cellule (XML et CSV)"""
+        if value is None:
+            return ''
+        if value_type == 'amount':
+            return f"{value:.2f}"
+        if value_type == 'date':
+            return value.isoformat()
+        return str(value)
+
+    def _write_annex_xml(self, path, annex, rows):
+        """Écrire l'annexe élément par élément (``lxml.etree.xmlfile``)"""
+        count = 0
+        attributes = {
+            'societe': self.company_id.name[:ANNEX_TEXT_LENGTH],
+            'dateDebut': self.date_from.isoformat(),
+            'dateFin': self.date_to.isoformat(),
+        }
+        if self.company_id.vat:
+            attributes['niu'] = self.company_id.vat
+        with etree.xmlfile(path, encoding='utf-8') as xml_file:
+            xml_file.write_declaration()
+            with xml_file.element(annex['root'], attributes):
+                for row in rows:
+                    line = etree.Element('Ligne')
+                    for (tag, header, value_type), value in zip(annex['columns'], row):
+                        etree.SubElement(line, tag).text = self._format_annex_value(value, value_type)
+                    xml_file.write(line)
+                    count += 1
+        return count
+
+    def _write_annex_csv(self, path, annex, rows):
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file, delimiter=';')
+            writer.writerow([header for tag, header, value_type in annex['columns']])
+            for row in rows:
+                writer.writerow([self._format_annex_value(value, value_type)
+                                 for (tag, header, value_type), value in zip(annex['columns'], row)])
+                count += 1
+        return count
+
+    def _write_annex_xlsx(self, path, annex, rows):
+        """Écrire l'annexe en mode ``constant_memory``: chaque ligne est vidée sur disque"""
+        if xlsxwriter is None:
+            raise UserError(_("La librairie xlsxwriter est requise pour exporter en XLSX."))
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        formats = {
+            'amount': workbook.add_format({'num_format': '#,##0.00'}),
+            'date': workbook.add_format({'num_format': 'dd/mm/yyyy'}),
+        }
+        bold = workbook.add_format({'bold': True})
+        count = 0
+        sheet = None
+        row_index = XLSX_MAX_ROWS
+        try:
+            for row in rows:
+                if row_index >= XLSX_MAX_ROWS:
+                    sheet = workbook.add_worksheet()
+                    sheet.write_row(0, 0, [header for tag, header, value_type in annex['columns']], bold)
+                    row_index = 0
+                row_index += 1
+                for column, ((tag, header, value_type), value) in enumerate(zip(annex['columns'], row)):
+                    if value_type == 'amount':
+                        sheet.write_number(row_index, column, float(value or 0.0), formats['amount'])
+                    elif value_type == 'date':
+                        sheet.write_datetime(row_index, column, value, formats['date'])
+                    else:
+                        sheet.write(row_index, column, value)
+                count += 1
+            if sheet is None:
+                workbook.add_worksheet().write_row(0, 0, [header for tag, header, value_type in annex['columns']], bold)
+        finally:
+            workbook.close()
+        return count
+
+    def _validate_annex_xml(self, path):
+        """Valider le fichier contre le schéma en flux, sans construire l'arbre complet"""
+        schema = etree.XMLSchema(etree.parse(file_path(ANNEX_SCHEMA)))
+        try:
+            for event, element in etree.iterparse(path, events=('end',), tag='Ligne', schema=schema):
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        except (etree.XMLSyntaxError, etree.DocumentInvalid) as e:
+            raise UserError(_("L'annexe n'est pas conforme au schéma de télédéclaration: %s") % e)
+
+    def _create_annex_attachment(self, path, filename, count):
+        """Pièce jointe du fichier exporté, copiée par blocs dans le filestore.
+
+        Le contenu n'est jamais chargé en entier: l'empreinte est calculée
+        bloc par bloc et le fichier est copié tel quel sous son nom de
+        stockage. Seul le stockage en base impose de lire le fichier.
+        """
+        Attachment = self.env['ir.attachment']
+        values = {
+            'name': filename,
+            'res_model': self._name,
+            'res_id': self.id,
+            'description': _("%d lignes") % count,
+        }
+        if Attachment._storage() != 'file':
+            with open(path, 'rb') as annex_file:
+                return Attachment.create({**values, 'raw': annex_file.read()})
+        sha = hashlib.sha1()
+        with open(path, 'rb') as annex_file:
+            for chunk in iter(lambda: annex_file.read(ANNEX_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        checksum = sha.hexdigest()
+        store_fname = f"{checksum[:2]}/{checksum}"
+        full_path = Attachment._full_path(store_fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            shutil.copyfile(path, full_path)
+        # Fichier supprimé par le ramasse-miettes si la transaction échoue
+        Attachment._mark_for_gc(store_fname)
+        attachment = Attachment.create(values)
+        # create() ignore store_fname, file_size et checksum: renseignés directement
+        self.env.cr.execute("""
+            UPDATE ir_attachment
+               SET store_fname = %s, file_size = %s, checksum = %s
+             WHERE id = %s
+        """, (store_fname, os.path.getsize(path), checksum, attachment.id))
+        attachment.invalidate_recordset(['store_fname', 'file_size', 'checksum', 'raw', 'datas'])
+        return attachment
+
+    def action_export_annex(self):
+        """Exporter l'annexe sélectionnée et la proposer au téléchargement"""
+        self.ensure_one()
+        if not self.annex_type or not self.annex_format:
+            raise UserError(_("Sélectionnez l'annexe et le format à exporter."))
+        annex = ANNEXES[self.annex_type]
+        writer = getattr(self, f'_write_annex_{self.annex_format}')
+        filename = f"{annex['root']}_{self.date_from:%Y%m%d}_{self.date_to:%Y%m%d}.{self.annex_format}"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, filename)
+            rows = getattr(self, annex['rows'])() if 'rows' in annex else self._iter_annex_rows(annex)
+            count = writer(path, annex, rows)
+            if self.annex_format == 'xml':
+                self._validate_annex_xml(path)
+            attachment = self._create_annex_attachment(path, filename, count)
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
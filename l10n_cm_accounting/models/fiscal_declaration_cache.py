@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of computed fiscal declaration figures."""
+
+from odoo import models, fields, api
+import json
+
+
+class FiscalDeclarationCache(models.Model):
+    _name = 'fiscal.declaration.cache'
+    """Declaration results kept until the ledger of their period changes."""
+    _description = "Cache des déclarations fiscales calculées"
+    _order = 'computed_at desc'
+
+    company_id = fields.Many2one('res.company', string="Société", required=True, ondelete='cascade')
+    declaration_type = fields.Char(string="Type de déclaration", required=True)
+    date_from = fields.Date(string="Date de début", required=True)
+    date_to = fields.Date(string="Date de fin", required=True)
+    values_json = fields.Text(string="Résultats", required=True)
+    computed_at = fields.Datetime(string="Calculé le", required=True)
+
+    _sql_constraints = [
+        ('period_uniq', 'unique(company_id, declaration_type, date_from, date_to)',
+         "Une seule entrée de cache par société, type et période."),
+    ]
+
+    @api.model
+    def _lookup(self, company, declaration_type, date_from, date_to):
+        """Entrée de cache valide pour cette déclaration, ou un recordset vide"""
+        return self.sudo().search([
+            ('company_id', '=', company.id),
+            ('declaration_type', '=', declaration_type),
+            ('date_from', '=', date_from),
+            ('date_to', '=', date_to),
+        ], limit=1)
+
+    @api.model
+    def _store(self, company, declaration_type, date_from, date_to, values):
+        """Enregistrer (ou remplacer) les résultats calculés d'une déclaration"""
+        self.env.cr.execute("""
+            INSERT INTO fiscal_declaration_cache (
+                company_id, declaration_type, date_from, date_to, values_json, computed_at,
+                create_uid, write_uid, create_date, write_date
+            )
+            VALUES (%(company_id)s, %(declaration_type)s, %(date_from)s, %(date_to)s, %(values)s,
+                    NOW() AT TIME ZONE 'UTC', %(uid)s, %(uid)s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (company_id, declaration_type, date_from, date_to)
+            DO UPDATE SET values_json = EXCLUDED.values_json,
+                          computed_at = EXCLUDED.computed_at,
+                          write_uid = EXCLUDED.write_uid,
+                          write_date = EXCLUDED.write_date
+            RETURNING id
+        """, {
+            'company_id': company.id,
+            'declaration_type': declaration_type,
+            'date_from': date_from,
+            'date_to': date_to,
+            'values': json.dumps(values),
+            'uid': self.env.uid,
+        })
+        self.invalidate_model()
+        return self.sudo().browse(self.env.cr.fetchone()[0])
+
+    def _get_values(self):
+        self.ensure_one()
+        return json.loads(self.values_json)
+
+    @api.model
+    def _invalidate_moves(self, move_ids):
+        """Supprimer les entrées dont la société et la période contiennent ces écritures"""
+        if not move_ids:
+            return
+        self.env.cr.execute("""
+            DELETE FROM fiscal_declaration_cache cache
+             USING (SELECT DISTINCT company_id, date FROM account_move WHERE id IN %s) move
+             WHERE cache.company_id = move.company_id
+               AND move.date BETWEEN cache.date_from AND cache.date_to
+        """, [tuple(move_ids)])
+        if self.env.cr.rowcount:
+            self.invalidate_model()
+
+    @api.model
+    def _invalidate_companies(self, company_ids):
+        """Supprimer toutes les entrées de ces sociétés"""
+        if not company_ids:
+            return
+        self.env.cr.execute("DELETE FROM fiscal_declaration_cache WHERE company_id IN %s", [tuple(company_ids)])
+        if self.env.cr.rowcount:
+            self.invalidate_model()
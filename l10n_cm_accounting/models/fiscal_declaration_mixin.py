@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+"""Fields and computation shared by the declaration wizard and records."""
+
+from odoo import models, fields, api, _
+from datetime import datetime
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DECLARATION_TYPES = [
+    ('dsf', "Déclaration Statistique et Fiscale (DSF)"),
+    ('dipe', "Déclaration d'Impôt Provisionnel des Entreprises (DIPE)"),
+    ('is', "Impôt sur les Sociétés (IS)"),
+    ('vat_monthly', 'Déclaration TVA Mensuelle'),
+    ('withholding_tax', 'Déclaration Retenues à la Source')
+]
+
+PERIOD_TYPES = [
+    ('monthly', 'Mensuelle'),
+    ('quarterly', 'Trimestrielle'),
+    ('annual', 'Annuelle')
+]
+
+# Périodicité de chaque type de déclaration
+DECLARATION_PERIODS = {
+    'dsf': 'annual',
+    'dipe': 'quarterly',
+    'is': 'annual',
+    'vat_monthly': 'monthly',
+    'withholding_tax': 'monthly',
+}
+
+# Champs résultats d'une déclaration calculée
+RESULT_FIELDS = [
+    'total_sales', 'total_purchases', 'vat_collected', 'vat_paid', 'vat_due',
+    'withholding_tax', 'corporate_tax', 'vat_credit_previous', 'vat_credit_carried',
+    'from_cache', 'cache_date',
+]
+
+# Indicateurs d'une période: nom -> (rôle des comptes dans ACCOUNT_ROLES, sens)
+PERIOD_METRICS = {
+    'sales': ('sales', 'credit'),
+    'purchases': ('expenses', 'debit'),
+    'income': ('sales', 'credit'),
+    'expense': ('expenses', 'debit'),
+    'vat_collected': ('vat_collected', 'credit'),
+    'vat_deductible': ('vat_deductible', 'debit'),
+    'vat_collected_main': ('vat_collected_main', 'credit'),
+    'vat_deductible_main': ('vat_deductible_main', 'debit'),
+    'withholding': ('withholding', 'credit'),
+}
+
+
+class FiscalDeclarationMixin(models.AbstractModel):
+    _name = 'fiscal.declaration.mixin'
+    """Declaration period, computed amounts and the metrics they derive from."""
+    _description = "Calcul commun des déclarations fiscales"
+
+    name = fields.Char(string="Nom de la déclaration", required=True)
+    declaration_type = fields.Selection(DECLARATION_TYPES, string="Type de déclaration", required=True, default='dsf')
+    period_type = fields.Selection(PERIOD_TYPES, string="Périodicité", default='monthly')
+    fiscal_year = fields.Integer(
+        string="Exercice fiscal",
+        default=lambda self: datetime.now().year,
+        required=True
+    )
+    date_from = fields.Date(string="Date de début", required=True)
+    date_to = fields.Date(string="Date de fin", required=True)
+
+    company_id = fields.Many2one(
+        'res.company',
+        string="Société",
+        default=lambda self: self.env.company,
+        required=True
+    )
+
+    # Résultats calculés
+    total_sales = fields.Monetary(string="Total des ventes", currency_field='currency_id')
+    total_purchases = fields.Monetary(string="Total des achats", currency_field='currency_id')
+    vat_collected = fields.Monetary(string="TVA collectée", currency_field='currency_id')
+    vat_paid = fields.Monetary(string="TVA payée", currency_field='currency_id')
+    vat_due = fields.Monetary(string="TVA due", currency_field='currency_id')
+    withholding_tax = fields.Monetary(string="Retenues à la source", currency_field='currency_id')
+    corporate_tax = fields.Monetary(string="Impôt sur les sociétés", currency_field='currency_id')
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        related='company_id.currency_id',
+        readonly=True
+    )
+
+    from_cache = fields.Boolean(string="Résultats en cache", readonly=True,
+                                help="Les montants proviennent d'un calcul précédent de la même période")
+    cache_date = fields.Datetime(string="Calculé le", readonly=True)
+
+    def _compute_declarations(self):
+        """Calculer les montants des déclarations.
+
+        Les indicateurs d'une même société et période ne sont lus qu'une fois,
+        quel que soit le nombre de déclarations calculées ensemble. Les
+        résultats déjà calculés sont repris du cache tant qu'aucune écriture
+        de la période n'a changé, sauf avec ``force_recompute`` dans le contexte.
+        """
+        Cache = self.env['fiscal.declaration.cache']
+        force = self.env.context.get('force_recompute')
+        metrics_by_period = {}
+        for declaration in self:
+            company, date_from, date_to = declaration.company_id, declaration.date_from, declaration.date_to
+            cached = not force and Cache._lookup(company, declaration.declaration_type, date_from, date_to)
+            if cached:
+                declaration._write_results(cached._get_values(), from_cache=True, cache_date=cached.computed_at)
+                _logger.info("Déclaration %s lue dans le cache (%s - %s)",
+                             declaration.declaration_type, date_from, date_to)
+                continue
+
+            period = (company.id, date_from, date_to)
+            if period not in metrics_by_period:
+                metrics_by_period[period] = declaration._compute_period_metrics()
+            declaration._apply_metrics(metrics_by_period[period])
+
+    def _apply_metrics(self, metrics):
+        """Enregistrer les montants dérivés des indicateurs et les mettre en cache"""
+        self.ensure_one()
+        values = self._declaration_values_from_metrics(self.declaration_type, metrics)
+        values.update(self._compute_detail_values())
+        entry = self.env['fiscal.declaration.cache']._store(
+            self.company_id, self.declaration_type, self.date_from, self.date_to, values)
+        self._write_results(values, from_cache=False, cache_date=entry.computed_at)
+        _logger.info("Déclaration %s calculée (%s - %s): %s",
+                     self.declaration_type, self.date_from, self.date_to, values)
+        return values
+
+    def action_compute_declaration(self):
+        """Calculer les montants des déclarations"""
+        self._compute_declarations()
+        return True
+
+    def action_force_recompute(self):
+        """Recalculer la déclaration sans tenir compte du cache"""
+        return self.with_context(force_recompute=True).action_compute_declaration()
+
+    def _compute_detail_values(self):
+        """Détails de la déclaration mis en cache avec ses montants (voir ``_write_results``)"""
+        return {}
+
+    def _write_results(self, values, from_cache, cache_date):
+        """Écrire les montants calculés ou lus dans le cache"""
+        self.ensure_one()
+        self.write(dict(values, state='computed', from_cache=from_cache, cache_date=cache_date))
+
+    def _get_account_aggregates(self):
+        """Totaux débit/crédit des lignes comptabilisées de la période, par compte.
+
+        Les périodes en mois entiers sont lues dans les soldes mensuels
+        (``account.balance.monthly``), les autres par une requête groupée sur
+        les lignes de la période: la mémoire utilisée dépend du nombre de
+        comptes mouvementés et non du volume du grand livre.
+        Retourne ``{account_id: (débit, crédit)}``.
+        """
+        self.ensure_one()
+        totals = self.env['account.balance.monthly']._get_account_totals(
+            self.company_id, self.date_from, self.date_to)
+        return {account_id: (debit, credit) for account_id, (debit, credit, balance) in totals.items()}
+
+    def _sum_aggregates(self, aggregates, role, side):
+        """Somme des débits (``side='debit'``) ou crédits des comptes d'un rôle"""
+        self.ensure_one()
+        account_ids = self.env['account.account']._get_role_account_ids(self.company_id.id, role)
+        column = 0 if side == 'debit' else 1
+        return sum(totals[column] for account_id, totals in aggregates.items() if account_id in account_ids)
+
+    def _compute_period_metrics(self):
+        """Lire en un seul passage tous les indicateurs de la période.
+
+        Retourne les montants nommés de ``PERIOD_METRICS`` ainsi que les
+        totaux ``(débit, crédit)`` par classe SYSCOHADA (``'classes'``) et par
+        code de compte (``'accounts'``), d'où sont dérivées toutes les déclarations.
+        """
+        self.ensure_one()
+        return self._metrics_from_aggregates(self._get_account_aggregates())
+
+    def _compute_metrics_by_period(self, periods):
+        """Indicateurs de plusieurs périodes ``(début, fin)`` lus en une seule requête"""
+        self.ensure_one()
+        totals = self.env['account.balance.monthly']._get_account_totals_by_period(self.company_id, periods)
+        return [
+            self._metrics_from_aggregates({
+                account_id: (debit, credit) for account_id, (debit, credit, balance) in totals[index].items()
+            })
+            for index in range(len(periods))
+        ]
+
+    def _metrics_from_aggregates(self, aggregates):
+        """Indicateurs nommés, par classe et par code à partir des totaux par compte"""
+        self.ensure_one()
+        metrics = {
+            name: self._sum_aggregates(aggregates, role, side)
+            for name, (role, side) in PERIOD_METRICS.items()
+        }
+        codes = self.env['account.account']._get_account_codes(self.company_id.id)
+        classes, accounts = {}, {}
+        for account_id, (debit, credit) in aggregates.items():
+            code = codes.get(account_id, '')
+            for totals, key in ((classes, code[:1]), (accounts, code)):
+                key_debit, key_credit = totals.get(key, (0.0, 0.0))
+                totals[key] = (key_debit + debit, key_credit + credit)
+        metrics['classes'] = classes
+        metrics['accounts'] = accounts
+        return metrics
+
+    @api.model
+    def _declaration_values_from_metrics(self, declaration_type, metrics):
+        """Valeurs des champs résultats d'une déclaration à partir des indicateurs"""
+        if declaration_type == 'dsf':
+            # Déclaration Statistique et Fiscale: CA, achats et TVA des comptes 443000/445000
+            return {
+                'total_sales': metrics['sales'],
+                'total_purchases': metrics['purchases'],
+                'vat_collected': metrics['vat_collected_main'],
+                'vat_paid': metrics['vat_deductible_main'],
+                'vat_due': metrics['vat_collected_main'] - metrics['vat_deductible_main'],
+            }
+        if declaration_type == 'dipe':
+            # DIPE: 2,2% du CA du trimestre
+            dipe_rate = 0.022
+            return {
+                'total_sales': metrics['sales'],
+                'corporate_tax': metrics['sales'] * dipe_rate,
+            }
+        if declaration_type == 'is':
+            # IS = Résultat fiscal * Taux
+            # (Simplification: résultat fiscal = résultat comptable)
+            # PME (CA < 1 milliard): 25%, Grandes entreprises: 30%
+            accounting_result = metrics['income'] - metrics['expense']
+            is_rate = 0.25 if metrics['sales'] < 1000000000 else 0.30
+            return {
+                'total_sales': metrics['income'],
+                'total_purchases': metrics['expense'],
+                'corporate_tax': accounting_result * is_rate if accounting_result > 0 else 0,
+            }
+        if declaration_type == 'vat_monthly':
+            # TVA collectée (comptes 443) et déductible (comptes 445)
+            return {
+                'vat_collected': metrics['vat_collected'],
+                'vat_paid': metrics['vat_deductible'],
+                'vat_due': metrics['vat_collected'] - metrics['vat_deductible'],
+            }
+        if declaration_type == 'withholding_tax':
+            # Retenues effectuées (comptes 421)
+            return {'withholding_tax': metrics['withholding']}
+        return {}
+
+    def _get_trial_balance(self):
+        """Balance générale de la période (voir ``account.trial.balance``)"""
+        self.ensure_one()
+        return self.env['account.trial.balance']._compute_trial_balance(
+            self.company_id, self.date_from, self.date_to)
+
+    def action_check_account_plan(self):
+        """Signaler les comptes de la société hors plan SYSCOHADA"""
+        self.ensure_one()
+        outside = self.env['account.trial.balance']._find_accounts_outside_plan(self.company_id)
+        if not outside:
+            message, notification_type = _("Tous les comptes respectent le plan SYSCOHADA."), 'success'
+        else:
+            reasons = {
+                'format': _("code non numérique"),
+                'class': _("classe inconnue"),
+                'chapter': _("compte principal absent du plan"),
+            }
+            message = _("Comptes hors plan SYSCOHADA: %s") % ', '.join(
+                f"{account.code} ({reasons[reason]})" for account, reason in outside.items())
+            notification_type = 'warning'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': message,
+                'type': notification_type,
+                'sticky': bool(outside),
+            }
+        }
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+"""Batch computation of declarations across companies by cron workers."""
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from datetime import timedelta
+import logging
+import time
+
+from .fiscal_declaration_mixin import DECLARATION_TYPES
+
+_logger = logging.getLogger(__name__)
+
+# Durée maximale (secondes) d'un passage du CRON avant de rendre la main
+RUN_TIME_LIMIT = 120
+
+# CRON calculant les déclarations en parallèle (une société à la fois chacun)
+DECLARATION_WORKER_CRONS = [
+    'l10n_cm_accounting.ir_cron_fiscal_declaration_workers',
+    'l10n_cm_accounting.ir_cron_fiscal_declaration_workers_2',
+    'l10n_cm_accounting.ir_cron_fiscal_declaration_workers_3',
+    'l10n_cm_accounting.ir_cron_fiscal_declaration_workers_4',
+]
+
+
+class FiscalDeclarationRun(models.Model):
+    _name = 'fiscal.declaration.run'
+    """Every monthly, quarterly and annual declaration of a year for a set of companies."""
+    _description = "Lot de calcul de déclarations fiscales"
+    _order = 'id desc'
+
+    name = fields.Char(string="Nom", required=True)
+    user_id = fields.Many2one('res.users', string="Utilisateur", required=True, default=lambda self: self.env.user)
+    company_ids = fields.Many2many('res.company', string="Sociétés", required=True,
+                                   default=lambda self: self.env.companies)
+    fiscal_year = fields.Integer(string="Exercice fiscal", required=True,
+                                 default=lambda self: fields.Date.context_today(self).year)
+    period_end = fields.Date(string="Fin de période",
+                             help="Ne traiter que les déclarations dont la période se termine à cette date; "
+                                  "vide: toutes les déclarations de l'exercice")
+
+    include_dsf = fields.Boolean(string="DSF", default=True)
+    include_dipe = fields.Boolean(string="DIPE", default=True)
+    include_is = fields.Boolean(string="IS", default=True)
+    include_vat_monthly = fields.Boolean(string="TVA mensuelle", default=True)
+    include_withholding_tax = fields.Boolean(string="Retenues à la source", default=True)
+
+    state = fields.Selection([
+        ('draft', 'Brouillon'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('error', 'Erreur'),
+    ], string="État", default='draft', required=True, index=True)
+
+    declaration_ids = fields.One2many('fiscal.declaration', 'run_id', string="Déclarations")
+    declaration_count = fields.Integer(string="Déclarations", compute='_compute_counts')
+    computed_count = fields.Integer(string="Calculées", compute='_compute_counts')
+    queued_count = fields.Integer(string="En attente", compute='_compute_counts')
+    failed_count = fields.Integer(string="En erreur", compute='_compute_counts')
+    date_start = fields.Datetime(string="Début du traitement", readonly=True)
+    date_end = fields.Datetime(string="Fin du traitement", readonly=True)
+
+    @api.depends('declaration_ids.state')
+    def _compute_counts(self):
+        counts = {
+            (run.id, state): count
+            for run, state, count in self.env['fiscal.declaration']._read_group(
+                [('run_id', 'in', self.ids)], ['run_id', 'state'], ['__count'])
+        }
+        for run in self:
+            run.queued_count = counts.get((run.id, 'queued'), 0)
+            run.failed_count = counts.get((run.id, 'error'), 0)
+            run.computed_count = counts.get((run.id, 'computed'), 0) + counts.get((run.id, 'submitted'), 0)
+            run.declaration_count = sum(count for (run_id, state), count in counts.items() if run_id == run.id)
+
+    def _get_declaration_types(self):
+        self.ensure_one()
+        return [declaration_type for declaration_type, label in DECLARATION_TYPES
+                if self[f'include_{declaration_type}']]
+
+    @api.model
+    def _trigger_processing(self):
+        for xmlid in DECLARATION_WORKER_CRONS:
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron and cron.active:
+                cron._trigger()
+
+    def action_start(self):
+        """Préparer les déclarations de l'exercice et les confier aux workers.
+
+        Les déclarations déjà soumises sont conservées telles quelles; les
+        autres sont (re)calculées.
+        """
+        for run in self:
+            if run.state == 'running':
+                raise UserError(_("Le lot %s est déjà en cours.") % run.name)
+            declaration_types = run._get_declaration_types()
+            if not declaration_types:
+                raise UserError(_("Sélectionnez au moins un type de déclaration."))
+            declarations = self.env['fiscal.declaration']._prepare_batch(
+                run.company_ids, declaration_types, run.fiscal_year, period_end=run.period_end)
+            declarations.filtered(lambda declaration: declaration.state != 'submitted').write({
+                'run_id': run.id,
+                'state': 'queued',
+                'error_log': False,
+            })
+            run.write({'state': 'running', 'date_start': fields.Datetime.now(), 'date_end': False})
+        self._trigger_processing()
+        return True
+
+    def _try_lock_company(self, company_id):
+        """Réserver une société pour ce worker jusqu'à la fin de la transaction"""
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s), %s)", [self._name, company_id])
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _cron_process_declarations(self):
+        """Calculer les déclarations en attente (appelé par CRON).
+
+        Plusieurs CRON exécutent cette méthode en parallèle: chacun réserve une
+        société, calcule toutes ses déclarations en attente (les indicateurs
+        d'une période ne sont lus qu'une fois pour tous les types) puis valide
+        la transaction avant de passer à la suivante.
+        """
+        deadline = time.monotonic() + RUN_TIME_LIMIT
+        while time.monotonic() < deadline:
+            self.env.cr.execute("""
+                SELECT DISTINCT company_id FROM fiscal_declaration WHERE state = 'queued' ORDER BY company_id
+            """)
+            company_ids = [company_id for company_id, in self.env.cr.fetchall()]
+            company_id = next((company_id for company_id in company_ids if self._try_lock_company(company_id)), None)
+            if not company_id:
+                break
+            try:
+                self._process_company(company_id)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("Erreur de calcul des déclarations de la société %s", company_id)
+                self.env['fiscal.declaration'].search([
+                    ('company_id', '=', company_id), ('state', '=', 'queued'),
+                ]).write({'state': 'error', 'error_log': str(e)})
+            self.env.cr.commit()
+        self.search([('state', '=', 'running')])._check_done()
+        self.env.cr.commit()
+        if time.monotonic() >= deadline:
+            # Reprendre lors du prochain passage
+            self._trigger_processing()
+
+    @api.model
+    def _process_company(self, company_id):
+        """Calculer les déclarations en attente d'une société"""
+        declarations = self.env['fiscal.declaration'].search([
+            ('company_id', '=', company_id), ('state', '=', 'queued'),
+        ])
+        declarations.with_company(company_id)._compute_declarations()
+        return declarations
+
+    def _check_done(self):
+        """Clore les lots dont plus aucune déclaration n'est en attente"""
+        for run in self:
+            if run.queued_count:
+                continue
+            run.write({
+                'state': 'error' if run.failed_count else 'done',
+                'date_end': fields.Datetime.now(),
+            })
+            _logger.info("Lot de déclarations %s terminé: %d calculées, %d en erreur",
+                         run.name, run.computed_count, run.failed_count)
+
+    @api.model
+    def _cron_month_end(self):
+        """Lancer à chaque début de mois le lot des déclarations du mois écoulé.
+
+        Seules les périodes qui se terminent avec ce mois sont calculées (TVA
+        et retenues mensuelles, DIPE en fin de trimestre, DSF et IS en fin
+        d'année), pour les sociétés de localisation camerounaise.
+        """
+        last_month = fields.Date.context_today(self).replace(day=1) - timedelta(days=1)
+        companies = self.env['res.company'].search([('account_fiscal_country_id.code', '=', 'CM')])
+        if not companies:
+            return self.browse()
+        run = self.create({
+            'name': _("Clôture %s") % last_month.strftime('%m/%Y'),
+            'company_ids': [(6, 0, companies.ids)],
+            'fiscal_year': last_month.year,
+            'period_end': last_month,
+        })
+        run.action_start()
+        return run
+
+    def action_view_declarations(self):
+        """Matrice des déclarations du lot"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Déclarations - %s") % self.name,
+            'res_model': 'fiscal.declaration',
+            'view_mode': 'pivot,tree,form',
+            'domain': [('run_id', '=', self.id)],
+            'context': {'search_default_group_company': 1},
+        }
+
+    def action_generate_pdfs(self):
+        """Placer les PDF de toutes les déclarations calculées du lot dans la file de rendu"""
+        self.declaration_ids.filtered(
+            lambda declaration: declaration.state in ('computed', 'submitted')).action_generate_pdf()
+        return True
+
+    def action_process_now(self):
+        """Relancer immédiatement le traitement en arrière-plan"""
+        if any(run.state != 'running' for run in self):
+            raise UserError(_("Seuls les lots en cours peuvent être relancés."))
+        self._trigger_processing()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""VAT declaration broken down per tax, with the credit carried from month to month."""
+
+from odoo import models, fields, api, _
+from datetime import timedelta
+
+# Modèles de taxes de TVA du plan (data/account_tax_template_data.xml). Les taxes
+# générées pour une société portent l'identifiant ``<société>_<modèle>``.
+VAT_TAX_TEMPLATES = ('tax_vat_1925_cm', 'tax_vat_1925_purchase_cm', 'tax_vat_55_cm')
+
+# Bases et TVA par taxe: lignes de base (taxes appliquées) et lignes de taxe de
+# la période, plus les ventes sans TVA (exonérées ou hors champ, taxe vide)
+VAT_BREAKDOWN = """
+    SELECT breakdown.tax_id, SUM(breakdown.base), SUM(breakdown.amount)
+      FROM (
+            SELECT rel.account_tax_id AS tax_id, line.balance AS base, 0 AS amount
+              FROM account_move_line line
+              JOIN account_move_line_account_tax_rel rel ON rel.account_move_line_id = line.id
+             WHERE {where}
+               AND rel.account_tax_id = ANY(%(tax_ids)s)
+         UNION ALL
+            SELECT line.tax_line_id, 0, line.balance
+              FROM account_move_line line
+             WHERE {where}
+               AND line.tax_line_id = ANY(%(tax_ids)s)
+         UNION ALL
+            SELECT NULL, line.balance, 0
+              FROM account_move_line line
+             WHERE {where}
+               AND line.account_id = ANY(%(sales)s)
+               AND line.tax_line_id IS NULL
+               AND NOT EXISTS (SELECT 1 FROM account_move_line_account_tax_rel rel
+                                WHERE rel.account_move_line_id = line.id
+                                  AND rel.account_tax_id = ANY(%(tax_ids)s))
+           ) AS breakdown
+  GROUP BY breakdown.tax_id
+"""
+
+PERIOD_WHERE = """
+    line.company_id = %(company_id)s
+    AND line.parent_state = 'posted'
+    AND line.date BETWEEN %(date_from)s AND %(date_to)s
+"""
+
+
+class FiscalDeclarationVatLineMixin(models.AbstractModel):
+    _name = 'fiscal.declaration.vat.line.mixin'
+    """Taxable base and VAT amount of one tax over the declaration period."""
+    _description = "Ligne de TVA par taxe"
+    _order = 'type_tax_use desc, tax_id'
+
+    tax_id = fields.Many2one('account.tax', string="Taxe", readonly=True,
+                             help="Vide: opérations exonérées ou hors champ de la TVA")
+    name = fields.Char(string="Libellé", required=True, readonly=True)
+    type_tax_use = fields.Selection([
+        ('sale', 'Collectée'),
+        ('purchase', 'Déductible'),
+    ], string="Type", required=True, readonly=True)
+    base_amount = fields.Monetary(string="Base imposable", readonly=True, currency_field='currency_id')
+    tax_amount = fields.Monetary(string="Montant de TVA", readonly=True, currency_field='currency_id')
+
+    def _get_line_values(self):
+        return [{
+            'tax_id': line.tax_id.id,
+            'name': line.name,
+            'type_tax_use': line.type_tax_use,
+            'base_amount': line.base_amount,
+            'tax_amount': line.tax_amount,
+        } for line in self]
+
+
+class FiscalDeclarationVatLine(models.Model):
+    _name = 'fiscal.declaration.vat.line'
+    _inherit = ['fiscal.declaration.vat.line.mixin']
+    """VAT line of a stored declaration."""
+    _description = "Ligne de TVA de déclaration"
+
+    declaration_id = fields.Many2one('fiscal.declaration', string="Déclaration", required=True,
+                                     ondelete='cascade', index=True)
+    currency_id = fields.Many2one('res.currency', related='declaration_id.currency_id')
+
+
+class FiscalDeclarationMixin(models.AbstractModel):
+    _inherit = 'fiscal.declaration.mixin'
+    """Per-tax VAT breakdown and credit carried forward of monthly VAT declarations."""
+
+    vat_credit_previous = fields.Monetary(string="Crédit de TVA reporté", currency_field='currency_id',
+                                          help="Crédit à reporter de la déclaration du mois précédent")
+    vat_credit_carried = fields.Monetary(string="Crédit de TVA à reporter", currency_field='currency_id')
+
+    @api.model
+    def _get_vat_taxes(self, company):
+        """Taxes de TVA de la société issues des modèles du plan.
+
+        Les taxes sont retrouvées par leur identifiant XML et non par leur
+        libellé, que l'utilisateur peut modifier.
+        """
+        tax_ids = self.env['ir.model.data'].sudo().search([
+            ('module', '=', 'l10n_cm_accounting'),
+            ('model', '=', 'account.tax'),
+            ('name', 'in', [f"{company.id}_{template}" for template in VAT_TAX_TEMPLATES]),
+        ]).mapped('res_id')
+        return self.env['account.tax'].with_context(active_test=False).search([
+            ('id', 'in', tax_ids),
+            ('company_id', '=', company.id),
+        ])
+
+    def _compute_vat_breakdown(self):
+        """Bases et TVA de la période par taxe, en une requête groupée.
+
+        Retourne les valeurs des lignes ``fiscal.declaration.vat.line.mixin``:
+        la TVA collectée et déductible par taux, puis les ventes sans TVA.
+        """
+        self.ensure_one()
+        taxes = self._get_vat_taxes(self.company_id)
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute(VAT_BREAKDOWN.format(where=PERIOD_WHERE), {
+            'company_id': self.company_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'tax_ids': taxes.ids,
+            'sales': list(self.env['account.account']._get_role_account_ids(self.company_id.id, 'sales')),
+        })
+        totals = {tax_id: (float(base or 0.0), float(amount or 0.0)) for tax_id, base, amount in self.env.cr.fetchall()}
+
+        lines = []
+        for tax in taxes:
+            if tax.id not in totals:
+                continue
+            base, amount = totals[tax.id]
+            # Les bases et TVA collectées sont au crédit
+            sign = -1 if tax.type_tax_use == 'sale' else 1
+            lines.append({
+                'tax_id': tax.id,
+                'name': tax.name,
+                'type_tax_use': 'sale' if tax.type_tax_use == 'sale' else 'purchase',
+                'base_amount': sign * base,
+                'tax_amount': sign * amount,
+            })
+        if None in totals:
+            lines.append({
+                'tax_id': False,
+                'name': _("Opérations exonérées ou hors champ"),
+                'type_tax_use': 'sale',
+                'base_amount': -totals[None][0],
+                'tax_amount': 0.0,
+            })
+        return lines
+
+    def _get_previous_vat_credit(self):
+        """Crédit à reporter de la déclaration enregistrée du mois précédent"""
+        self.ensure_one()
+        previous = self.env['fiscal.declaration'].search([
+            ('company_id', '=', self.company_id.id),
+            ('declaration_type', '=', 'vat_monthly'),
+            ('date_to', '=', self.date_from - timedelta(days=1)),
+            ('state', 'in', ('computed', 'submitted')),
+        ], limit=1)
+        return previous.vat_credit_carried
+
+    def _compute_detail_values(self):
+        values = super()._compute_detail_values()
+        if self.declaration_type == 'vat_monthly':
+            values['vat_lines'] = self._compute_vat_breakdown()
+        return values
+
+    def _write_results(self, values, from_cache, cache_date):
+        """Imputer le crédit du mois précédent et enregistrer la ventilation par taxe.
+
+        Le crédit est lu sur la seule déclaration du mois précédent, qui porte
+        déjà le report de tous les mois antérieurs: l'historique n'est jamais
+        relu. Il n'est pas mis en cache, la déclaration précédente pouvant
+        être recalculée entre-temps.
+        """
+        if self.declaration_type != 'vat_monthly':
+            return super()._write_results(values, from_cache, cache_date)
+        values = dict(values)
+        vat_lines = values.pop('vat_lines', None)
+        if vat_lines is None:
+            vat_lines = self._compute_vat_breakdown()
+        credit = self._get_previous_vat_credit()
+        balance = values.get('vat_collected', 0.0) - values.get('vat_paid', 0.0) - credit
+        values.update({
+            'vat_credit_previous': credit,
+            'vat_due': max(balance, 0.0),
+            'vat_credit_carried': max(-balance, 0.0),
+            'vat_line_ids': [(5, 0, 0)] + [(0, 0, line) for line in vat_lines],
+        })
+        return super()._write_results(values, from_cache, cache_date)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""Withholding-tax register grouped by supplier, with keyset drill-down to the lines."""
+
+from odoo import models, fields, _
+from datetime import timedelta
+
+# Lignes de détail lues par page lors du parcours du registre
+WITHHOLDING_PAGE_SIZE = 1000
+
+# Retenues de la période (crédits des comptes de retenue), par tiers
+WITHHOLDING_REGISTER = """
+    SELECT line.partner_id, partner.taxpayer_identifier, partner.name, partner.tax_regime,
+           COUNT(DISTINCT line.move_id) AS move_count, SUM(line.credit) AS withheld_amount
+      FROM account_move_line line
+ LEFT JOIN res_partner partner ON partner.id = line.partner_id
+     WHERE line.company_id = %(company_id)s
+       AND line.parent_state = 'posted'
+       AND line.date BETWEEN %(date_from)s AND %(date_to)s
+       AND line.account_id = ANY(%(account_ids)s)
+       AND line.credit > 0
+  GROUP BY line.partner_id, partner.taxpayer_identifier, partner.name, partner.tax_regime
+  ORDER BY partner.name, line.partner_id
+"""
+
+# Page de lignes de retenue après la clé ``(date, id)`` de la page précédente
+WITHHOLDING_LINES = """
+    SELECT line.id, line.date, LEFT(move.name, 256), LEFT(COALESCE(line.name, ''), 256),
+           COALESCE(partner.taxpayer_identifier, ''), LEFT(COALESCE(partner.name, ''), 256), line.credit
+      FROM account_move_line line
+      JOIN account_move move ON move.id = line.move_id
+ LEFT JOIN res_partner partner ON partner.id = line.partner_id
+     WHERE line.company_id = %(company_id)s
+       AND line.parent_state = 'posted'
+       AND line.date BETWEEN %(date_from)s AND %(date_to)s
+       AND line.account_id = ANY(%(account_ids)s)
+       AND line.credit > 0
+       AND (%(all_partners)s OR line.partner_id IS NOT DISTINCT FROM %(partner_id)s)
+       AND (line.date, line.id) > (%(after_date)s, %(after_id)s)
+  ORDER BY line.date, line.id
+     LIMIT %(limit)s
+"""
+
+
+class FiscalWithholdingLineMixin(models.AbstractModel):
+    _name = 'fiscal.withholding.line.mixin'
+    """Amount withheld from one supplier over the declaration period."""
+    _description = "Ligne du registre des retenues"
+    _order = 'partner_name, partner_id'
+
+    partner_id = fields.Many2one('res.partner', string="Fournisseur", readonly=True)
+    partner_name = fields.Char(string="Raison sociale", readonly=True)
+    taxpayer_identifier = fields.Char(string="NIU", readonly=True)
+    tax_regime = fields.Selection(selection=lambda self: self.env['res.partner']._fields['tax_regime'].selection,
+                                  string="Régime fiscal", readonly=True)
+    move_count = fields.Integer(string="Écritures", readonly=True)
+    withheld_amount = fields.Monetary(string="Montant retenu", readonly=True, currency_field='currency_id')
+
+    def _get_declaration(self):
+        """Déclaration (``declaration_id``) ou assistant (``wizard_id``) portant la ligne"""
+        return self.declaration_id if 'declaration_id' in self._fields else self.wizard_id
+
+    def action_view_move_lines(self):
+        """Lignes d'écritures de retenue de ce fournisseur sur la période"""
+        self.ensure_one()
+        declaration = self._get_declaration()
+        account_ids = self.env['account.account']._get_role_account_ids(declaration.company_id.id, 'withholding')
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Retenues - %s") % (self.partner_name or _("Sans tiers")),
+            'res_model': 'account.move.line',
+            'view_mode': 'tree,form',
+            'domain': [
+                ('company_id', '=', declaration.company_id.id),
+                ('parent_state', '=', 'posted'),
+                ('date', '>=', declaration.date_from),
+                ('date', '<=', declaration.date_to),
+                ('account_id', 'in', list(account_ids)),
+                ('credit', '>', 0),
+                ('partner_id', '=', self.partner_id.id),
+            ],
+            'context': {'create': False},
+        }
+
+    def _get_line_values(self):
+        return [{
+            'partner_id': line.partner_id.id,
+            'partner_name': line.partner_name,
+            'taxpayer_identifier': line.taxpayer_identifier,
+            'tax_regime': line.tax_regime,
+            'move_count': line.move_count,
+            'withheld_amount': line.withheld_amount,
+        } for line in self]
+
+
+class FiscalDeclarationWithholdingLine(models.Model):
+    _name = 'fiscal.declaration.withholding.line'
+    _inherit = ['fiscal.withholding.line.mixin']
+    """Withholding register line of a stored declaration."""
+    _description = "Ligne du registre des retenues de déclaration"
+
+    declaration_id = fields.Many2one('fiscal.declaration', string="Déclaration", required=True,
+                                     ondelete='cascade', index=True)
+    currency_id = fields.Many2one('res.currency', related='declaration_id.currency_id')
+
+
+class FiscalDeclarationMixin(models.AbstractModel):
+    _inherit = 'fiscal.declaration.mixin'
+    """Withholding register feeding the withholding declaration total."""
+
+    def _get_withholding_params(self):
+        self.ensure_one()
+        return {
+            'company_id': self.company_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'account_ids': list(self.env['account.account']._get_role_account_ids(self.company_id.id, 'withholding')),
+        }
+
+    def _compute_withholding_register(self):
+        """Registre des retenues de la période: une requête groupée par tiers.
+
+        Retourne les valeurs des lignes ``fiscal.withholding.line.mixin``, avec
+        le NIU et le régime fiscal du tiers.
+        """
+        self.ensure_one()
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute(WITHHOLDING_REGISTER, self._get_withholding_params())
+        return [{
+            'partner_id': partner_id,
+            'partner_name': name or False,
+            'taxpayer_identifier': taxpayer_identifier or False,
+            'tax_regime': tax_regime or False,
+            'move_count': move_count,
+            'withheld_amount': float(amount or 0.0),
+        } for partner_id, taxpayer_identifier, name, tax_regime, move_count, amount in self.env.cr.fetchall()]
+
+    def _get_withholding_lines(self, after=None, limit=WITHHOLDING_PAGE_SIZE, partner_id=None):
+        """Page de lignes de retenue triées par ``(date, id)``.
+
+        ``after`` est la clé ``(date, id)`` de la dernière ligne de la page
+        précédente: la page suivante est lue par l'index sans décalage, quel
+        que soit son rang. ``partner_id``: ``None`` pour tous les tiers,
+        ``False`` pour les lignes sans tiers. Retourne les lignes et la clé
+        de la page suivante (``None`` en fin de registre).
+        """
+        self.ensure_one()
+        after_date, after_id = after or (self.date_from - timedelta(days=1), 0)
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute(WITHHOLDING_LINES, dict(
+            self._get_withholding_params(),
+            all_partners=partner_id is None,
+            partner_id=partner_id or None,
+            after_date=after_date,
+            after_id=after_id,
+            limit=limit,
+        ))
+        rows = self.env.cr.fetchall()
+        next_key = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_key
+
+    def _iter_withholding_line_rows(self):
+        """Toutes les lignes de retenue de la période, page par page"""
+        self.ensure_one()
+        key = None
+        while True:
+            rows, key = self._get_withholding_lines(after=key)
+            for line_id, *row in rows:
+                yield row
+            if key is None:
+                break
+
+    def _compute_detail_values(self):
+        values = super()._compute_detail_values()
+        if self.declaration_type == 'withholding_tax':
+            register = self._compute_withholding_register()
+            values['withholding_lines'] = register
+            values['withholding_tax'] = sum(line['withheld_amount'] for line in register)
+        return values
+
+    def _write_results(self, values, from_cache, cache_date):
+        """Enregistrer le registre des retenues avec les montants"""
+        if self.declaration_type != 'withholding_tax':
+            return super()._write_results(values, from_cache, cache_date)
+        values = dict(values)
+        register = values.pop('withholding_lines', None)
+        if register is None:
+            register = self._compute_withholding_register()
+        values['withholding_line_ids'] = [(5, 0, 0)] + [(0, 0, line) for line in register]
+        return super()._write_results(values, from_cache, cache_date)
@@ -4,7 +4,14 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+from collections import defaultdict
 import re
+import unicodedata
+
+# Score de similarité trigramme minimal et écart requis avec le second candidat
+PARTNER_FUZZY_MIN_SCORE = 0.6
+PARTNER_FUZZY_MIN_GAP = 0.1
 
 
 class ResPartner(models.Model):
@@ -153,6 +160,108 @@ class ResPartner(models.Model):
             if partner.annual_turnover < 0:
                 raise ValidationError(_("Le chiffre d'affaires ne peut pas être négatif"))
 
+    @api.model
+    def _cm_normalize_name(self, value):
+        """Clé de comparaison d'un nom: sans accents, casse ni ponctuation"""
+        value = unicodedata.normalize('NFKD', value or '')
+        value = ''.join(char for char in value if not unicodedata.combining(char))
+        return ' '.join(re.sub(r'[^\w\s]', ' ', value.casefold()).split())
+
+    def init(self):
+        super().init()
+        # Index trigramme pour le rapprochement approximatif des tiers à l'import
+        if self.env.registry.has_trigram:
+            create_index(
+                self.env.cr,
+                'res_partner_cm_name_trgm_idx',
+                self._table,
+                ['name gin_trgm_ops'],
+                method='gin',
+            )
+
+    @api.model
+    def _cm_build_match_index(self, company):
+        """Construire en une lecture l'index de rapprochement des partenaires.
+
+        Retourne trois dictionnaires clé -> ensemble d'ids: ``ref`` exacte,
+        ``taxpayer`` (numéro de contribuable en majuscules) et ``name`` (nom
+        normalisé par ``_cm_normalize_name``).
+        """
+        index = {'ref': defaultdict(set), 'taxpayer': defaultdict(set), 'name': defaultdict(set)}
+        partners = self.search_read(
+            [('company_id', 'in', [company.id, False])],
+            ['ref', 'taxpayer_identifier', 'name'],
+        )
+        for partner in partners:
+            if partner['ref']:
+                index['ref'][partner['ref'].strip()].add(partner['id'])
+            if partner['taxpayer_identifier']:
+                index['taxpayer'][partner['taxpayer_identifier'].strip().upper()].add(partner['id'])
+            if partner['name']:
+                index['name'][self._cm_normalize_name(partner['name'])].add(partner['id'])
+        return index
+
+    @api.model
+    def _cm_match_partners(self, values, index, company, fuzzy=False):
+        """Rapprocher des valeurs de la colonne Tiers avec l'index.
+
+        Les clés sont essayées dans l'ordre ``ref``, numéro de contribuable
+        puis nom normalisé; la première clé qui trouve un résultat décide.
+        Plusieurs partenaires pour une même clé rendent la valeur ambiguë au
+        lieu de choisir arbitrarement. Si ``fuzzy`` est actif, les valeurs
+        restantes sont recherchées par similarité trigramme sur le nom: un
+        candidat sous ``PARTNER_FUZZY_MIN_SCORE`` laisse la valeur inconnue,
+        deux candidats trop proches la rendent ambiguë.
+
+        Retourne ``(matches, ambiguous)``: ``{valeur: id}`` et
+        ``{valeur: [ids]}``.
+        """
+        matches, ambiguous = {}, {}
+        unresolved = []
+        for value in values:
+            keys = [
+                ('ref', value.strip()),
+                ('taxpayer', value.strip().upper()),
+                ('name', self._cm_normalize_name(value)),
+            ]
+            for kind, key in keys:
+                partner_ids = index[kind].get(key)
+                if not partner_ids:
+                    continue
+                if len(partner_ids) == 1:
+                    matches[value] = next(iter(partner_ids))
+                else:
+                    ambiguous[value] = sorted(partner_ids)
+                break
+            else:
+                unresolved.append(value)
+
+        if fuzzy and unresolved and self.env.registry.has_trigram:
+            for value in unresolved:
+                self.env.cr.execute("""
+                    SELECT id, similarity(name, %s) AS score
+                      FROM res_partner
+                     WHERE active
+                       AND (company_id IS NULL OR company_id = %s)
+                       AND name %% %s
+                  ORDER BY score DESC, id
+                     LIMIT 2
+                """, [value, company.id, value])
+                candidates = self.env.cr.fetchall()
+                if not candidates:
+                    continue
+                best_id, best_score = candidates[0]
+                if best_score < PARTNER_FUZZY_MIN_SCORE:
+                    # Aucun candidat assez proche: la valeur reste inconnue
+                    continue
+                second_score = candidates[1][1] if len(candidates) > 1 else 0.0
+                if best_score - second_score >= PARTNER_FUZZY_MIN_GAP:
+                    matches[value] = best_id
+                else:
+                    ambiguous[value] = [partner_id for partner_id, score in candidates]
+
+        return matches, ambiguous
+
     @api.model
     def get_tax_regime_thresholds(self):
         """Retourner les seuils pour les régimes fiscaux camerounais"""
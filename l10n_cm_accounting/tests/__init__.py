@@ -2,4 +2,6 @@
 from . import test_accounting_chart
 from . import test_fiscal_declarations
 from . import test_mobile_money
-
+from . import test_move_import
+from . import test_balance_monthly
+from . import test_benchmark
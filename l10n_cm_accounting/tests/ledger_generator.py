@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""Seeded generator of SYSCOHADA ledgers used by the benchmark suite."""
+
+from odoo.tools.misc import file_path
+from lxml import etree
+from datetime import date, timedelta
+import base64
+import csv
+import io
+import random
+
+CHART_TEMPLATE = 'l10n_cm_accounting/data/account.account.template.xml'
+
+IMPORT_COLUMNS = ['Date', 'Journal', 'Compte', 'Libelle', 'Debit', 'Credit', 'Reference', 'Tiers']
+
+VAT_RATE = 0.1925
+
+JOURNALS = [
+    ('VTE', 'Ventes'),
+    ('ACH', 'Achats'),
+    ('BQ1', 'Banque'),
+    ('OD', 'Opérations diverses'),
+]
+
+# Type de compte Odoo par préfixe SYSCOHADA (le plus long préfixe l'emporte)
+ACCOUNT_TYPES = {
+    '1': 'equity',
+    '2': 'asset_fixed',
+    '3': 'asset_current',
+    '4': 'liability_current',
+    '41': 'asset_receivable',
+    '445': 'asset_current',
+    '5': 'asset_cash',
+    '6': 'expense',
+    '7': 'income',
+}
+
+
+class SyscohadaLedgerGenerator:
+    """Build companies, partners and balanced ledgers from a fixed seed.
+
+    The same seed always produces the same ledger, so benchmark runs are
+    comparable between branches and machines.
+    """
+
+    def __init__(self, env, seed=42):
+        self.env = env
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    @staticmethod
+    def chart_accounts():
+        """Comptes de détail (6 chiffres) du plan SYSCOHADA du module"""
+        tree = etree.parse(file_path(CHART_TEMPLATE))
+        accounts = []
+        for record in tree.iterfind(".//record[@model='account.account.template']"):
+            code = record.findtext("field[@name='code']")
+            if code and len(code) == 6:
+                accounts.append((code, record.findtext("field[@name='name']")))
+        return accounts
+
+    @staticmethod
+    def _account_type(code):
+        prefix = max((prefix for prefix in ACCOUNT_TYPES if code.startswith(prefix)), key=len)
+        return ACCOUNT_TYPES[prefix]
+
+    def create_companies(self, count, prefix="Bench"):
+        """Créer ``count`` sociétés avec le plan SYSCOHADA et les journaux du générateur"""
+        companies = self.env['res.company'].create([
+            {'name': f"{prefix} {self.seed}-{index + 1}"} for index in range(count)
+        ])
+        self.env.user.company_ids |= companies
+        chart = self.chart_accounts()
+        for company in companies:
+            # Une société peut recevoir un plan par défaut à sa création
+            existing = set(self.env['account.account'].search([('company_id', '=', company.id)]).mapped('code'))
+            self.env['account.account'].create([{
+                'code': code,
+                'name': name,
+                'account_type': self._account_type(code),
+                'reconcile': self._account_type(code) == 'asset_receivable',
+                'company_id': company.id,
+            } for code, name in chart if code not in existing])
+            existing = set(self.env['account.journal'].search([('company_id', '=', company.id)]).mapped('code'))
+            self.env['account.journal'].create([{
+                'code': code,
+                'name': name,
+                'type': 'general',
+                'company_id': company.id,
+            } for code, name in JOURNALS if code not in existing])
+        return companies
+
+    def create_partners(self, count):
+        """Créer ``count`` clients avec référence et numéro de contribuable"""
+        return self.env['res.partner'].create([{
+            'name': f"Client {self.seed}-{index + 1:06d}",
+            'ref': f"BENCH{self.seed}-{index + 1:06d}",
+            'taxpayer_identifier': f"P{self.rng.randrange(10 ** 9):09d}{chr(65 + index % 26)}",
+            'tax_regime': self.rng.choice(['reel_normal', 'reel_simplifie', 'synthese']),
+        } for index in range(count)])
+
+    def _move_lines(self, kind, partner_ref):
+        """Lignes ``(compte, débit, crédit, tiers)`` d'une écriture équilibrée"""
+        amount = self.rng.randrange(1000, 5000000)
+        if kind == 'sale':
+            vat = round(amount * VAT_RATE)
+            return 'VTE', [
+                ('411000', amount + vat, 0, partner_ref),
+                ('701000', 0, amount, None),
+                ('443000', 0, vat, None),
+            ]
+        if kind == 'purchase':
+            vat = round(amount * VAT_RATE)
+            return 'ACH', [
+                ('601000', amount, 0, None),
+                ('445000', vat, 0, None),
+                ('521000', 0, amount + vat, None),
+            ]
+        if kind == 'receipt':
+            return 'BQ1', [
+                ('521000', amount, 0, None),
+                ('411000', 0, amount, partner_ref),
+            ]
+        return 'OD', [
+            ('661000', amount, 0, None),
+            ('421000', 0, amount, None),
+        ]
+
+    def iter_rows(self, partners, lines, year):
+        """Produire au moins ``lines`` lignes d'écritures équilibrées de l'année ``year``.
+
+        Les lignes sont au format du fichier d'import et celles d'une même
+        référence sont contiguës.
+        """
+        partner_refs = partners.mapped('ref')
+        first_day = date(year, 1, 1)
+        days = (date(year, 12, 31) - first_day).days + 1
+        produced = 0
+        number = 0
+        while produced < lines:
+            number += 1
+            kind = self.rng.choices(['sale', 'purchase', 'receipt', 'salary'], weights=[5, 3, 3, 1])[0]
+            journal, move_lines = self._move_lines(kind, self.rng.choice(partner_refs))
+            move_date = (first_day + timedelta(days=self.rng.randrange(days))).isoformat()
+            reference = f"{journal}-{year}-{number:07d}"
+            for account, debit, credit, partner_ref in move_lines:
+                yield {
+                    'Date': move_date,
+                    'Journal': journal,
+                    'Compte': account,
+                    'Libelle': f"{kind} {number}",
+                    'Debit': debit,
+                    'Credit': credit,
+                    'Reference': reference,
+                    'Tiers': partner_ref or '',
+                }
+            produced += len(move_lines)
+
+    @staticmethod
+    def to_csv(rows):
+        """Fichier CSV (séparateur ``;``) prêt pour l'assistant d'import"""
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=IMPORT_COLUMNS, delimiter=';', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue().encode('utf-8')
+
+    def import_wizard(self, company, partners, lines, year, import_mode='batch'):
+        """Assistant d'import prêt à traiter un grand livre généré"""
+        content = self.to_csv(self.iter_rows(partners, lines, year))
+        return self.env['account.move.import'].with_company(company).create({
+            'name': f"Benchmark {lines} lignes",
+            'import_file': base64.b64encode(content),
+            'filename': 'benchmark.csv',
+            'import_mode': import_mode,
+        })
+
+    def load_posted_ledger(self, company, partners, lines, year):
+        """Charger en SQL un grand livre comptabilisé sur l'exercice clôturé ``year``"""
+        company.fiscalyear_lock_date = date(year, 12, 31)
+        wizard = self.import_wizard(company, partners, lines, year, import_mode='historical')
+        wizard.action_import_moves()
+        if wizard.error_count:
+            raise AssertionError("Le grand livre généré a été rejeté: %s"
+                                 % wizard.error_ids.mapped('message')[:5])
+        return wizard
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests.common import TransactionCase
+from datetime import date
+
+
+class TestBalanceMonthly(TransactionCase):
+
+    def setUp(self):
+        super(TestBalanceMonthly, self).setUp()
+        self.company = self.env.company
+        self.journal = self.env['account.journal'].create({
+            'name': 'Soldes test',
+            'code': 'TSOL',
+            'type': 'general',
+            'company_id': self.company.id,
+        })
+        self.account_expense = self.env['account.account'].create({
+            'name': 'Charges test',
+            'code': '601960',
+            'account_type': 'expense',
+            'company_id': self.company.id,
+        })
+        self.account_bank = self.env['account.account'].create({
+            'name': 'Banque test',
+            'code': '521960',
+            'account_type': 'asset_cash',
+            'company_id': self.company.id,
+        })
+        plan = self.env['account.analytic.plan'].create({'name': 'Plan test'})
+        self.analytic = self.env['account.analytic.account'].create({
+            'name': 'Projet test',
+            'plan_id': plan.id,
+        })
+        self.Summary = self.env['account.balance.monthly']
+
+    def _create_move(self, move_date, amount, analytic_share=None):
+        expense_vals = {'account_id': self.account_expense.id, 'name': 'Test', 'debit': amount, 'credit': 0}
+        if analytic_share:
+            expense_vals['analytic_distribution'] = {str(self.analytic.id): analytic_share}
+        return self.env['account.move'].create({
+            'journal_id': self.journal.id,
+            'date': move_date,
+            'line_ids': [
+                (0, 0, expense_vals),
+                (0, 0, {'account_id': self.account_bank.id, 'name': 'Test', 'debit': 0, 'credit': amount}),
+            ],
+        })
+
+    def _rows(self):
+        rows = self.Summary.search([('account_id', 'in', (self.account_expense | self.account_bank).ids)])
+        return {
+            (row.account_id.code, row.analytic_account_id.id or False, row.month): (row.debit, row.credit, row.balance)
+            for row in rows
+        }
+
+    def test_posting_updates_summary_incrementally(self):
+        """Comptabiliser, remettre en brouillon et annuler met à jour les soldes"""
+        move = self._create_move(date(2032, 5, 10), 1000, analytic_share=40)
+        self.assertFalse(self._rows())
+
+        move.action_post()
+        rows = self._rows()
+        self.assertEqual(rows[('601960', False, date(2032, 5, 1))], (1000, 0, 1000))
+        self.assertEqual(rows[('601960', self.analytic.id, date(2032, 5, 1))], (400, 0, 400))
+        self.assertEqual(rows[('521960', False, date(2032, 5, 1))], (0, 1000, -1000))
+
+        second = self._create_move(date(2032, 5, 20), 500)
+        second.action_post()
+        self.assertEqual(self._rows()[('601960', False, date(2032, 5, 1))], (1500, 0, 1500))
+
+        # Seule la ligne modifiée d'une écriture comptabilisée est reportée
+        second.line_ids.filtered('debit').analytic_distribution = {str(self.analytic.id): 100}
+        rows = self._rows()
+        self.assertEqual(rows[('601960', False, date(2032, 5, 1))], (1500, 0, 1500))
+        self.assertEqual(rows[('601960', self.analytic.id, date(2032, 5, 1))], (900, 0, 900))
+
+        move.button_draft()
+        rows = self._rows()
+        self.assertEqual(rows[('601960', False, date(2032, 5, 1))], (500, 0, 500))
+        self.assertEqual(rows[('601960', self.analytic.id, date(2032, 5, 1))], (500, 0, 500))
+
+        move.button_cancel()
+        second.button_draft()
+        self.assertTrue(all(values == (0, 0, 0) for values in self._rows().values()))
+
+    def test_rebuild_matches_incremental_updates(self):
+        """La reconstruction complète donne les mêmes soldes que la mise à jour incrémentale"""
+        moves = self._create_move(date(2032, 6, 3), 700, analytic_share=100) | self._create_move(date(2032, 7, 3), 300)
+        moves.action_post()
+        incremental = {key: values for key, values in self._rows().items() if any(values)}
+
+        self.Summary._rebuild(self.company)
+        self.assertEqual({key: values for key, values in self._rows().items() if any(values)}, incremental)
+        self.assertTrue(all(moves.mapped('balance_summary_applied')))
+
+    def test_totals_for_partial_months(self):
+        """Une période hors mois entiers est lue directement dans les lignes"""
+        self._create_move(date(2032, 8, 5), 200).action_post()
+        self._create_move(date(2032, 8, 25), 800, analytic_share=50).action_post()
+
+        totals = self.Summary._get_account_totals(self.company, date(2032, 8, 1), date(2032, 8, 31))
+        self.assertEqual(totals[self.account_expense.id], (1000, 0, 1000))
+        totals = self.Summary._get_account_totals(self.company, date(2032, 8, 10), date(2032, 8, 31))
+        self.assertEqual(totals[self.account_expense.id], (800, 0, 800))
+        totals = self.Summary._get_account_totals(
+            self.company, date(2032, 8, 1), date(2032, 8, 31), analytic_account_id=self.analytic.id)
+        self.assertEqual(totals[self.account_expense.id], (400, 0, 400))
+
+    def test_budget_realized_amount_from_summary(self):
+        """Le réalisé budgétaire est lu dans les soldes mensuels, analytique compris"""
+        self._create_move(date(2032, 9, 5), 600, analytic_share=25).action_post()
+        budget = self.env['account.budget'].create({
+            'name': 'Budget test',
+            'fiscal_year': 2032,
+            'date_from': date(2032, 1, 1),
+            'date_to': date(2032, 12, 31),
+            'budget_line_ids': [
+                (0, 0, {'account_id': self.account_expense.id, 'planned_amount': 1000}),
+                (0, 0, {'account_id': self.account_expense.id, 'planned_amount': 200,
+                        'analytic_account_id': self.analytic.id}),
+            ],
+        })
+        budget.budget_line_ids._compute_realized_amount()
+        self.assertEqual(budget.budget_line_ids.mapped('realized_amount'), [600, 150])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""Timed import, declaration and budget scenarios on generated ledgers.
+
+Excluded from the standard test run; launch with::
+
+    odoo-bin -i l10n_cm_accounting --test-tags l10n_cm_benchmark
+
+Environment variables:
+
+* ``L10N_CM_BENCH_SCALES``: line counts to run, comma separated
+  (default ``1000,10000``; ``100000,1000000`` for full runs);
+* ``L10N_CM_BENCH_TOLERANCE``: allowed slowdown over the baseline (default 0.25);
+* ``L10N_CM_BENCH_UPDATE_BASELINE``: ``1`` to skip the regression checks and
+  write the baseline merged with the new measures to ``L10N_CM_BENCH_OUTPUT``;
+* ``L10N_CM_BENCH_OUTPUT``: path of a JSON file receiving the measures
+  (seconds, queries and peak memory per scenario).
+
+The baseline is ``tests/benchmark_baseline.json``, a run recorded on the
+reference machine. No baseline is shipped: until one is recorded, the
+regression check is skipped for every scenario and a warning says so. The
+module tree is never written to: copy the output file of a reference run
+to ``tests/benchmark_baseline.json`` to adopt it.
+"""
+
+from odoo.tests.common import TransactionCase, tagged
+from odoo.tools.misc import file_path
+from datetime import date
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+from .ledger_generator import SyscohadaLedgerGenerator
+
+_logger = logging.getLogger(__name__)
+
+BASELINE_FILE = 'l10n_cm_accounting/tests/benchmark_baseline.json'
+
+SCALES = [int(scale) for scale in os.environ.get('L10N_CM_BENCH_SCALES', '1000,10000').split(',') if scale.strip()]
+
+TOLERANCE = float(os.environ.get('L10N_CM_BENCH_TOLERANCE', '0.25'))
+
+UPDATE_BASELINE = os.environ.get('L10N_CM_BENCH_UPDATE_BASELINE') == '1'
+
+# Écart absolu toléré (secondes) pour les scénarios très courts
+MIN_SLACK = 0.05
+
+COMPANIES = 2
+
+PARTNERS = 500
+
+
+@tagged('-standard', 'l10n_cm_benchmark')
+class TestBenchmark(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.generator = SyscohadaLedgerGenerator(cls.env, seed=42)
+        cls.companies = cls.generator.create_companies(COMPANIES)
+        cls.partners = cls.generator.create_partners(PARTNERS)
+        try:
+            with open(file_path(BASELINE_FILE)) as baseline_file:
+                cls.baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            _logger.warning("Aucune référence enregistrée (%s): contrôle de régression ignoré", BASELINE_FILE)
+            cls.baseline = {}
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        output = os.environ.get('L10N_CM_BENCH_OUTPUT')
+        if output:
+            measures = dict(cls.baseline, **cls.results) if UPDATE_BASELINE else cls.results
+            with open(output, 'w') as output_file:
+                json.dump(measures, output_file, indent=2, sort_keys=True)
+                output_file.write('\n')
+        elif UPDATE_BASELINE:
+            _logger.warning("L10N_CM_BENCH_UPDATE_BASELINE sans L10N_CM_BENCH_OUTPUT: mesures non enregistrées")
+        super().tearDownClass()
+
+    def _measure(self, scenario, func):
+        """Mesurer durée, nombre de requêtes et pic mémoire Python d'un scénario"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        tracemalloc.start()
+        queries = self.env.cr.sql_log_count
+        started = time.perf_counter()
+        try:
+            func()
+            self.env.flush_all()
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'seconds': round(seconds, 3),
+            'queries': self.env.cr.sql_log_count - queries,
+            'peak_memory_kb': peak // 1024,
+        }
+        self.results[scenario] = result
+        _logger.info("Benchmark %s: %.3f s, %d requêtes, %d Ko", scenario,
+                     result['seconds'], result['queries'], result['peak_memory_kb'])
+
+        reference = self.baseline.get(scenario)
+        if not reference:
+            _logger.warning("Benchmark %s: pas de référence enregistrée, contrôle de régression ignoré", scenario)
+        elif not UPDATE_BASELINE:
+            limit = max(reference['seconds'] * (1 + TOLERANCE), reference['seconds'] + MIN_SLACK)
+            self.assertLessEqual(
+                result['seconds'], limit,
+                f"Régression de performance sur {scenario}: {result['seconds']} s "
+                f"(référence {reference['seconds']} s)")
+        return result
+
+    def test_import_scaling(self):
+        """Import par lots d'un grand livre généré"""
+        for lines in SCALES:
+            with self.subTest(lines=lines):
+                wizard = self.generator.import_wizard(self.companies[0], self.partners, lines, 2025)
+                self._measure(f'import_batch_{lines}', wizard.action_import_moves)
+                self.assertFalse(wizard.error_count)
+
+    def test_declaration_scaling(self):
+        """Calcul des déclarations sur un exercice chargé"""
+        for index, lines in enumerate(SCALES):
+            with self.subTest(lines=lines):
+                company = self.companies[index % COMPANIES]
+                # Exercices croissants: la date de verrouillage ne fait qu'avancer
+                year = 2000 + index
+                self.generator.load_posted_ledger(company, self.partners, lines, year)
+                periods = {
+                    'dsf': (date(year, 1, 1), date(year, 12, 31)),
+                    'dipe': (date(year, 1, 1), date(year, 3, 31)),
+                    'vat_monthly': (date(year, 1, 1), date(year, 1, 31)),
+                    'withholding_tax': (date(year, 1, 1), date(year, 1, 31)),
+                }
+                for declaration_type, (date_from, date_to) in periods.items():
+                    wizard = self.env['fiscal.declaration.wizard'].create({
+                        'name': f'Benchmark {declaration_type}',
+                        'declaration_type': declaration_type,
+                        'fiscal_year': year,
+                        'date_from': date_from,
+                        'date_to': date_to,
+                        'company_id': company.id,
+                    })
+                    self._measure(f'declaration_{declaration_type}_{lines}', wizard.action_compute_declaration)
+
+                budget = self.env['account.budget'].create({
+                    'name': f'Benchmark {lines}',
+                    'fiscal_year': year,
+                    'date_from': date(year, 1, 1),
+                    'date_to': date(year, 12, 31),
+                    'company_id': company.id,
+                    'budget_line_ids': [(0, 0, {
+                        'account_id': account.id,
+                        'planned_amount': 1000000,
+                    }) for account in self.env['account.account'].search([
+                        ('company_id', '=', company.id),
+                        '|', ('code', '=like', '6%'), ('code', '=like', '7%'),
+                    ])],
+                })
+                self._measure(f'budget_realized_{lines}', budget.budget_line_ids._compute_realized_amount)
+                self.assertTrue(any(budget.budget_line_ids.mapped('realized_amount')))
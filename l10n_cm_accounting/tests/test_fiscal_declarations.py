@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from odoo import fields
 from odoo.tests.common import TransactionCase
+from lxml import etree
 from datetime import date
+from unittest.mock import patch
+import io
 
 
 class TestFiscalDeclarations(TransactionCase):
@@ -42,3 +46,501 @@ class TestFiscalDeclarations(TransactionCase):
             expected_dipe = wizard.total_sales * 0.022
             self.assertEqual(wizard.corporate_tax, expected_dipe, "Le calcul DIPE doit être correct")
 
+
+    def _create_ledger(self):
+        """Écritures comptabilisées sur une période isolée (mars 2031)"""
+        accounts = {}
+        for code, account_type in [('411950', 'asset_receivable'), ('701950', 'income'),
+                                   ('443950', 'liability_current'), ('601950', 'expense'),
+                                   ('445950', 'asset_current'), ('521950', 'asset_cash'),
+                                   ('421950', 'liability_current'), ('661950', 'expense')]:
+            accounts[code] = self.env['account.account'].create({
+                'code': code,
+                'name': f'Compte test {code}',
+                'account_type': account_type,
+                'reconcile': account_type == 'asset_receivable',
+                'company_id': self.company.id,
+            })
+        journal = self.env['account.journal'].create({
+            'name': 'Déclarations test',
+            'code': 'TDCL',
+            'type': 'general',
+            'company_id': self.company.id,
+        })
+        entries = [
+            [('411950', 1192500, 0), ('701950', 0, 1000000), ('443950', 0, 192500)],
+            [('601950', 400000, 0), ('445950', 77000, 0), ('521950', 0, 477000)],
+            [('661950', 300000, 0), ('421950', 0, 300000)],
+        ]
+        moves = self.env['account.move'].create([{
+            'journal_id': journal.id,
+            'date': date(2031, 3, 15),
+            'line_ids': [(0, 0, {
+                'account_id': accounts[code].id,
+                'name': 'Test',
+                'debit': debit,
+                'credit': credit,
+            }) for code, debit, credit in lines],
+        } for lines in entries])
+        moves.action_post()
+        # Une écriture brouillon n'est pas prise en compte
+        self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': date(2031, 3, 16),
+            'line_ids': [(0, 0, {'account_id': accounts['411950'].id, 'debit': 500, 'credit': 0}),
+                         (0, 0, {'account_id': accounts['701950'].id, 'debit': 0, 'credit': 500})],
+        })
+
+    def test_declarations_use_period_aggregates(self):
+        """Les montants sont agrégés par compte sur les seules écritures comptabilisées"""
+        self._create_ledger()
+        wizard = self.declaration_wizard.create({
+            'name': 'Test TVA mars 2031',
+            'declaration_type': 'vat_monthly',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        })
+        sales_account = self.env['account.account'].search([('code', '=', '701950'), ('company_id', '=', self.company.id)])
+        aggregates = wizard._get_account_aggregates()
+        self.assertEqual(aggregates[sales_account.id], (0.0, 1000000.0))
+
+        wizard.action_compute_declaration()
+        self.assertEqual(wizard.vat_collected, 192500)
+        self.assertEqual(wizard.vat_paid, 77000)
+        self.assertEqual(wizard.vat_due, 115500)
+
+        wizard.declaration_type = 'withholding_tax'
+        wizard.action_compute_declaration()
+        self.assertEqual(wizard.withholding_tax, 300000)
+
+        wizard.declaration_type = 'is'
+        wizard.action_compute_declaration()
+        self.assertEqual(wizard.total_sales, 1000000)
+        self.assertEqual(wizard.total_purchases, 700000)
+        self.assertEqual(wizard.corporate_tax, 300000 * 0.25)
+
+    def test_all_declarations_share_one_scan(self):
+        """Les cinq déclarations d'une période sont dérivées d'une seule lecture"""
+        self._create_ledger()
+        wizards = self.declaration_wizard.create([{
+            'name': f'Test {declaration_type} mars 2031',
+            'declaration_type': declaration_type,
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        } for declaration_type in ['dsf', 'dipe', 'is', 'vat_monthly', 'withholding_tax']])
+
+        Wizard = type(self.declaration_wizard)
+        with patch.object(Wizard, '_get_account_aggregates', autospec=True,
+                          side_effect=Wizard._get_account_aggregates) as scan:
+            wizards.action_compute_declaration()
+        self.assertEqual(scan.call_count, 1)
+
+        self.assertEqual(wizards.mapped('state'), ['computed'] * 5)
+        dsf, dipe, is_wizard, vat, withholding = wizards
+        self.assertEqual(dipe.corporate_tax, 1000000 * 0.022)
+        self.assertEqual(is_wizard.corporate_tax, 300000 * 0.25)
+        self.assertEqual(vat.vat_due, 115500)
+        self.assertEqual(withholding.withholding_tax, 300000)
+        self.assertEqual(dsf.total_sales, 1000000)
+
+        metrics = vat._compute_period_metrics()
+        self.assertEqual(metrics['classes']['7'], (0.0, 1000000.0))
+
+    def test_account_roles(self):
+        """Les comptes par rôle sont mis en cache jusqu'à la modification d'un compte"""
+        Account = self.env['account.account']
+        self._create_ledger()
+        accounts = {account.code: account for account in Account.search([
+            ('code', 'like', '%950'), ('company_id', '=', self.company.id)])}
+        sales_ids = Account._get_role_account_ids(self.company.id, 'sales')
+        self.assertIsInstance(sales_ids, frozenset)
+        self.assertIn(accounts['701950'].id, sales_ids)
+        self.assertNotIn(accounts['601950'].id, sales_ids)
+        self.assertIn(accounts['421950'].id, Account._get_role_account_ids(self.company.id, 'withholding'))
+
+        accounts['701950'].code = '601951'
+        self.assertNotIn(accounts['701950'].id, Account._get_role_account_ids(self.company.id, 'sales'))
+        self.assertIn(accounts['701950'].id, Account._get_role_account_ids(self.company.id, 'expenses'))
+
+        created = Account.create({
+            'code': '443951',
+            'name': 'TVA collectée test',
+            'account_type': 'liability_current',
+            'company_id': self.company.id,
+        })
+        self.assertIn(created.id, Account._get_role_account_ids(self.company.id, 'vat_collected'))
+        created.unlink()
+        self.assertNotIn(created.id, Account._get_role_account_ids(self.company.id, 'vat_collected'))
+
+    def test_comparative_declaration(self):
+        """La période et celle de l'exercice précédent sont lues en une seule requête"""
+        self._create_ledger()
+        accounts = {account.code: account for account in self.env['account.account'].search([
+            ('code', 'in', ['411950', '701950']), ('company_id', '=', self.company.id)])}
+        journal = self.env['account.journal'].search([('code', '=', 'TDCL'), ('company_id', '=', self.company.id)])
+        self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': date(2030, 3, 20),
+            'line_ids': [(0, 0, {'account_id': accounts['411950'].id, 'debit': 800000, 'credit': 0}),
+                         (0, 0, {'account_id': accounts['701950'].id, 'debit': 0, 'credit': 800000})],
+        }).action_post()
+        wizard = self.declaration_wizard.create({
+            'name': 'Test comparatif DSF mars 2031',
+            'declaration_type': 'dsf',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+            'comparative': True,
+        })
+
+        Summary = type(self.env['account.balance.monthly'])
+        Wizard = type(self.declaration_wizard)
+        with patch.object(Summary, '_get_account_totals_by_period', autospec=True,
+                          side_effect=Summary._get_account_totals_by_period) as scan, \
+                patch.object(Wizard, '_get_account_aggregates', autospec=True) as single_scan:
+            wizard.action_compute_declaration()
+        self.assertEqual(scan.call_count, 1)
+        self.assertFalse(single_scan.called)
+
+        self.assertEqual(wizard.state, 'computed')
+        self.assertEqual(wizard.total_sales, 1000000)
+        sales = wizard.comparison_line_ids.filtered(lambda line: line.name == wizard._fields['total_sales'].string)
+        self.assertEqual(sales.period_label, '01/03/2030 - 31/03/2030')
+        self.assertEqual(sales.amount, 1000000)
+        self.assertEqual(sales.comparison_amount, 800000)
+        self.assertEqual(sales.variance_amount, 200000)
+        self.assertAlmostEqual(sales.variance_percent, 25.0)
+        credit_labels = {wizard._fields[name].string for name in ('vat_credit_previous', 'vat_credit_carried')}
+        self.assertFalse(wizard.comparison_line_ids.filtered(lambda line: line.name in credit_labels))
+
+    def test_vat_breakdown_and_credit(self):
+        """La TVA est ventilée par taxe et le crédit du mois précédent est imputé"""
+        self._create_ledger()
+        sales_account = self.env['account.account'].search([('code', '=', '701950'), ('company_id', '=', self.company.id)])
+        tax = self.env['account.tax'].create({
+            'name': 'TVA 19,25% test',
+            'description': 'TVA 19,25% renommée',
+            'amount': 19.25,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+            'company_id': self.company.id,
+        })
+        # Taxe générée depuis le modèle du plan: retrouvée par son identifiant XML
+        self.env['ir.model.data']._update_xmlids([{
+            'xml_id': f'l10n_cm_accounting.{self.company.id}_tax_vat_1925_cm',
+            'record': tax,
+            'noupdate': True,
+        }])
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.env['res.partner'].create({'name': 'Client TVA test'}).id,
+            'invoice_date': date(2031, 3, 10),
+            'date': date(2031, 3, 10),
+            'invoice_line_ids': [(0, 0, {
+                'name': 'Prestation',
+                'quantity': 1,
+                'price_unit': 100000,
+                'account_id': sales_account.id,
+                'tax_ids': [(6, 0, tax.ids)],
+            })],
+        })
+        invoice.action_post()
+        self.env['fiscal.declaration'].create({
+            'name': 'TVA février 2031',
+            'company_id': self.company.id,
+            'declaration_type': 'vat_monthly',
+            'period_type': 'monthly',
+            'period_label': '2031-02',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 2, 1),
+            'date_to': date(2031, 2, 28),
+            'state': 'computed',
+            'vat_credit_carried': 200000,
+        })
+        wizard = self.declaration_wizard.create({
+            'name': 'Test TVA par taxe mars 2031',
+            'declaration_type': 'vat_monthly',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        })
+        wizard.action_compute_declaration()
+
+        line = wizard.vat_line_ids.filtered(lambda line: line.tax_id == tax)
+        self.assertEqual(line.type_tax_use, 'sale')
+        self.assertEqual(line.base_amount, 100000)
+        self.assertEqual(line.tax_amount, 19250)
+        exempt = wizard.vat_line_ids.filtered(lambda line: not line.tax_id)
+        self.assertEqual(exempt.base_amount, 1000000)
+
+        # 192 500 collectée - 77 000 déductible - 200 000 reportés
+        self.assertEqual(wizard.vat_credit_previous, 200000)
+        self.assertEqual(wizard.vat_due, 0)
+        self.assertEqual(wizard.vat_credit_carried, 84500)
+
+    def test_withholding_register(self):
+        """Les retenues sont regroupées par fournisseur et parcourues page par page"""
+        self._create_ledger()
+        accounts = {account.code: account for account in self.env['account.account'].search([
+            ('code', 'in', ['421950', '661950']), ('company_id', '=', self.company.id)])}
+        journal = self.env['account.journal'].search([('code', '=', 'TDCL'), ('company_id', '=', self.company.id)])
+        supplier = self.env['res.partner'].create({
+            'name': 'Fournisseur retenue test',
+            'taxpayer_identifier': 'P123456789A',
+            'tax_regime': 'reel_simplifie',
+        })
+        self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': date(2031, 3, 25),
+            'line_ids': [(0, 0, {'account_id': accounts['661950'].id, 'debit': 50000, 'credit': 0}),
+                         (0, 0, {'account_id': accounts['421950'].id, 'debit': 0, 'credit': 50000,
+                                 'partner_id': supplier.id})],
+        }).action_post()
+        wizard = self.declaration_wizard.create({
+            'name': 'Test registre des retenues mars 2031',
+            'declaration_type': 'withholding_tax',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        })
+        wizard.action_compute_declaration()
+
+        self.assertEqual(wizard.withholding_tax, 350000)
+        line = wizard.withholding_line_ids.filtered(lambda line: line.partner_id == supplier)
+        self.assertEqual(line.taxpayer_identifier, 'P123456789A')
+        self.assertEqual(line.tax_regime, 'reel_simplifie')
+        self.assertEqual(line.move_count, 1)
+        self.assertEqual(line.withheld_amount, 50000)
+        self.assertEqual(sum(wizard.withholding_line_ids.mapped('withheld_amount')), wizard.withholding_tax)
+        self.assertIn(('partner_id', '=', supplier.id), line.action_view_move_lines()['domain'])
+
+        first, key = wizard._get_withholding_lines(limit=1)
+        second, key = wizard._get_withholding_lines(after=key, limit=1)
+        last, key = wizard._get_withholding_lines(after=key, limit=1)
+        self.assertEqual([row[-1] for row in first + second], [300000, 50000])
+        self.assertEqual((last, key), ([], None))
+        rows, key = wizard._get_withholding_lines(partner_id=supplier.id)
+        self.assertEqual(len(rows), 1)
+        self.assertIsNone(key)
+
+        wizard.write({'annex_type': 'withholding_lines', 'annex_format': 'csv'})
+        attachment_id = int(wizard.action_export_annex()['url'].split('/')[3].split('?')[0])
+        rows = self.env['ir.attachment'].browse(attachment_id).raw.decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 3)
+
+        # Raison sociale au-delà de la longueur du schéma: tronquée, XML valide
+        supplier.name = 'Fournisseur ' * 30
+        for annex_type in ('withholding', 'withholding_lines'):
+            wizard.write({'annex_type': annex_type, 'annex_format': 'xml'})
+            attachment_id = int(wizard.action_export_annex()['url'].split('/')[3].split('?')[0])
+            root = etree.fromstring(self.env['ir.attachment'].browse(attachment_id).raw)
+            names = [line.findtext('RaisonSociale') for line in root.findall('Ligne')]
+            self.assertIn(supplier.name[:256], names)
+
+    def test_declaration_cache(self):
+        """Les résultats sont repris du cache jusqu'à une écriture de la période"""
+        self._create_ledger()
+        values = {
+            'name': 'Test cache TVA mars 2031',
+            'declaration_type': 'vat_monthly',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        }
+        Wizard = type(self.declaration_wizard)
+        with patch.object(Wizard, '_get_account_aggregates', autospec=True,
+                          side_effect=Wizard._get_account_aggregates) as scan:
+            first = self.declaration_wizard.create(values)
+            first.action_compute_declaration()
+            self.assertFalse(first.from_cache)
+
+            second = self.declaration_wizard.create(values)
+            second.action_compute_declaration()
+            self.assertTrue(second.from_cache)
+            self.assertEqual(second.vat_due, 115500)
+            self.assertEqual(scan.call_count, 1)
+
+            second.action_force_recompute()
+            self.assertFalse(second.from_cache)
+            self.assertEqual(scan.call_count, 2)
+
+        # Une écriture hors période ne touche pas le cache
+        journal = self.env['account.journal'].search([('code', '=', 'TDCL'), ('company_id', '=', self.company.id)])
+        accounts = {account.code: account for account in self.env['account.account'].search([
+            ('code', 'in', ['443950', '521950']), ('company_id', '=', self.company.id)])}
+        move = self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': date(2031, 4, 2),
+            'line_ids': [(0, 0, {'account_id': accounts['521950'].id, 'debit': 1000, 'credit': 0}),
+                         (0, 0, {'account_id': accounts['443950'].id, 'debit': 0, 'credit': 1000})],
+        })
+        move.action_post()
+        cache = self.env['fiscal.declaration.cache']._lookup(
+            self.company, 'vat_monthly', date(2031, 3, 1), date(2031, 3, 31))
+        self.assertTrue(cache)
+
+        # Déplacer l'écriture dans la période invalide l'entrée
+        move.button_draft()
+        move.date = date(2031, 3, 20)
+        move.action_post()
+        third = self.declaration_wizard.create(values)
+        third.action_compute_declaration()
+        self.assertFalse(third.from_cache)
+        self.assertEqual(third.vat_collected, 193500)
+
+    def test_declaration_run(self):
+        """Un lot calcule et enregistre toutes les déclarations de l'exercice"""
+        self._create_ledger()
+        run = self.env['fiscal.declaration.run'].create({
+            'name': 'Lot 2031',
+            'fiscal_year': 2031,
+            'company_ids': [(6, 0, self.company.ids)],
+            'include_dsf': False,
+            'include_withholding_tax': False,
+        })
+        run.action_start()
+        self.assertEqual(run.state, 'running')
+        # 12 mois de TVA, 4 trimestres de DIPE, 1 IS
+        self.assertEqual(run.declaration_count, 17)
+        self.assertEqual(run.queued_count, 17)
+
+        run._process_company(self.company.id)
+        run._check_done()
+        self.assertEqual(run.state, 'done')
+        self.assertEqual(run.computed_count, 17)
+
+        declarations = {(d.declaration_type, d.period_label): d for d in run.declaration_ids}
+        self.assertEqual(declarations['vat_monthly', '2031-03'].vat_due, 115500)
+        self.assertEqual(declarations['vat_monthly', '2031-04'].vat_due, 0)
+        self.assertEqual(declarations['dipe', '2031-T1'].corporate_tax, 1000000 * 0.022)
+        self.assertEqual(declarations['is', '2031'].corporate_tax, 300000 * 0.25)
+
+        # Relancer le lot ne duplique pas les déclarations et épargne celles soumises
+        declarations['vat_monthly', '2031-03'].action_submit_declaration()
+        run.action_start()
+        self.assertEqual(run.declaration_count, 17)
+        self.assertEqual(run.queued_count, 16)
+        self.assertEqual(declarations['vat_monthly', '2031-03'].state, 'submitted')
+
+    def test_month_end_run_limited_to_closed_periods(self):
+        """Le lot de fin de mois ne traite que les périodes closes par ce mois"""
+        self.company.account_fiscal_country_id = self.env.ref('base.cm')
+        other = self.env['res.company'].create({'name': 'Société hors Cameroun'})
+        other.account_fiscal_country_id = self.env.ref('base.fr')
+        with patch.object(fields.Date, 'context_today', return_value=date(2031, 4, 5)):
+            run = self.env['fiscal.declaration.run']._cron_month_end()
+        self.assertEqual(run.period_end, date(2031, 3, 31))
+        self.assertNotIn(other, run.company_ids)
+        declarations = run.declaration_ids.filtered(lambda declaration: declaration.company_id == self.company)
+        self.assertEqual(sorted(declarations.mapped('period_label')), ['2031-03', '2031-03', '2031-T1'])
+
+    def test_declaration_pdf_queue(self):
+        """Le PDF est rendu en arrière-plan, un seul rendu par type de déclaration"""
+        self._create_ledger()
+        wizard = self.declaration_wizard.create({
+            'name': 'Test PDF TVA mars 2031',
+            'declaration_type': 'vat_monthly',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+        })
+        wizard.action_compute_declaration()
+        wizard.action_generate_pdf()
+        self.assertEqual(wizard.state, 'generated')
+        self.assertEqual(wizard.pdf_state, 'queued')
+        declaration = wizard.declaration_id
+        self.assertEqual(declaration.period_label, '2031-03')
+        self.assertEqual(declaration.vat_due, 115500)
+
+        other = self.env['fiscal.declaration']._prepare_batch(self.company, ['vat_monthly'], 2031) - declaration
+        other[:1].write({'state': 'computed'})
+        other[:1].action_generate_pdf()
+        queued = declaration | other[:1]
+
+        Report = type(self.env['ir.actions.report'])
+
+        def fake_streams(report, report_ref, data, res_ids=None):
+            return {res_id: {'stream': io.BytesIO(b'%PDF-1.4 test'), 'attachment': None} for res_id in res_ids}
+
+        with patch.object(Report, '_render_qweb_pdf_prepare_streams', autospec=True,
+                          side_effect=fake_streams) as render:
+            queued._render_pdfs()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(queued.mapped('pdf_state'), ['done', 'done'])
+        self.assertEqual(declaration.pdf_attachment_id.res_model, 'fiscal.declaration')
+        self.assertEqual(declaration.pdf_attachment_id.raw, b'%PDF-1.4 test')
+
+        wizard.action_submit_declaration()
+        self.assertEqual(declaration.state, 'submitted')
+
+    def test_annex_export(self):
+        """Les annexes sont exportées ligne à ligne et le XML est conforme au schéma"""
+        self._create_ledger()
+        wizard = self.declaration_wizard.create({
+            'name': 'Test annexes mars 2031',
+            'declaration_type': 'vat_monthly',
+            'fiscal_year': 2031,
+            'date_from': date(2031, 3, 1),
+            'date_to': date(2031, 3, 31),
+            'company_id': self.company.id,
+            'annex_type': 'vat_invoices',
+            'annex_format': 'xml',
+        })
+        attachment_id = int(wizard.action_export_annex()['url'].split('/')[3].split('?')[0])
+        content = self.env['ir.attachment'].browse(attachment_id).raw
+        root = etree.fromstring(content)
+        self.assertEqual(root.tag, 'AnnexeTVAFactures')
+        lines = root.findall('Ligne')
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(sorted(line.findtext('TVACollectee') for line in lines), ['0.00', '192500.00'])
+
+        wizard.write({'annex_type': 'withholding', 'annex_format': 'csv'})
+        attachment_id = int(wizard.action_export_annex()['url'].split('/')[3].split('?')[0])
+        rows = self.env['ir.attachment'].browse(attachment_id).raw.decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].endswith(';1;300000.00'))
+
+    def test_trial_balance(self):
+        """La balance générale cumule les comptes de détail à chaque niveau de préfixe"""
+        self._create_ledger()
+        TrialBalance = self.env['account.trial.balance']
+        # Mars en mois entier (soldes mensuels) et à cheval sur deux mois (lignes)
+        for date_from, date_to in [(date(2031, 3, 1), date(2031, 3, 31)), (date(2031, 3, 10), date(2031, 4, 5))]:
+            nodes = {node['code']: node for node in TrialBalance._compute_trial_balance(self.company, date_from, date_to)}
+            self.assertEqual(nodes['701950']['credit'], 1000000)
+            self.assertEqual(nodes['7']['closing_credit'], 1000000)
+            self.assertEqual(nodes['70']['credit'], nodes['7019']['credit'])
+            self.assertTrue(nodes['701950']['leaf'])
+            self.assertFalse(nodes['70']['leaf'])
+            # Classe 4: 411950 débiteur, 443950 et 421950 créditeurs, 445950 débiteur
+            self.assertEqual(nodes['4']['debit'], 1192500 + 77000)
+            self.assertEqual(nodes['4']['credit'], 192500 + 300000)
+            self.assertEqual(nodes['44']['closing_credit'], 192500)
+            self.assertEqual(nodes['44']['closing_debit'], 77000)
+
+        # Solde d'ouverture: les écritures de mars ouvrent avril pour le bilan
+        nodes = {node['code']: node
+                 for node in TrialBalance._compute_trial_balance(self.company, date(2031, 4, 1), date(2031, 4, 30))}
+        self.assertEqual(nodes['411950']['opening_debit'], 1192500)
+        self.assertEqual(nodes['411950']['debit'], 0)
+        self.assertEqual(nodes['7']['opening_credit'], 1000000)
+
+        self.assertEqual(TrialBalance._check_plan_code('601950'), False)
+        self.assertEqual(TrialBalance._check_plan_code('809950'), 'chapter')
+        self.assertEqual(TrialBalance._check_plan_code('ABC1'), 'format')
+        outside = self.env['account.account'].create({
+            'code': '809950',
+            'name': 'Compte hors plan',
+            'account_type': 'expense',
+            'company_id': self.company.id,
+        })
+        self.assertEqual(TrialBalance._find_accounts_outside_plan(self.company).get(outside), 'chapter')
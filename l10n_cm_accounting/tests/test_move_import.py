@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests.common import TransactionCase
+from odoo.exceptions import UserError
+from unittest import skipIf
+import pandas as pd
+from datetime import date
+import base64
+import io
+import time
+from unittest.mock import patch
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class TestMoveImport(TransactionCase):
+
+    def setUp(self):
+        super(TestMoveImport, self).setUp()
+        self.company = self.env.company
+        self.journal = self.env['account.journal'].create({
+            'name': 'Import Test',
+            'code': 'TIMP',
+            'type': 'general',
+            'company_id': self.company.id,
+        })
+        self.account_debit = self.env['account.account'].create({
+            'name': 'Clients import',
+            'code': '411901',
+            'account_type': 'asset_receivable',
+            'reconcile': True,
+            'company_id': self.company.id,
+        })
+        self.account_credit = self.env['account.account'].create({
+            'name': 'Ventes import',
+            'code': '701901',
+            'account_type': 'income',
+            'company_id': self.company.id,
+        })
+        self.partner = self.env['res.partner'].create({
+            'name': 'Client Import',
+            'ref': 'CLI_IMPORT_001',
+        })
+        self.wizard = self.env['account.move.import'].create({
+            'name': 'Import Test',
+            'import_file': '',
+            'filename': 'test.xlsx',
+        })
+
+    def _make_frame(self, account_code='701901'):
+        return pd.DataFrame({
+            'Date': ['2025-01-15', '2025-01-15'],
+            'Journal': ['TIMP', 'TIMP'],
+            'Compte': [411901.0, account_code],
+            'Libelle': ['Vente', 'Vente'],
+            'Debit': [1000.0, 0.0],
+            'Credit': [0.0, 1000.0],
+            'Reference': ['REF001', 'REF001'],
+            'Tiers': ['CLI_IMPORT_001', None],
+        })
+
+    def test_lookups_resolve_distinct_codes(self):
+        """Les codes du fichier sont résolus en identifiants une seule fois"""
+        codes = self.wizard._collect_import_codes(self._make_frame())
+        lookups = self.wizard._build_import_lookups(codes)
+        self.assertEqual(lookups['accounts']['411901'], self.account_debit.id)
+        self.assertEqual(lookups['accounts']['701901'], self.account_credit.id)
+        self.assertEqual(lookups['journals']['TIMP'], self.journal.id)
+        self.assertEqual(lookups['partners']['CLI_IMPORT_001'], self.partner.id)
+
+    def test_unknown_codes_reported_before_creation(self):
+        """Les codes inconnus sont signalés avant toute création d'écriture"""
+        codes = self.wizard._collect_import_codes(self._make_frame(account_code='709999'))
+        lookups = self.wizard._build_import_lookups(codes)
+        errors = self.wizard._check_unknown_codes(codes, lookups)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['code'], 'unknown_account')
+        self.assertEqual((errors[0]['column'], errors[0]['value']), ('Compte', '709999'))
+        self.assertIn('709999', errors[0]['message'])
+
+    def test_create_move_from_group_uses_lookups(self):
+        """La création d'écriture n'utilise que les correspondances préchargées"""
+        df = self._make_frame()
+        lookups = self.wizard._build_import_lookups(self.wizard._collect_import_codes(df))
+        move = self.wizard._create_move_from_group(df, lookups)
+        self.assertEqual(move.journal_id, self.journal)
+        self.assertEqual(len(move.line_ids), 2)
+        self.assertEqual(move.line_ids.filtered('partner_id').partner_id, self.partner)
+
+    def test_batched_creation_falls_back_per_move(self):
+        """Un lot en échec est rejoué écriture par écriture"""
+        df = self._make_frame()
+        lookups = self.wizard._build_import_lookups(self.wizard._collect_import_codes(df))
+        good_vals = self.wizard._prepare_move_vals(df, lookups)
+        bad_vals = dict(good_vals, journal_id=False)
+        self.wizard.batch_size = 10
+        created_count, skipped_count, errors = self.wizard._create_moves_batched([
+            ('REF001', good_vals),
+            ('REF002', bad_vals),
+        ])
+        self.assertEqual(created_count, 1)
+        self.assertEqual(skipped_count, 0)
+        self.assertEqual([ref for ref, error in errors], ['REF002'])
+
+    def _csv_content(self):
+        return "\n".join([
+            "Date;Journal;Compte;Libelle;Debit;Credit;Reference;Tiers",
+            "2025-01-15;TIMP;411901;Vente 1;1000;0;REF001;CLI_IMPORT_001",
+            "2025-01-15;TIMP;701901;Vente 1;0;1000;REF001;",
+            "2025-01-16;TIMP;411901;Vente 2;500;0;REF002;CLI_IMPORT_001",
+            "2025-01-16;TIMP;701901;Vente 2;0;500;REF002;",
+        ])
+
+    def test_stream_import_csv(self):
+        """Le mode flux importe un fichier CSV paquet par paquet"""
+        content = self._csv_content()
+        wizard = self.env['account.move.import'].create({
+            'name': 'Import CSV',
+            'import_file': base64.b64encode(content.encode('utf-8')),
+            'filename': 'ecritures.csv',
+            'import_mode': 'stream',
+        })
+        chunks = list(wizard._iter_import_chunks(chunk_rows=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 2)
+        self.assertEqual(wizard.error_count, 0)
+
+    def test_batch_csv_keeps_leading_zeros(self):
+        """Les codes CSV gardent leurs zéros initiaux"""
+        partner = self.env['res.partner'].create({'name': 'Client Zéro', 'ref': '00123'})
+        content = "\n".join([
+            "Date;Journal;Compte;Libelle;Debit;Credit;Reference;Tiers",
+            "2025-01-15;TIMP;411901;Vente;1000,50;0;0042;00123",
+            "2025-01-15;TIMP;701901;Vente;0;1000,50;0042;",
+        ])
+        wizard = self.env['account.move.import'].create({
+            'name': 'Import CSV zéros',
+            'import_file': base64.b64encode(content.encode('utf-8')),
+            'filename': 'ecritures.csv',
+            'import_mode': 'batch',
+        })
+        self.assertEqual(list(wizard._read_import_dataframe()['Tiers'][:1]), ['00123'])
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 1)
+        move = self.env['account.move'].search([('journal_id', '=', self.journal.id)])
+        self.assertEqual(move.ref, '0042')
+        self.assertEqual(move.line_ids.filtered('partner_id').partner_id, partner)
+
+    def test_vectorised_validation_error_table(self):
+        """La validation produit toute la table d'erreurs en une passe"""
+        df = pd.DataFrame({
+            'Date': ['2025-01-15', '2025-01-15', '31/13/2025', '16-01-2025'],
+            'Journal': ['TIMP', 'TIMP', 'TIMP', 'TIMP'],
+            'Compte': ['411901', '701901', '411901', '701901'],
+            'Libelle': ['A', 'A', 'B', 'B'],
+            'Debit': [1000.0, 0.0, 500.0, 0.0],
+            'Credit': [0.0, 900.0, 0.0, 500.0],
+            'Reference': ['REF001', 'REF001', 'REF002', 'REF002'],
+        })
+        lookups = self.wizard._build_import_lookups(self.wizard._collect_import_codes(df))
+        df = self.wizard._annotate_import_frame(df, lookups)
+        errors = self.wizard._validate_import_frame(df, lookups)
+        self.assertEqual(
+            sorted((error['code'], error['reference']) for error in errors),
+            [('invalid_date', 'REF002'), ('unbalanced', 'REF001')])
+        unbalanced = [error for error in errors if error['code'] == 'unbalanced'][0]
+        self.assertEqual(unbalanced['rows'], [2, 3])
+
+    def test_decimal_comma_and_invalid_amounts(self):
+        """Les montants à virgule décimale sont lus, les illisibles signalés"""
+        df = self._make_frame()
+        df['Debit'] = ['1 000,50', '0']
+        df['Credit'] = ['0', 'mille']
+        df = self.wizard._clean_import_frame(df)
+        self.assertEqual(list(df['Debit']), [1000.5, 0.0])
+        lookups = self.wizard._build_import_lookups(self.wizard._collect_import_codes(df))
+        errors = self.wizard._validate_import_frame(self.wizard._annotate_import_frame(df, lookups), lookups)
+        invalid = [error for error in errors if error['code'] == 'invalid_amount']
+        self.assertEqual([(error['rows'], error['message']) for error in invalid], [([3], "Montant invalide: mille")])
+
+    def test_parse_date_column_mixed_cells(self):
+        """Les dates typées, numéros de série Excel et textes sont convertis"""
+        parsed = self.wizard._parse_date_column(pd.Series([date(2025, 1, 15), 45673, ' 16/01/2025', 'x']))
+        self.assertEqual(list(parsed[:3].dt.date), [date(2025, 1, 15), date(2025, 1, 16), date(2025, 1, 16)])
+        self.assertTrue(pd.isna(parsed[3]))
+        serials = self.wizard._parse_date_column(pd.Series([45672.0, 45673.0]))
+        self.assertEqual(list(serials.dt.date), [date(2025, 1, 15), date(2025, 1, 16)])
+
+    def test_background_job_resumes_from_checkpoint(self):
+        """Une tâche reprend après le dernier groupe validé"""
+        attachment = self.env['ir.attachment'].create({
+            'name': 'ecritures.csv',
+            'raw': self._csv_content().encode('utf-8'),
+        })
+        job = self.env['account.move.import.job'].create({
+            'name': 'Import en tâche de fond',
+            'filename': 'ecritures.csv',
+            'attachment_id': attachment.id,
+            'batch_size': 1,
+            'state': 'running',
+            'groups_done': 1,
+            'groups_total': 2,
+            'rows_done': 2,
+            'rows_total': 4,
+        })
+        with patch.object(type(self.env.cr), 'commit', lambda cr: None):
+            finished = job._process(time.monotonic() + 60)
+        self.assertTrue(finished)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.success_count, 1)
+        self.assertEqual(job.groups_done, 2)
+        self.assertEqual(job.progress, 100.0)
+        moves = self.env['account.move'].search([('journal_id', '=', self.journal.id)])
+        self.assertEqual(moves.mapped('ref'), ['REF002'])
+
+    def test_partitions_keep_each_journal_on_one_worker(self):
+        """Chaque journal est affecté à une seule partition, de taille équilibrée"""
+        attachment = self.env['ir.attachment'].create({
+            'name': 'ecritures.csv',
+            'raw': self._csv_content().encode('utf-8'),
+        })
+        job = self.env['account.move.import.job'].create({
+            'name': 'Import partitionné',
+            'filename': 'ecritures.csv',
+            'attachment_id': attachment.id,
+            'partition_count': 2,
+        })
+        job._create_partitions({11: [10, 40], 12: [5, 20], 13: [5, 20]})
+        partitions = {child.partition_journals: child.rows_total for child in job.child_ids}
+        self.assertEqual(partitions, {'11': 40, '12,13': 40})
+
+        job.child_ids.write({'state': 'done', 'success_count': 10})
+        job._merge_partitions()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.success_count, 20)
+
+    def test_partitions_follow_resolved_journal(self):
+        """Un code journal vide et le code du journal par défaut vont à la même partition"""
+        content = self._csv_content().replace(';TIMP;701901;Vente 2;', ';;701901;Vente 2;')
+        content = content.replace(';TIMP;411901;Vente 2;', ';;411901;Vente 2;')
+        attachment = self.env['ir.attachment'].create({
+            'name': 'ecritures.csv',
+            'raw': content.encode('utf-8'),
+        })
+        job = self.env['account.move.import.job'].create({
+            'name': 'Import partitionné par journal résolu',
+            'filename': 'ecritures.csv',
+            'attachment_id': attachment.id,
+            'journal_id': self.journal.id,
+            'partition_count': 2,
+        })
+        self.assertTrue(job._validate_file())
+        self.assertFalse(job.child_ids)
+
+        with patch.object(type(job), '_create_partitions') as create_partitions:
+            job.journal_id = self.env['account.journal'].create({
+                'name': 'Import défaut', 'code': 'TDEF', 'type': 'general', 'company_id': self.company.id,
+            })
+            job._validate_file()
+        create_partitions.assert_called_once_with({self.journal.id: [1, 2], job.journal_id.id: [1, 2]})
+
+    def test_fiscal_years_created_in_one_batch(self):
+        """Les exercices décalés existants sont respectés, les manquants créés d'un coup"""
+        FiscalYear = self.env['cm.fiscal.year']
+        FiscalYear.search([('company_id', '=', self.company.id)]).unlink()
+        shifted_year = FiscalYear.create({
+            'name': '2024-2025',
+            'date_start': date(2024, 7, 1),
+            'date_end': date(2025, 6, 30),
+            'company_id': self.company.id,
+        })
+        result = self.wizard._ensure_fiscal_years({date(2025, 3, 1), date(2025, 9, 1), date(2025, 11, 30)})
+        self.assertEqual(result[date(2025, 3, 1)], shifted_year.id)
+        new_year = FiscalYear.browse(result[date(2025, 9, 1)])
+        self.assertEqual((new_year.date_start, new_year.date_end), (date(2025, 7, 1), date(2025, 12, 31)))
+        self.assertEqual(result[date(2025, 11, 30)], new_year.id)
+        self.assertEqual(FiscalYear.search_count([('company_id', '=', self.company.id)]), 2)
+
+    def test_partner_index_matching(self):
+        """Rapprochement par référence, numéro de contribuable et nom normalisé"""
+        Partner = self.env['res.partner']
+        taxpayer = Partner.create({'name': 'Société Générale Import', 'taxpayer_identifier': 'P123456789A'})
+        accented = Partner.create({'name': 'Éts Ngono & Fils'})
+        Partner.create({'name': 'Client Doublon'})
+        Partner.create({'name': 'client doublon'})
+
+        index = Partner._cm_build_match_index(self.company)
+        matches, ambiguous = Partner._cm_match_partners(
+            ['CLI_IMPORT_001', 'p123456789a', 'ets ngono fils', 'Client Doublon'], index, self.company)
+        self.assertEqual(matches['CLI_IMPORT_001'], self.partner.id)
+        self.assertEqual(matches['p123456789a'], taxpayer.id)
+        self.assertEqual(matches['ets ngono fils'], accented.id)
+        self.assertIn('Client Doublon', ambiguous)
+        self.assertEqual(len(ambiguous['Client Doublon']), 2)
+
+    def test_reimport_skips_existing_fingerprints(self):
+        """Un second import du même fichier ne recrée aucune écriture"""
+        wizard = self.env['account.move.import'].create({
+            'name': 'Import CSV',
+            'import_file': base64.b64encode(self._csv_content().encode('utf-8')),
+            'filename': 'ecritures.csv',
+            'import_mode': 'batch',
+        })
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 2)
+
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 0)
+        self.assertEqual(wizard.skipped_count, 2)
+        moves = self.env['account.move'].search([('journal_id', '=', self.journal.id)])
+        self.assertEqual(len(moves), 2)
+        self.assertTrue(all(moves.mapped('import_fingerprint')))
+
+    def test_unreferenced_moves_not_deduplicated(self):
+        """Les écritures sans référence n'ont pas d'empreinte et sont toutes gardées"""
+        df = self._make_frame()
+        df['Reference'] = None
+        lookups = self.wizard._build_import_lookups(self.wizard._collect_import_codes(df))
+        df = self.wizard._annotate_import_frame(df, lookups)
+        df['_ref'] = 'LIGNE'
+        vals = self.wizard._prepare_moves_from_frame(df)[0][1]
+        self.assertNotIn('import_fingerprint', vals)
+        to_create, skipped_count = self.wizard._filter_imported_moves([('1', vals), ('2', dict(vals))])
+        self.assertEqual((len(to_create), skipped_count), (2, 0))
+
+    def test_historical_load_closed_period(self):
+        """Le chargement historique insère des écritures comptabilisées auditées"""
+        self.company.fiscalyear_lock_date = date(2025, 12, 31)
+        wizard = self.env['account.move.import'].create({
+            'name': 'Historique 2025',
+            'import_file': base64.b64encode(self._csv_content().encode('utf-8')),
+            'filename': 'historique.csv',
+            'import_mode': 'historical',
+        })
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 2)
+
+        audit = self.env['account.move.import.audit'].search([('name', '=', 'Historique 2025')])
+        self.assertEqual(audit.state, 'done')
+        self.assertEqual(audit.move_count, 2)
+        self.assertEqual(audit.line_count, 4)
+        self.assertEqual(audit.total_debit, 1500)
+        moves = audit.move_ids.sorted('sequence_number')
+        self.assertEqual(moves.mapped('state'), ['posted', 'posted'])
+        # Numérotation ordinaire du journal
+        self.assertEqual(moves.mapped('sequence_number'), [1, 2])
+        self.assertTrue(all(move.name.startswith('TIMP/2025/') for move in moves))
+        self.assertEqual(moves[0].line_ids.filtered('partner_id').partner_id, self.partner)
+        self.assertEqual(sum(moves.line_ids.mapped('balance')), 0)
+
+        # Le même fichier n'est pas chargé une seconde fois
+        again = self.env['account.move.import'].create({
+            'name': 'Historique 2025 bis',
+            'import_file': base64.b64encode(self._csv_content().encode('utf-8')),
+            'filename': 'historique.csv',
+            'import_mode': 'historical',
+        })
+        with self.assertRaises(UserError):
+            again.action_import_moves()
+        self.assertEqual(self.env['account.move'].search_count([('journal_id', '=', self.journal.id)]), 2)
+
+        # Une écriture saisie ensuite continue la numérotation du journal
+        self.company.fiscalyear_lock_date = False
+        move = self.env['account.move'].create({
+            'journal_id': self.journal.id,
+            'date': date(2025, 1, 20),
+            'line_ids': [(0, 0, {'account_id': self.account_debit.id, 'debit': 100, 'credit': 0}),
+                         (0, 0, {'account_id': self.account_credit.id, 'debit': 0, 'credit': 100})],
+        })
+        move.action_post()
+        self.assertEqual(move.sequence_prefix, moves[1].sequence_prefix)
+        self.assertEqual(move.sequence_number, 3)
+        self.assertEqual(move.name, moves[1].name[:-1] + '3')
+
+    def test_historical_load_rejects_open_period(self):
+        """Le chargement historique refuse les dates de périodes ouvertes"""
+        self.company.fiscalyear_lock_date = False
+        wizard = self.env['account.move.import'].create({
+            'name': 'Historique ouvert',
+            'import_file': base64.b64encode(self._csv_content().encode('utf-8')),
+            'filename': 'historique.csv',
+            'import_mode': 'historical',
+        })
+        wizard.action_import_moves()
+        self.assertEqual(wizard.success_count, 0)
+        self.assertEqual(set(wizard.error_ids.mapped('error_code')), {'open_period'})
+        self.assertFalse(self.env['account.move.import.audit'].search([('name', '=', 'Historique ouvert')]))
+
+    @skipIf(openpyxl is None, "openpyxl n'est pas installé")
+    def test_errors_stored_as_records_and_exported(self):
+        """Les erreurs sont enregistrées une par référence et exportables en XLSX"""
+        content = "\n".join([
+            "Date;Journal;Compte;Libelle;Debit;Credit;Reference;Tiers",
+            "2025-01-15;TIMP;411901;Vente 1;1000;0;REF001;",
+            "2025-01-15;TIMP;701901;Vente 1;0;900;REF001;",
+            "2025-01-16;TIMP;411901;Vente 2;500;0;REF002;",
+            "2025-01-16;TIMP;701901;Vente 2;0;500;REF002;",
+        ])
+        wizard = self.env['account.move.import'].create({
+            'name': 'Import en erreur',
+            'import_file': base64.b64encode(content.encode('utf-8')),
+            'filename': 'ecritures.csv',
+            'import_mode': 'batch',
+        })
+        wizard.action_import_moves()
+        self.assertEqual(wizard.error_count, 1)
+        self.assertFalse(wizard.error_log)
+        error = wizard.error_ids
+        self.assertEqual((error.error_code, error.reference, error.row_numbers), ('unbalanced', 'REF001', '2, 3'))
+
+        action = wizard.action_export_import_errors()
+        attachment = self.env['ir.attachment'].browse(int(action['url'].split('/')[-1].split('?')[0]))
+        workbook = openpyxl.load_workbook(io.BytesIO(attachment.raw), read_only=True)
+        rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][-2:], ('Ligne du fichier', 'Erreurs'))
+        self.assertEqual([row[-2] for row in rows[1:]], [2, 3])
+
+        wizard.action_import_moves()
+        self.assertEqual(wizard.error_count, 1)
+        self.assertEqual(len(wizard.error_ids), 1)
+
+    def test_preview_scans_file_once(self):
+        """L'aperçu affiche les premières lignes et les statistiques du fichier"""
+        wizard = self.env['account.move.import'].create({
+            'name': 'Aperçu CSV',
+            'import_file': base64.b64encode(self._csv_content().encode('utf-8')),
+            'filename': 'ecritures.csv',
+        })
+        head, stats = wizard._scan_import_file(preview_rows=3)
+        self.assertEqual(len(head), 3)
+        self.assertEqual(stats['rows'], 4)
+        self.assertEqual(stats['journals'], ['TIMP'])
+        self.assertEqual(stats['accounts'], ['411901', '701901'])
+        self.assertEqual((stats['date_from'], stats['date_to']), (date(2025, 1, 15), date(2025, 1, 16)))
+        self.assertEqual((stats['debit'], stats['credit']), (1500.0, 1500.0))
+
+        wizard.action_preview_import()
+        self.assertEqual(wizard.preview_row_count, 4)
+        self.assertEqual(wizard.preview_account_count, 2)
+        self.assertIn('REF001', wizard.preview_data)
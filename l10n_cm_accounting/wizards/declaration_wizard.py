@@ -4,8 +4,8 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from datetime import datetime, date, timedelta
-import base64
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -13,30 +13,10 @@ _logger = logging.getLogger(__name__)
 
 class FiscalDeclarationWizard(models.TransientModel):
     _name = 'fiscal.declaration.wizard'
+    _inherit = ['fiscal.declaration.mixin']
     """Prepare and export fiscal declaration files."""
     _description = "Assistant de Déclarations Fiscales Camerounaises"
 
-    name = fields.Char(string="Nom de la déclaration", required=True)
-    declaration_type = fields.Selection([
-        ('dsf', "Déclaration Statistique et Fiscale (DSF)"),
-        ('dipe', "Déclaration d'Impôt Provisionnel des Entreprises (DIPE)"),
-        ('is', "Impôt sur les Sociétés (IS)"),
-        ('vat_monthly', 'Déclaration TVA Mensuelle'),
-        ('withholding_tax', 'Déclaration Retenues à la Source')
-    ], string="Type de déclaration", required=True, default='dsf')
-
-    period_type = fields.Selection([
-        ('monthly', 'Mensuelle'),
-        ('quarterly', 'Trimestrielle'),
-        ('annual', 'Annuelle')
-    ], string="Périodicité", default='monthly')
-
-    fiscal_year = fields.Integer(
-        string="Exercice fiscal",
-        default=lambda self: datetime.now().year,
-        required=True
-    )
-
     period_month = fields.Selection([
         ('01', 'Janvier'), ('02', 'Février'), ('03', 'Mars'),
         ('04', 'Avril'), ('05', 'Mai'), ('06', 'Juin'),
@@ -49,16 +29,6 @@ class FiscalDeclarationWizard(models.TransientModel):
         ('Q3', '3ème Trimestre'), ('Q4', '4ème Trimestre')
     ], string="Trimestre")
 
-    date_from = fields.Date(string="Date de début", required=True)
-    date_to = fields.Date(string="Date de fin", required=True)
-
-    company_id = fields.Many2one(
-        'res.company',
-        string="Société",
-        default=lambda self: self.env.company,
-        required=True
-    )
-
     state = fields.Selection([
         ('draft', 'Brouillon'),
         ('computed', 'Calculé'),
@@ -66,24 +36,22 @@ class FiscalDeclarationWizard(models.TransientModel):
         ('submitted', 'Soumis')
     ], string="État", default='draft')
 
-    # Résultats calculés
-    total_sales = fields.Monetary(string="Total des ventes", currency_field='currency_id')
-    total_purchases = fields.Monetary(string="Total des achats", currency_field='currency_id')
-    vat_collected = fields.Monetary(string="TVA collectée", currency_field='currency_id')
-    vat_paid = fields.Monetary(string="TVA payée", currency_field='currency_id')
-    vat_due = fields.Monetary(string="TVA due", currency_field='currency_id')
-    withholding_tax = fields.Monetary(string="Retenues à la source", currency_field='currency_id')
-    corporate_tax = fields.Monetary(string="Impôt sur les sociétés", currency_field='currency_id')
-
-    currency_id = fields.Many2one(
-        'res.currency',
-        related='company_id.currency_id',
-        readonly=True
-    )
-
     report_data = fields.Text(string="Données du rapport")
-    pdf_file = fields.Binary(string="Fichier PDF")
-    pdf_filename = fields.Char(string="Nom du fichier PDF")
+    declaration_id = fields.Many2one('fiscal.declaration', string="Déclaration enregistrée", readonly=True)
+    pdf_state = fields.Selection(related='declaration_id.pdf_state', string="PDF")
+    pdf_attachment_id = fields.Many2one(related='declaration_id.pdf_attachment_id')
+    pdf_error = fields.Text(related='declaration_id.pdf_error')
+
+    # Mode comparatif N / N-1
+    comparative = fields.Boolean(string="Comparer aux exercices précédents",
+                                 help="Calculer la même période des exercices précédents dans la même requête")
+    comparison_years = fields.Integer(string="Exercices comparés", default=1)
+    comparison_line_ids = fields.One2many('fiscal.declaration.comparison.line', 'wizard_id',
+                                          string="Comparatif", readonly=True)
+    vat_line_ids = fields.One2many('fiscal.declaration.wizard.vat.line', 'wizard_id', string="TVA par taxe",
+                                   readonly=True)
+    withholding_line_ids = fields.One2many('fiscal.declaration.wizard.withholding.line', 'wizard_id',
+                                           string="Registre des retenues", readonly=True)
 
     @api.onchange('declaration_type')
     def _onchange_declaration_type(self):
@@ -125,22 +93,63 @@ class FiscalDeclarationWizard(models.TransientModel):
                 self.date_to = date(self.fiscal_year, end_month + 1, 1) - timedelta(days=1)
 
     def action_compute_declaration(self):
-        """Calculer les montants de la déclaration"""
+        """Calculer les montants et afficher les résultats"""
+        comparative = self.filtered('comparative')
+        (self - comparative)._compute_declarations()
+        for wizard in comparative:
+            wizard._compute_comparison()
+        if len(self) != 1:
+            return True
+        return self._reopen()
+
+    def _get_comparison_periods(self):
+        """Même période décalée de 1 à ``comparison_years`` exercices en arrière"""
         self.ensure_one()
+        # Une fin de mois reste une fin de mois (29 février)
+        end_shift = relativedelta(day=31) if (self.date_to + timedelta(days=1)).day == 1 else relativedelta()
+        return [
+            (self.date_from - relativedelta(years=years), self.date_to - relativedelta(years=years) + end_shift)
+            for years in range(1, self.comparison_years + 1)
+        ]
 
-        if self.declaration_type == 'dsf':
-            self._generate_dsf_declaration()
-        elif self.declaration_type == 'dipe':
-            self._generate_dipe_declaration()
-        elif self.declaration_type == 'is':
-            self._generate_is_declaration()
-        elif self.declaration_type == 'vat_monthly':
-            self._generate_vat_declaration()
-        elif self.declaration_type == 'withholding_tax':
-            self._generate_withholding_declaration()
-
-        self.state = 'computed'
+    def _compute_comparison(self):
+        """Calculer la période et ses périodes de comparaison en une seule lecture.
 
+        Les lignes de toutes les périodes sont agrégées par une même requête
+        groupée par période: le coût est proche de celui d'une seule période.
+        Le cache n'est pas utilisé, la période courante est mise à jour.
+        Les montants comparés sont les montants bruts des indicateurs pour
+        toutes les périodes, avant imputation du crédit de TVA reporté.
+        """
+        self.ensure_one()
+        if self.comparison_years < 1:
+            raise UserError(_("Le nombre d'exercices comparés doit être au moins 1."))
+        comparison_periods = self._get_comparison_periods()
+        metrics = self._compute_metrics_by_period([(self.date_from, self.date_to)] + comparison_periods)
+        current = self._apply_metrics(metrics[0])
+        figures = list(self._declaration_values_from_metrics(self.declaration_type, metrics[0]).items())
+
+        lines = [(5, 0, 0)]
+        for (date_from, date_to), period_metrics in zip(comparison_periods, metrics[1:]):
+            previous = self._declaration_values_from_metrics(self.declaration_type, period_metrics)
+            period_label = (str(date_from.year) if self.period_type == 'annual'
+                            else f"{date_from.strftime('%d/%m/%Y')} - {date_to.strftime('%d/%m/%Y')}")
+            for sequence, (field_name, amount) in enumerate(figures):
+                comparison_amount = previous.get(field_name, 0.0)
+                variance = amount - comparison_amount
+                lines.append((0, 0, {
+                    'sequence': sequence,
+                    'name': self._fields[field_name].string,
+                    'period_label': period_label,
+                    'amount': amount,
+                    'comparison_amount': comparison_amount,
+                    'variance_amount': variance,
+                    'variance_percent': variance / abs(comparison_amount) * 100 if comparison_amount else 0.0,
+                }))
+        self.comparison_line_ids = lines
+        return current
+
+    def _reopen(self):
         return {
             'type': 'ir.actions.act_window',
             'res_model': self._name,
@@ -150,253 +159,31 @@ class FiscalDeclarationWizard(models.TransientModel):
             'context': {'show_results': True}
         }
 
-    def _generate_dsf_declaration(self):
-        """Générer la Déclaration Statistique et Fiscale (DSF)"""
-        # Récupérer les données comptables pour la période
-        domain = [
-            ('company_id', '=', self.company_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('state', '=', 'posted')
-        ]
-
-        moves = self.env['account.move'].search(domain)
-
-        # Calculs pour DSF
-        sales_accounts = self.env['account.account'].search([
-            ('code', '=like', '7%'),  # Comptes de produits SYSCOHADA
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        purchase_accounts = self.env['account.account'].search([
-            ('code', '=like', '6%'),  # Comptes de charges SYSCOHADA
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        # Calculer le chiffre d'affaires (classe 7)
-        sales_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in sales_accounts and l.credit > 0
-        )
-        self.total_sales = sum(sales_lines.mapped('credit'))
-
-        # Calculer les achats (classe 6)
-        purchase_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in purchase_accounts and l.debit > 0
-        )
-        self.total_purchases = sum(purchase_lines.mapped('debit'))
-
-        # TVA collectée (compte 443)
-        vat_collected_account = self.env['account.account'].search([
-            ('code', '=', '443000'),
-            ('company_id', '=', self.company_id.id)
-        ], limit=1)
-
-        if vat_collected_account:
-            vat_collected_lines = moves.line_ids.filtered(
-                lambda l: l.account_id == vat_collected_account and l.credit > 0
-            )
-            self.vat_collected = sum(vat_collected_lines.mapped('credit'))
-
-        # TVA payée (compte 445)
-        vat_paid_account = self.env['account.account'].search([
-            ('code', '=', '445000'),
-            ('company_id', '=', self.company_id.id)
-        ], limit=1)
-
-        if vat_paid_account:
-            vat_paid_lines = moves.line_ids.filtered(
-                lambda l: l.account_id == vat_paid_account and l.debit > 0
-            )
-            self.vat_paid = sum(vat_paid_lines.mapped('debit'))
-
-        self.vat_due = self.vat_collected - self.vat_paid
-
-        _logger.info(f"DSF calculée - CA: {self.total_sales}, Achats: {self.total_purchases}, TVA due: {self.vat_due}")
-
-    def _generate_dipe_declaration(self):
-        """Générer la Déclaration d'Impôt Provisionnel des Entreprises (DIPE)"""
-        # DIPE est basé sur le CA du trimestre précédent
-        # Taux standard: 2,2% du CA
-
-        # Calculer le CA du trimestre
-        sales_domain = [
-            ('company_id', '=', self.company_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('state', '=', 'posted')
-        ]
-
-        moves = self.env['account.move'].search(sales_domain)
-
-        # Comptes de ventes (classe 7)
-        sales_accounts = self.env['account.account'].search([
-            ('code', '=like', '7%'),
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        sales_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in sales_accounts and l.credit > 0
-        )
-        self.total_sales = sum(sales_lines.mapped('credit'))
-
-        # Calcul DIPE: 2,2% du CA trimestriel
-        dipe_rate = 0.022
-        self.corporate_tax = self.total_sales * dipe_rate
-
-        _logger.info(f"DIPE calculée - CA trimestre: {self.total_sales}, DIPE: {self.corporate_tax}")
-
-    def _generate_is_declaration(self):
-        """Générer la déclaration d'Impôt sur les Sociétés (IS)"""
-        # IS annuel: 30% pour les grandes entreprises, 25% pour les PME
-
-        # Calculer le résultat fiscal
-        profit_loss_accounts = self.env['account.account'].search([
-            ('code', 'in', ['131000', '129000']),  # Bénéfice/Perte
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        moves_domain = [
-            ('company_id', '=', self.company_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('state', '=', 'posted')
-        ]
-
-        moves = self.env['account.move'].search(moves_domain)
-
-        # Calculer le résultat comptable
-        income_accounts = self.env['account.account'].search([
-            ('code', '=like', '7%'),
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        expense_accounts = self.env['account.account'].search([
-            ('code', '=like', '6%'),
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        # Total des produits
-        income_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in income_accounts and l.credit > 0
-        )
-        total_income = sum(income_lines.mapped('credit'))
-
-        # Total des charges
-        expense_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in expense_accounts and l.debit > 0
-        )
-        total_expenses = sum(expense_lines.mapped('debit'))
-
-        # Résultat comptable
-        accounting_result = total_income - total_expenses
-
-        # Déterminer le taux IS selon la taille de l'entreprise
-        # PME (CA < 1 milliard): 25%, Grandes entreprises: 30%
-        if self.total_sales < 1000000000:
-            is_rate = 0.25  # 25% pour PME
-        else:
-            is_rate = 0.30  # 30% pour grandes entreprises
-
-        # IS = Résultat fiscal * Taux
-        # (Simplification: résultat fiscal = résultat comptable)
-        if accounting_result > 0:
-            self.corporate_tax = accounting_result * is_rate
-        else:
-            self.corporate_tax = 0
-
-        self.total_sales = total_income
-        self.total_purchases = total_expenses
-
-        _logger.info(f"IS calculé - Résultat: {accounting_result}, IS: {self.corporate_tax}")
-
-    def _generate_vat_declaration(self):
-        """Générer la déclaration TVA mensuelle"""
-        # Récupérer les mouvements de TVA
-        moves_domain = [
-            ('company_id', '=', self.company_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('state', '=', 'posted')
-        ]
-
-        moves = self.env['account.move'].search(moves_domain)
-
-        # TVA collectée (compte 443)
-        vat_collected_account = self.env['account.account'].search([
-            ('code', '=like', '443%'),
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        vat_collected_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in vat_collected_account and l.credit > 0
-        )
-        self.vat_collected = sum(vat_collected_lines.mapped('credit'))
-
-        # TVA déductible (compte 445)
-        vat_deductible_account = self.env['account.account'].search([
-            ('code', '=like', '445%'),
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        vat_deductible_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in vat_deductible_account and l.debit > 0
-        )
-        self.vat_paid = sum(vat_deductible_lines.mapped('debit'))
-
-        # TVA nette due
-        self.vat_due = self.vat_collected - self.vat_paid
-
-        _logger.info(f"TVA mensuelle - Collectée: {self.vat_collected}, Déductible: {self.vat_paid}, Due: {self.vat_due}")
-
-    def _generate_withholding_declaration(self):
-        """Générer la déclaration des retenues à la source"""
-        # Rechercher les retenues effectuées
-        withholding_accounts = self.env['account.account'].search([
-            ('code', '=like', '421%'),  # Comptes de retenues
-            ('company_id', '=', self.company_id.id)
-        ])
-
-        moves_domain = [
-            ('company_id', '=', self.company_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('state', '=', 'posted')
-        ]
-
-        moves = self.env['account.move'].search(moves_domain)
-
-        withholding_lines = moves.line_ids.filtered(
-            lambda l: l.account_id in withholding_accounts and l.credit > 0
-        )
-
-        self.withholding_tax = sum(withholding_lines.mapped('credit'))
-
-        _logger.info(f"Retenues à la source: {self.withholding_tax}")
-
     def action_generate_pdf(self):
-        """Générer le PDF de la déclaration"""
+        """Enregistrer la déclaration et demander son PDF en arrière-plan.
+
+        Le rendu est fait par un CRON et stocké en pièce jointe de la
+        déclaration enregistrée; l'utilisateur est notifié quand il est prêt.
+        """
         self.ensure_one()
 
         if self.state != 'computed':
             raise UserError(_("Veuillez d'abord calculer la déclaration."))
 
-        # Générer le rapport PDF selon le type
-        report_name = f'l10n_cm_accounting.report_{self.declaration_type}'
+        declaration = self.env['fiscal.declaration']._store_from_wizard(self)
+        declaration.action_generate_pdf()
+        self.write({'declaration_id': declaration.id, 'state': 'generated'})
+        return self._reopen()
 
-        try:
-            pdf = self.env.ref(report_name)._render_qweb_pdf([self.id])
-            self.pdf_file = base64.b64encode(pdf[0])
-            self.pdf_filename = f"{self.declaration_type}_{self.fiscal_year}_{self.id}.pdf"
-            self.state = 'generated'
+    def action_refresh_pdf(self):
+        """Relire l'état du rendu PDF"""
+        self.ensure_one()
+        return self._reopen()
 
-            return {
-                'type': 'ir.actions.act_url',
-                'url': f'/web/content/?model={self._name}&id={self.id}&field=pdf_file&download=true&filename={self.pdf_filename}',
-                'target': 'self',
-            }
-        except Exception as e:
-            _logger.error(f"Erreur génération PDF: {e}")
-            raise UserError(_("Erreur lors de la génération du PDF: %s") % str(e))
+    def action_download_pdf(self):
+        """Télécharger le PDF rendu"""
+        self.ensure_one()
+        return self.declaration_id.action_download_pdf()
 
     def action_submit_declaration(self):
         """Marquer la déclaration comme soumise"""
@@ -404,8 +191,11 @@ class FiscalDeclarationWizard(models.TransientModel):
 
         if self.state != 'generated':
             raise UserError(_("Veuillez d'abord générer le PDF de la déclaration."))
+        if self.pdf_state != 'done':
+            raise UserError(_("Le PDF de la déclaration n'est pas encore prêt."))
 
         self.state = 'submitted'
+        self.declaration_id.action_submit_declaration()
 
         # Log dans le chatter
         self.company_id.message_post(
@@ -422,3 +212,40 @@ class FiscalDeclarationWizard(models.TransientModel):
                 'type': 'success',
             }
         }
+
+
+class FiscalDeclarationComparisonLine(models.TransientModel):
+    _name = 'fiscal.declaration.comparison.line'
+    """One declaration figure set against the same period of a previous year."""
+    _description = "Ligne de comparatif de déclaration"
+    _order = 'sequence, id'
+
+    wizard_id = fields.Many2one('fiscal.declaration.wizard', string="Assistant", required=True, ondelete='cascade')
+    sequence = fields.Integer(string="Séquence")
+    name = fields.Char(string="Libellé", required=True)
+    period_label = fields.Char(string="Période comparée")
+    amount = fields.Monetary(string="Montant", currency_field='currency_id')
+    comparison_amount = fields.Monetary(string="Montant comparé", currency_field='currency_id')
+    variance_amount = fields.Monetary(string="Écart", currency_field='currency_id')
+    variance_percent = fields.Float(string="Écart (%)")
+    currency_id = fields.Many2one('res.currency', related='wizard_id.currency_id')
+
+
+class FiscalDeclarationWizardVatLine(models.TransientModel):
+    _name = 'fiscal.declaration.wizard.vat.line'
+    _inherit = ['fiscal.declaration.vat.line.mixin']
+    """VAT line shown in the declaration wizard."""
+    _description = "Ligne de TVA de l'assistant de déclaration"
+
+    wizard_id = fields.Many2one('fiscal.declaration.wizard', string="Assistant", required=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', related='wizard_id.currency_id')
+
+
+class FiscalDeclarationWizardWithholdingLine(models.TransientModel):
+    _name = 'fiscal.declaration.wizard.withholding.line'
+    _inherit = ['fiscal.withholding.line.mixin']
+    """Withholding register line shown in the declaration wizard."""
+    _description = "Ligne du registre des retenues de l'assistant de déclaration"
+
+    wizard_id = fields.Many2one('fiscal.declaration.wizard', string="Assistant", required=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', related='wizard_id.currency_id')